@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from hashlib import sha1
+from io import BytesIO
+from json import dumps
+from multiprocessing.dummy import Pool as ThreadPool
+from os import listdir, makedirs, path, replace
+from tarfile import TarFile, TarInfo
+from threading import Lock
+from time import time
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, meta
+
+from tiden import TidenException
+
+TEMPLATE_SUFFIX = '.tmpl.xml'
+
+
+def content_hash(data):
+    return sha1(data).hexdigest()
+
+
+class RenderCache:
+    """
+    Renders Jinja templates with two cache levels: compiled templates (in memory and as Jinja bytecode on disk)
+    and rendered output on disk, keyed by hash of the template source and values of variables the template
+    actually references, so unrelated changes of test configuration don't invalidate rendered configs.
+    """
+
+    default_cache_dir = '~/.tiden/config-cache'
+
+    def __init__(self, template_dirs, cache_dir=None):
+        """
+        :param template_dirs: directory or list of directories with templates
+        :param cache_dir: cache directory
+        """
+        self.cache_dir = path.abspath(path.expanduser(cache_dir or self.default_cache_dir))
+        self.rendered_dir = path.join(self.cache_dir, 'rendered')
+        bytecode_dir = path.join(self.cache_dir, 'bytecode')
+        makedirs(self.rendered_dir, exist_ok=True)
+        makedirs(bytecode_dir, exist_ok=True)
+        self.environment = Environment(
+            loader=FileSystemLoader(template_dirs),
+            bytecode_cache=FileSystemBytecodeCache(bytecode_dir),
+            keep_trailing_newline=True,
+        )
+        # template name -> (source hash, names of referenced variables, up-to-date check)
+        self._templates = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get_template_info(self, template_name):
+        info = self._templates.get(template_name)
+        if info is not None and info[2]():
+            return info
+        source, _, uptodate = self.environment.loader.get_source(self.environment, template_name)
+        referenced = sorted(meta.find_undeclared_variables(self.environment.parse(source)))
+        info = (content_hash(source.encode('utf-8')), referenced, uptodate or (lambda: False))
+        self._templates[template_name] = info
+        return info
+
+    def get_key(self, template_name, variables):
+        source_hash, referenced, _ = self._get_template_info(template_name)
+        values = dumps({name: variables.get(name) for name in referenced}, sort_keys=True, default=str)
+        return content_hash(f'{template_name}\n{source_hash}\n{values}'.encode('utf-8'))
+
+    def render(self, template_name, variables):
+        """
+        :return: rendered template (bytes)
+        """
+        key = self.get_key(template_name, variables)
+        rendered_file = path.join(self.rendered_dir, key)
+        if path.isfile(rendered_file):
+            self.hits += 1
+            with open(rendered_file, 'rb') as file:
+                return file.read()
+        self.misses += 1
+        data = self.environment.get_template(template_name).render(**variables).encode('utf-8')
+        with open(rendered_file + '.tmp', 'wb') as file:
+            file.write(data)
+        replace(rendered_file + '.tmp', rendered_file)
+        return data
+
+
+class DeltaDeployer:
+    """
+    Deploys files to remote directory sending only new or changed ones.
+
+    Remote content hashes are checked with a single command per host, then all changed files of the host are sent
+    as a single tar stream where identical contents are sent once and copied to all their names at the remote side.
+    Hosts are processed in parallel.
+    """
+
+    def __init__(self, ssh_clients, remote_dir):
+        """
+        :param ssh_clients: dict host -> paramiko SSHClient
+        :param remote_dir: remote directory
+        """
+        self.ssh_clients = ssh_clients
+        self.remote_dir = remote_dir
+        self.sent_files = 0
+        self.sent_bytes = 0
+        self.skipped_files = 0
+        self._lock = Lock()
+
+    def deploy(self, files):
+        """
+        :param files: dict host -> dict remote file name -> content (bytes)
+        :return: dict host -> list of sent file names
+        """
+        pool = ThreadPool(max(1, len(files)))
+        result = dict(pool.map(lambda item: (item[0], self._deploy_host(*item)), list(files.items())))
+        pool.close()
+        pool.join()
+        return result
+
+    def _exec(self, host, command, data=None):
+        stdin, stdout, stderr = self.ssh_clients[host].exec_command(command)
+        if data is not None:
+            stdin.write(data)
+        stdin.channel.shutdown_write()
+        output = stdout.read().decode('utf-8', errors='replace')
+        if stdout.channel.recv_exit_status() != 0:
+            raise TidenException(f"Can't deploy files to {host}:{self.remote_dir}: "
+                                 f"{stderr.read().decode('utf-8', errors='replace').strip()}")
+        return output
+
+    def _deploy_host(self, host, host_files):
+        hashes = {name: content_hash(data) for name, data in host_files.items()}
+        names = ' '.join(f"'{name}'" for name in sorted(host_files))
+        output = self._exec(host, f'mkdir -p {self.remote_dir} && cd {self.remote_dir} && '
+                                  f'(sha1sum -- {names} 2>/dev/null; true)')
+        remote_hashes = {}
+        for line in output.splitlines():
+            remote_hash, _, name = line.partition('  ')
+            remote_hashes[name.strip()] = remote_hash.strip()
+
+        changed = sorted(name for name in host_files if remote_hashes.get(name) != hashes[name])
+        with self._lock:
+            self.skipped_files += len(host_files) - len(changed)
+        if not changed:
+            return []
+
+        # unique contents are sent once as .deploy-<hash> and then copied or moved to their names
+        by_hash = {}
+        for name in changed:
+            by_hash.setdefault(hashes[name], []).append(name)
+        data = BytesIO()
+        with TarFile.open(fileobj=data, mode='w') as tar:
+            for file_hash, file_names in by_hash.items():
+                content = host_files[file_names[0]]
+                info = TarInfo(f'.deploy-{file_hash}')
+                info.size = len(content)
+                info.mtime = int(time())
+                tar.addfile(info, BytesIO(content))
+        commands = [f'cd {self.remote_dir}', 'tar -xf -']
+        for file_hash, file_names in by_hash.items():
+            for file_name in file_names[:-1]:
+                commands.append(f"cp -f .deploy-{file_hash} '{file_name}'")
+            commands.append(f"mv -f .deploy-{file_hash} '{file_names[-1]}'")
+        self._exec(host, ' && '.join(commands), data.getvalue())
+        with self._lock:
+            self.sent_files += len(changed)
+            self.sent_bytes += sum(len(host_files[file_names[0]]) for file_names in by_hash.values())
+        return changed
+
+
+class CachedConfigBuilder:
+    """
+    Config sets of Jinja templated Ignite configs with render cache and delta deploy.
+
+    Like Ignite.config_builder, config set has common template variables and exclusive variables of some nodes.
+    Configs are rendered per node, nodes with equal rendered content share the same file name, so changing
+    variables of one node or switching config set costs only rendering of changed templates and sending
+    of changed files. Static files next to templates (e.g. caches.xml) are deployed along with configs.
+    """
+
+    def __init__(self, ssh_clients, template_dir, remote_dir, base_variables=None, cache_dir=None):
+        """
+        :param ssh_clients: dict host -> paramiko SSHClient
+        :param template_dir: directory with *.tmpl.xml templates and static files
+        :param remote_dir: remote config directory
+        :param base_variables: variables of all config sets, e.g. {'environment': config['environment']}
+        :param cache_dir: render cache directory
+        """
+        self.template_dir = template_dir
+        self.render_cache = RenderCache(template_dir, cache_dir)
+        self.deployer = DeltaDeployer(ssh_clients, remote_dir)
+        self.base_variables = dict(base_variables or {})
+        self.config_types = {}
+        # config set name -> {'common': vars, 'nodes': {node_idx: vars}}
+        self.config_sets = {}
+        self.static_files = {}
+        for file_name in sorted(listdir(template_dir)):
+            if not file_name.endswith(TEMPLATE_SUFFIX) and path.isfile(path.join(template_dir, file_name)):
+                with open(path.join(template_dir, file_name), 'rb') as file:
+                    self.static_files[file_name] = file.read()
+
+    def register_config(self, config_type, template_name):
+        self.config_types[config_type] = template_name
+
+    def add_config_set(self, config_set_name, **variables):
+        self.config_sets[config_set_name] = {'common': variables, 'nodes': {}}
+
+    def add_template_variables(self, config_set_name, node_id=None, **variables):
+        config_set = self.config_sets[config_set_name]
+        if node_id is None:
+            config_set['common'].update(variables)
+        else:
+            config_set['nodes'].setdefault(node_id, {}).update(variables)
+
+    def build_and_deploy(self, config_set_name, config_type, nodes):
+        """
+        Render config for every node and deploy new and changed files to node hosts
+        :param config_set_name: config set name
+        :param config_type: registered config type, e.g. 'server'
+        :param nodes: dict node_idx -> node (with 'host')
+        :return: dict node_idx -> config file name in remote directory
+        """
+        config_set = self.config_sets[config_set_name]
+        template_name = self.config_types[config_type]
+        node_configs = {}
+        host_files = {}
+        for node_idx, node in nodes.items():
+            variables = dict(self.base_variables)
+            variables.update(config_set['common'])
+            variables.update(config_set['nodes'].get(node_idx, {}))
+            data = self.render_cache.render(template_name, variables)
+            file_name = f'{config_type}_{config_set_name}_{content_hash(data)[:12]}.xml'
+            node_configs[node_idx] = file_name
+            files = host_files.setdefault(node['host'], dict(self.static_files))
+            files[file_name] = data
+        self.deployer.deploy(host_files)
+        return node_configs
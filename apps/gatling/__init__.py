@@ -15,4 +15,5 @@
 # limitations under the License.
 
 from .gatling import Gatling
+from .live import SLO
 
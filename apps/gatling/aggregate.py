@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# This module is also shipped to Gatling nodes together with histogram.py and run there as a script
+# folding simulation.log into aggregates while the simulation runs, so it depends on standard library
+# and histogram module only.
+
+from argparse import ArgumentParser
+from os import listdir, path
+from signal import signal, SIGTERM, SIGINT
+from struct import Struct, error as StructError
+from time import time, sleep
+
+try:
+    from .histogram import LatencyHistogram
+except ImportError:
+    from histogram import LatencyHistogram
+
+# Append-only file of per-second simulation aggregates.
+#
+# File starts with MAGIC followed by records, each record starts with one byte tag:
+#   STRING: uint32 id, uint16 length, utf-8 bytes - entry of string table, precedes the first use of the id
+#   RUN:    int64 start, uint32 simulation string id
+#   USERS:  uint32 started, uint32 finished - number of users started and finished since previous USERS record
+#   ERROR:  uint32 message string id, uint32 count - number of errors since previous ERROR record of the message
+#   SECOND: int64 second, uint32 name string id, int64 first start, int64 last end, uint32 ok length,
+#           uint32 ko length, followed by ok and ko LatencyHistogram bytes - requests of the name
+#           completed within the second (by request end timestamp)
+# All numbers are little endian. The same second and name may appear more than once when requests
+# are written to simulation.log late, such records are merged by reader.
+
+MAGIC = b'GTLA\x01'
+
+TAG_STRING = 0
+TAG_RUN = 1
+TAG_USERS = 2
+TAG_ERROR = 3
+TAG_SECOND = 4
+
+# name of aggregates file written next to simulation.log at Gatling node
+AGGREGATE_FILE_NAME = 'simulation.agg'
+
+_TAG = Struct('<B')
+_STRING = Struct('<IH')
+_RUN = Struct('<qI')
+_USERS = Struct('<II')
+_ERROR = Struct('<II')
+_SECOND = Struct('<qIqqII')
+
+_READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def request_name_index(fields):
+    """
+    :param fields: REQUEST record fields
+    :return: index of request name field, start, end, status and message fields follow it,
+             None for malformed record
+    """
+    # Gatling 3.3:  REQUEST userId groups name start end status message
+    # Gatling 3.4+: REQUEST groups name start end status message
+    if len(fields) > 6 and fields[6] in ('OK', 'KO'):
+        return 3
+    if len(fields) > 5 and fields[5] in ('OK', 'KO'):
+        return 2
+    return None
+
+
+class SecondAggregate:
+    """
+    Requests of a single name completed within one second
+    """
+
+    def __init__(self):
+        self.ok = LatencyHistogram()
+        self.ko = LatencyHistogram()
+        self.first_start = None
+        self.last_end = None
+
+    def record(self, start, end, ok):
+        (self.ok if ok else self.ko).record(end - start)
+        if self.first_start is None or start < self.first_start:
+            self.first_start = start
+        if self.last_end is None or end > self.last_end:
+            self.last_end = end
+
+
+class AggregateWriter:
+    """
+    Writes simulation aggregates file, every record is flushed as a whole so the file can be read at any time
+    """
+
+    def __init__(self, file_path):
+        self.file = open(file_path, 'wb')
+        self.file.write(MAGIC)
+        self.strings = {}
+
+    def _string_id(self, value, data):
+        string_id = self.strings.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings[value] = string_id
+            encoded = value.encode('utf-8')[:0xFFFF]
+            data += _TAG.pack(TAG_STRING) + _STRING.pack(string_id, len(encoded)) + encoded
+        return string_id
+
+    def write_run(self, start, simulation):
+        data = bytearray()
+        simulation_id = self._string_id(simulation, data)
+        data += _TAG.pack(TAG_RUN) + _RUN.pack(start, simulation_id)
+        self.file.write(data)
+
+    def write_users(self, started, finished):
+        self.file.write(_TAG.pack(TAG_USERS) + _USERS.pack(started, finished))
+
+    def write_error(self, message, count):
+        data = bytearray()
+        message_id = self._string_id(message, data)
+        data += _TAG.pack(TAG_ERROR) + _ERROR.pack(message_id, count)
+        self.file.write(data)
+
+    def write_second(self, second, name, aggregate):
+        data = bytearray()
+        name_id = self._string_id(name, data)
+        ok = aggregate.ok.to_bytes()
+        ko = aggregate.ko.to_bytes()
+        data += _TAG.pack(TAG_SECOND) + _SECOND.pack(
+            second, name_id, aggregate.first_start, aggregate.last_end, len(ok), len(ko)
+        )
+        data += ok + ko
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def is_aggregate(file_path):
+    with open(file_path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def read_aggregate(file_path):
+    """
+    Iterate over records of simulation aggregates file, the file is read record by record,
+    incomplete trailing record is ignored
+    :return: generator of tuples:
+        (TAG_RUN, start, simulation)
+        (TAG_USERS, started, finished)
+        (TAG_ERROR, message, count)
+        (TAG_SECOND, second, name, first_start, last_end, ok LatencyHistogram, ko LatencyHistogram)
+    """
+    strings = {}
+    with open(file_path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{file_path} is not a simulation aggregates file')
+        try:
+            while True:
+                tag_data = file.read(_TAG.size)
+                if not tag_data:
+                    break
+                tag = tag_data[0]
+                if tag == TAG_SECOND:
+                    header = _read_struct(file, _SECOND)
+                    if header is None:
+                        break
+                    second, name_id, first_start, last_end, ok_length, ko_length = header
+                    data = file.read(ok_length + ko_length)
+                    if len(data) < ok_length + ko_length:
+                        break
+                    ok, _ = LatencyHistogram.from_bytes(data, 0)
+                    ko, _ = LatencyHistogram.from_bytes(data, ok_length)
+                    yield TAG_SECOND, second, strings[name_id], first_start, last_end, ok, ko
+                elif tag == TAG_STRING:
+                    header = _read_struct(file, _STRING)
+                    if header is None:
+                        break
+                    string_id, length = header
+                    data = file.read(length)
+                    if len(data) < length:
+                        break
+                    strings[string_id] = data.decode('utf-8', errors='replace')
+                elif tag == TAG_USERS:
+                    record = _read_struct(file, _USERS)
+                    if record is None:
+                        break
+                    yield TAG_USERS, record[0], record[1]
+                elif tag == TAG_ERROR:
+                    record = _read_struct(file, _ERROR)
+                    if record is None:
+                        break
+                    yield TAG_ERROR, strings[record[0]], record[1]
+                elif tag == TAG_RUN:
+                    record = _read_struct(file, _RUN)
+                    if record is None:
+                        break
+                    yield TAG_RUN, record[0], strings[record[1]]
+                else:
+                    raise ValueError(f'Unknown record tag {tag} in {file_path}')
+        except (StructError, IndexError):
+            # file was fetched while the record was being written
+            pass
+
+
+def _read_struct(file, struct):
+    """
+    :return: unpacked struct or None when the file ends before it
+    """
+    data = file.read(struct.size)
+    if len(data) < struct.size:
+        return None
+    return struct.unpack(data)
+
+
+class SimulationAggregator:
+    """
+    Folds Gatling simulation.log records into per-second, per-request latency histograms and counters.
+
+    Data is consumed in chunks of bytes like SimulationLogParser does. Seconds older than lag_seconds
+    are considered complete and written out by flush, so memory usage is bounded by the number of
+    request names times lag, not by the run length.
+    """
+
+    def __init__(self, writer, lag_seconds=5):
+        """
+        :param writer: AggregateWriter
+        :param lag_seconds: how long records of a second may arrive late, Gatling writes simulation.log
+                            with a buffer
+        """
+        self.writer = writer
+        self.lag_seconds = lag_seconds
+        # (second, name) -> SecondAggregate
+        self.seconds = {}
+        self.users_started = 0
+        self.users_finished = 0
+        self.errors = {}
+        self._tail = b''
+
+    def feed(self, data):
+        if not data:
+            return
+        lines = (self._tail + data).split(b'\n')
+        self._tail = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+
+    def _parse_line(self, line):
+        line = line.rstrip(b'\r')
+        if not line:
+            return
+        fields = line.decode('utf-8', errors='replace').split('\t')
+        record_type = fields[0]
+        if record_type == 'REQUEST':
+            name_idx = request_name_index(fields)
+            if name_idx is None:
+                return
+            start = _to_int(fields[name_idx + 1])
+            end = _to_int(fields[name_idx + 2])
+            if start is None or end is None:
+                return
+            ok = fields[name_idx + 3] == 'OK'
+            key = (end // 1000, fields[name_idx])
+            aggregate = self.seconds.get(key)
+            if aggregate is None:
+                aggregate = SecondAggregate()
+                self.seconds[key] = aggregate
+            aggregate.record(start, end, ok)
+            if not ok:
+                message = (fields[name_idx + 4] if len(fields) > name_idx + 4 else '') or 'unknown error'
+                self.errors[message] = self.errors.get(message, 0) + 1
+        elif record_type == 'USER':
+            if 'START' in fields:
+                self.users_started += 1
+            elif 'END' in fields:
+                self.users_finished += 1
+        elif record_type == 'RUN':
+            if len(fields) > 3:
+                run_start = _to_int(fields[3])
+                if run_start is not None:
+                    self.writer.write_run(run_start, fields[1])
+
+    def flush(self, final=False):
+        """
+        Write out complete seconds and counters collected since previous flush
+        :param final: write out all seconds, including the incomplete line left after the last chunk
+        """
+        if final and self._tail:
+            tail, self._tail = self._tail, b''
+            self._parse_line(tail)
+        last_complete = None if final else int(time()) - self.lag_seconds
+        for key in sorted(self.seconds):
+            if last_complete is not None and key[0] > last_complete:
+                continue
+            self.writer.write_second(key[0], key[1], self.seconds.pop(key))
+        if self.users_started or self.users_finished:
+            self.writer.write_users(self.users_started, self.users_finished)
+            self.users_started = self.users_finished = 0
+        for message, count in self.errors.items():
+            self.writer.write_error(message, count)
+        self.errors.clear()
+        self.writer.flush()
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _find_new_log(results_dir, existing_dirs):
+    if not path.isdir(results_dir):
+        return None
+    for dir_name in sorted(listdir(results_dir)):
+        log_path = path.join(results_dir, dir_name, 'simulation.log')
+        if dir_name not in existing_dirs and path.isfile(log_path):
+            return log_path
+    return None
+
+
+def main(argv=None):
+    """
+    Wait for simulation.log of a new simulation run to appear in results folder and fold it into
+    simulation.agg next to it until terminated, the rest of the log is consumed before exit
+    """
+    parser = ArgumentParser(description='Aggregate Gatling simulation.log into per-second latency histograms')
+    parser.add_argument('--results-dir', required=True)
+    parser.add_argument('--interval', type=float, default=1.0)
+    parser.add_argument('--lag', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    stopping = []
+    signal(SIGTERM, lambda *_: stopping.append(True))
+    signal(SIGINT, lambda *_: stopping.append(True))
+
+    existing_dirs = set(listdir(args.results_dir)) if path.isdir(args.results_dir) else set()
+    log_path = None
+    while log_path is None:
+        log_path = _find_new_log(args.results_dir, existing_dirs)
+        if log_path is None:
+            if stopping:
+                return 0
+            sleep(0.2)
+
+    writer = AggregateWriter(path.join(path.dirname(log_path), AGGREGATE_FILE_NAME))
+    aggregator = SimulationAggregator(writer, lag_seconds=args.lag)
+    last_flush = time()
+    with open(log_path, 'rb') as log:
+        while True:
+            data = log.read(_READ_CHUNK_SIZE)
+            if data:
+                aggregator.feed(data)
+            elif stopping:
+                break
+            else:
+                sleep(min(args.interval, 0.2))
+            if time() - last_flush >= args.interval:
+                aggregator.flush()
+                last_flush = time()
+    aggregator.flush(final=True)
+    writer.close()
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
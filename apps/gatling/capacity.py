@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class CapacityPoint:
+    """
+    Measured result of a single load step
+    """
+
+    def __init__(self, load, stats):
+        self.load = load
+        self.simulation = stats.simulation
+        total_rps, ok_rps, _ = stats.total.throughput(stats.duration_ms)
+        self.throughput = ok_rps
+        self.p99 = stats.total.all.percentile(99)
+        self.error_rate = stats.total.error_rate
+        self.saturated = None
+        self.reason = None
+
+    def __str__(self):
+        state = f'saturated: {self.reason}' if self.saturated else 'ok'
+        return (f'load {self.load}: {self.throughput:.1f} req/s, p99 {self.p99} ms, '
+                f'errors {100.0 * self.error_rate:.2f}% - {state}')
+
+
+class CapacityResult:
+    """
+    Capacity search outcome: all measured points ordered by load and the best sustainable one
+    """
+
+    def __init__(self, points):
+        self.curve = sorted(points, key=lambda point: point.load)
+        sustainable = [point for point in self.curve if not point.saturated]
+        self.best = max(sustainable, key=lambda point: point.throughput) if sustainable else None
+        saturated = [point for point in self.curve if point.saturated]
+        self.knee = saturated[0] if saturated else None
+
+    @property
+    def max_throughput(self):
+        return self.best.throughput if self.best is not None else 0.0
+
+    @property
+    def max_load(self):
+        return self.best.load if self.best is not None else None
+
+    def to_lines(self):
+        lines = [str(point) for point in self.curve]
+        lines.append(f'max sustainable throughput {self.max_throughput:.1f} req/s at load {self.max_load}')
+        return lines
+
+
+class CapacitySearch:
+    """
+    Searches for the maximal sustainable load by running load steps.
+
+    A step is saturated when p99 latency or error rate crosses its threshold, or when throughput
+    stops growing with load: throughput gain is less than plateau_ratio of the load gain
+    relative to the best sustainable step so far.
+    """
+
+    def __init__(self, run_step, max_p99=None, max_error_rate=0.01, plateau_ratio=0.5):
+        """
+        :param run_step: callable(load) -> SimulationStats, runs single load step
+        :param max_p99: p99 latency threshold, ms
+        :param max_error_rate: error rate threshold, 0..1
+        :param plateau_ratio: min ratio of relative throughput gain to relative load gain
+        """
+        self.run_step = run_step
+        self.max_p99 = max_p99
+        self.max_error_rate = max_error_rate
+        self.plateau_ratio = plateau_ratio
+        self.points = []
+
+    def _measure(self, load, baseline):
+        point = CapacityPoint(load, self.run_step(load))
+        point.saturated, point.reason = self._check_saturated(point, baseline)
+        self.points.append(point)
+        return point
+
+    def _check_saturated(self, point, baseline):
+        if self.max_p99 is not None and point.p99 is not None and point.p99 > self.max_p99:
+            return True, f'p99 {point.p99} ms > {self.max_p99} ms'
+        if self.max_error_rate is not None and point.error_rate > self.max_error_rate:
+            return True, f'error rate {point.error_rate:.4f} > {self.max_error_rate}'
+        if baseline is not None and baseline.throughput > 0 and point.load > baseline.load:
+            load_gain = point.load / baseline.load - 1.0
+            throughput_gain = point.throughput / baseline.throughput - 1.0
+            if throughput_gain < self.plateau_ratio * load_gain:
+                return True, f'throughput plateau ({100.0 * throughput_gain:.1f}% for ' \
+                             f'{100.0 * load_gain:.1f}% more load)'
+        return False, None
+
+    def step_up(self, start, factor=2.0, increment=None, max_load=None, max_steps=10):
+        """
+        Increase load step by step until saturation
+        :param start: initial load
+        :param factor: load multiplier between steps (when increment is not set)
+        :param increment: load increment between steps
+        :param max_load: max load to try
+        :param max_steps: max number of steps
+        :return: CapacityResult
+        """
+        self._step_up(start, factor, increment, max_load, max_steps)
+        return CapacityResult(self.points)
+
+    def _step_up(self, start, factor, increment, max_load, max_steps):
+        baseline = None
+        load = start
+        for _ in range(max_steps):
+            point = self._measure(load, baseline)
+            if point.saturated:
+                return baseline, point
+            baseline = point
+            next_load = load + increment if increment else _next_load(load, factor)
+            if max_load is not None and next_load > max_load:
+                break
+            load = next_load
+        return baseline, None
+
+    def binary(self, start, factor=2.0, max_load=None, max_steps=12, tolerance=0.1):
+        """
+        Bracket saturation by multiplying load, then bisect between the last sustainable and
+        the first saturated load until they are within tolerance
+        :return: CapacityResult
+        """
+        good, bad = self._step_up(start, factor, None, max_load, max_steps)
+        steps_left = max_steps - len(self.points)
+        while good is not None and bad is not None and steps_left > 0:
+            if (bad.load - good.load) <= tolerance * good.load:
+                break
+            load = _middle(good.load, bad.load)
+            if load in (good.load, bad.load):
+                break
+            point = self._measure(load, good)
+            if point.saturated:
+                bad = point
+            else:
+                good = point
+            steps_left -= 1
+        return CapacityResult(self.points)
+
+
+def _next_load(load, factor):
+    next_load = load * factor
+    if isinstance(load, int):
+        return max(load + 1, int(round(next_load)))
+    return next_load
+
+
+def _middle(low, high):
+    if isinstance(low, int) and isinstance(high, int):
+        return (low + high) // 2
+    return (low + high) / 2.0
@@ -16,12 +16,54 @@
 
 
 from copy import deepcopy
+from io import BytesIO
 from multiprocessing.dummy import Pool as ThreadPool
-from os import makedirs, path, cpu_count
+from glob import glob
+from os import makedirs, path, cpu_count, replace, unlink
+from shutil import copyfileobj, rmtree
+from tarfile import TarFile, ReadError
 from itertools import chain
+from json import dump
+from time import time
 
+from tiden import TidenException
 from tiden.apps.javaapp import JavaApp
-from tiden.util import local_run
+from tiden.util import local_run, log_print
+
+from apps.logfollower import LogFollower
+
+from .capacity import CapacitySearch
+from .simulation_builder import SimulationSpec, SimulationCompiler, jar_to_tar
+from .injection import injection_arg, injection_duration, ramp_then_hold
+from .host_sizing import HOST_PROBE_COMMAND, SIZED_JVM_OPTIONS, NODE_MARKER_PROPERTY, HostResources, \
+    GeneratorMonitor, plan_node_sizing, pin_node_command
+from .live import LiveMonitor
+from .log_merge import merge_simulation_logs
+from .simulation_log import parse_simulation_logs, find_simulation_logs, MERGED_RECORD_STREAM_NAME, \
+    SimulationStats
+from .aggregate import AGGREGATE_FILE_NAME, is_aggregate
+
+
+def _aggregator_tar():
+    """
+    :return: tar archive bytes of simulation aggregator script and its histogram module
+    """
+    data = BytesIO()
+    with TarFile.open(fileobj=data, mode='w') as tar:
+        for module in ('aggregate.py', 'histogram.py'):
+            tar.add(path.join(path.dirname(__file__), module), arcname=module)
+    return data.getvalue()
+
+
+def _partition(value, parts, part_n):
+    """
+    :return: part_n-th of parts shares of value, integer values are split exactly with remainder
+             going to the first parts
+    """
+    if isinstance(value, int):
+        share, remainder = divmod(value, parts)
+        return share + (1 if part_n < remainder else 0)
+    return float(value) / parts
 
 
 class Gatling(JavaApp):
@@ -29,6 +71,15 @@ class Gatling(JavaApp):
     scenario_args = None
     scenario_jvm_options = None
 
+    # scenario arguments which describe total load and are divided between nodes in distributed mode
+    partitioned_args = ['load_factor']
+
+    # seconds between start command and common injection start, must be enough for Gatling JVM to start
+    default_barrier_delay = 20
+
+    # python interpreter running simulation aggregator at Gatling hosts
+    aggregator_python = 'python3'
+
     class_name = 'io.gatling.app.Gatling'
 
     default_jvm_options = [
@@ -51,28 +102,329 @@ class Gatling(JavaApp):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.live_monitor = None
+        # follows node logs during the run, see follow_node_logs
+        self.log_follower = None
+        self.started_waiter = None
+        self.completed_waiter = None
+        self.distributed = False
+        self.start_at = None
+        self.stagger = 0
+        self.node_sizing = None
+        self.generator_monitor = None
+        # node_idx -> remote Gatling binaries folder with generated simulation classes
+        self.binaries_dirs = None
+        # simulation results are folded into aggregates at nodes, see start_aggregators
+        self.aggregate = False
+        self.aggregators_running = False
+        # node_idx -> measured clock offset of the node host, milliseconds, see measure_clock_offsets
+        self.clock_offsets = {}
 
-    def start(self, scenario, scenario_args, jvm_options=None):
+    def start(self, scenario, scenario_args, jvm_options=None, live=False, slo=None, on_metrics=None,
+              distributed=False, barrier_delay=None, stagger=0, host_sizing=False, aggregate=False):
+        """
+        Start simulation at all Gatling nodes
+        :param scenario: simulation class name or SimulationSpec of generated simulation
+        :param scenario_args: dict of simulation system properties, 'injection' argument is an open model
+                              InjectionProfile or list of phases (see injection.py), rates are total
+                              for all nodes, 'duration' defaults to the profile duration
+        :param jvm_options: additional JVM options
+        :param live: follow simulation logs while the simulation runs, see live_monitor
+        :param slo: SLO thresholds, simulation is stopped as soon as they are violated (implies live)
+        :param on_metrics: callback(LiveSnapshot) called every second (implies live)
+        :param distributed: scenario_args describe total load of all nodes, partitioned_args are divided
+                            between nodes and all nodes start injection at the same moment
+        :param barrier_delay: seconds from now to the common injection start (distributed mode only),
+                              hosts clocks are expected to be in sync
+        :param stagger: delay of each next node injection start, seconds (distributed mode only)
+        :param host_sizing: size heap, GC and Netty threads of each node from its host cores and memory,
+                            pin nodes sharing a host to disjoint CPU sets and watch them for saturation,
+                            see generator_saturation
+        :param aggregate: fold simulation.log of each node into per-second latency histograms at the node while
+                          the simulation runs, only these aggregates are fetched by default,
+                          see fetch_simulation_results
+        """
+        self.binaries_dirs = None
+        if isinstance(scenario, SimulationSpec):
+            scenario = self.deploy_simulation(scenario)
         self.scenario = scenario
         self.scenario_args = deepcopy(scenario_args)
+        if self.scenario_args.get('injection') is not None and 'duration' not in self.scenario_args:
+            self.scenario_args['duration'] = injection_duration(self.scenario_args['injection'])
         self.scenario_jvm_options = jvm_options
+        self.distributed = distributed
+        self.start_at = None
+        self.stagger = stagger
+        if distributed:
+            if barrier_delay is None:
+                barrier_delay = self.default_barrier_delay
+            self.start_at = int((time() + barrier_delay) * 1000)
+        self.node_sizing = self.size_nodes() if host_sizing else None
+        self.generator_monitor = None
+        self.clock_offsets = self.measure_clock_offsets()
+        self.aggregate = aggregate
+        if aggregate:
+            self.start_aggregators()
         self.start_nodes()
+        self.follow_node_logs()
+        if self.node_sizing:
+            self.pin_nodes()
         self.wait_scenario_started()
+        if self.node_sizing:
+            self.start_generator_monitor()
+        if live or slo is not None or on_metrics is not None:
+            self.start_live_monitor(slo=slo, on_metrics=on_metrics)
+
+    def deploy_simulation(self, spec):
+        """
+        Render and compile generated simulation (unless cached) and ship its classes to every node
+        into Gatling binaries folder next to the dependency jar
+        :param spec: SimulationSpec
+        :return: simulation class name
+        """
+        compiler = SimulationCompiler(
+            self.config['artifacts'][self.app_type]['path'],
+            cache_dir=self.config.get('gatling_simulations_cache_dir'),
+        )
+        jar_path, key = compiler.compile(spec)
+        if compiler.compile_time is not None:
+            log_print(f'Simulation {spec.full_name} compiled in {compiler.compile_time:.1f} sec')
+        classes = jar_to_tar(jar_path)
+
+        def _ship(node_idx):
+            node = self.nodes[node_idx]
+            binaries_dir = f'{node["run_dir"]}/simulations/{key[:16]}'
+            # classes of the same source are never changed, so existing folder is reused,
+            # shipped classes are still drained, otherwise writing them fails once they outgrow the channel window
+            command = (
+                f'[ -d {binaries_dir} ] && {{ cat > /dev/null; exit 0; }}; '
+                f'mkdir -p {binaries_dir}.tmp && tar -xf - -C {binaries_dir}.tmp && mv {binaries_dir}.tmp {binaries_dir}'
+            )
+            stdin, stdout, stderr = self.ssh.clients[node['host']].exec_command(command)
+            stdin.write(classes)
+            stdin.channel.shutdown_write()
+            rc = stdout.channel.recv_exit_status()
+            if rc != 0:
+                raise TidenException(f"Can't ship simulation {spec.full_name} to node {node_idx} ({node['host']}): "
+                                     f"{stderr.read().decode('utf-8', errors='replace').strip()}")
+            return node_idx, binaries_dir
+
+        pool = ThreadPool(max(1, len(self.nodes)))
+        self.binaries_dirs = dict(pool.map(_ship, list(self.nodes.keys())))
+        pool.close()
+        pool.join()
+        return spec.full_name
+
+    def measure_clock_offsets(self, samples=3):
+        """
+        Measure clock offset of every Gatling host against local clock with `date` round trips,
+        the sample with the shortest round trip is taken
+        :return: dict node_idx -> offset, milliseconds (host clock minus local clock)
+        """
+        hosts = sorted(set(node['host'] for node in self.nodes.values()))
+
+        def _measure(host):
+            best_rtt, best_offset = None, 0
+            for _ in range(samples):
+                sent = time()
+                stdin, stdout, stderr = self.ssh.clients[host].exec_command('date +%s%3N')
+                stdin.close()
+                output = stdout.read().decode('utf-8', errors='replace').strip()
+                received = time()
+                if not output.isdigit():
+                    continue
+                rtt = received - sent
+                if best_rtt is None or rtt < best_rtt:
+                    best_rtt = rtt
+                    best_offset = int(output) - int((sent + received) * 500)
+            return host, best_offset
+
+        if not hosts:
+            return {}
+        pool = ThreadPool(len(hosts))
+        host_offsets = dict(pool.map(_measure, hosts))
+        pool.close()
+        pool.join()
+        return {node_idx: host_offsets[node['host']] for node_idx, node in self.nodes.items()}
+
+    def size_nodes(self):
+        """
+        Probe cores and memory of Gatling hosts and split them between nodes of each host
+        :return: dict node_idx -> NodeSizing
+        """
+        output = self.ssh.exec_at_nodes(self.nodes, lambda node_idx, node: HOST_PROBE_COMMAND)
+        resources = {}
+        for node_idx, node_output in output.items():
+            host = self.nodes[node_idx]['host']
+            if host not in resources:
+                host_resources = HostResources.parse(host, node_output)
+                if host_resources is None:
+                    raise TidenException(f"Can't get cores and memory of Gatling host {host}: {node_output}")
+                resources[host] = host_resources
+                log_print(f'Gatling host {host_resources}')
+        node_sizing = plan_node_sizing(self.nodes, resources)
+        for node_idx in sorted(node_sizing):
+            log_print(f'Gatling {node_sizing[node_idx]}')
+        return node_sizing
+
+    def pin_nodes(self):
+        """
+        Pin all threads of started nodes to their CPU sets
+        """
+        def _pin_command(node_idx, node):
+            sizing = self.node_sizing.get(node_idx)
+            if sizing is None or not sizing.cpu_list:
+                return 'true'
+            return pin_node_command(node_idx, sizing.cpu_list)
+
+        self.ssh.exec_at_nodes(self.nodes, _pin_command)
+
+    def start_generator_monitor(self, interval=1):
+        """
+        Sample CPU usage and GC time of node JVMs until they exit
+        :return: GeneratorMonitor
+        """
+        self.generator_monitor = GeneratorMonitor(self.node_sizing)
+        for node_idx, node in self.nodes.items():
+            if node_idx in self.node_sizing:
+                self.generator_monitor.follow(self.ssh.clients[node['host']], node_idx, interval)
+        return self.generator_monitor
+
+    @property
+    def generator_saturation(self):
+        """
+        :return: dict node_idx -> reason for Gatling nodes which were saturated during the run
+                 (results of such run are not valid), None when generators were not monitored
+        """
+        if self.generator_monitor is None:
+            return None
+        return self.generator_monitor.saturation()
+
+    def start_aggregators(self, interval=1):
+        """
+        Ship simulation aggregator to every node and start it in background before the nodes start:
+        it waits for simulation.log of the new run and folds it into simulation.agg next to it
+        until stop_aggregators, see aggregate module
+        :param interval: seconds between aggregates flushes
+        """
+        payload = _aggregator_tar()
+
+        def _start(node_idx):
+            node = self.nodes[node_idx]
+            aggregator_dir = f'{node["run_dir"]}/aggregator'
+            command = (
+                f'mkdir -p {aggregator_dir} && tar -xf - -C {aggregator_dir} && cd {aggregator_dir} || exit 1; '
+                f'nohup {self.aggregator_python} aggregate.py --results-dir {node["run_dir"]}/results '
+                f'--interval {interval} > aggregator.log 2>&1 < /dev/null & echo $! > aggregator.pid'
+            )
+            stdin, stdout, stderr = self.ssh.clients[node['host']].exec_command(command)
+            stdin.write(payload)
+            stdin.channel.shutdown_write()
+            rc = stdout.channel.recv_exit_status()
+            if rc != 0:
+                raise TidenException(f"Can't start simulation aggregator at node {node_idx} ({node['host']}): "
+                                     f"{stderr.read().decode('utf-8', errors='replace').strip()}")
+
+        pool = ThreadPool(max(1, len(self.nodes)))
+        pool.map(_start, list(self.nodes.keys()))
+        pool.close()
+        pool.join()
+        self.aggregators_running = True
+
+    def stop_aggregators(self, timeout=60):
+        """
+        Let aggregators consume the rest of simulation logs, write out all aggregates and exit
+        :param timeout: seconds to wait for each aggregator to exit before it is killed
+        """
+        if not self.aggregators_running:
+            return
+        self.ssh.exec_at_nodes(
+            self.nodes, lambda node_idx, node:
+            f'pid_file={node["run_dir"]}/aggregator/aggregator.pid; '
+            f'pid=$(cat $pid_file 2>/dev/null) || exit 0; rm -f $pid_file; '
+            f'kill -TERM $pid 2>/dev/null || exit 0; '
+            f'for i in $(seq {timeout * 10}); do kill -0 $pid 2>/dev/null || exit 0; sleep 0.1; done; '
+            f'kill -9 $pid'
+        )
+        self.aggregators_running = False
+
+    def start_live_monitor(self, slo=None, on_metrics=None, window=5):
+        """
+        Follow simulation.log of every Gatling node and collect rolling live metrics
+        :param slo: SLO thresholds, stop(wait=False) is called as soon as they are violated
+        :param on_metrics: callback(LiveSnapshot) called every second
+        :param window: rolling window, seconds
+        :return: LiveMonitor, iterate over it to get live snapshots
+        """
+        def _on_breach(violation):
+            log_print(f'Simulation {self.scenario} SLO violated: {violation}, stopping', color='red')
+            self.stop(wait=False)
+
+        self.live_monitor = LiveMonitor(window=window, slo=slo, on_breach=_on_breach)
+        if on_metrics is not None:
+            self.live_monitor.add_callback(on_metrics)
+        self.live_monitor.set_completion(self.completed_waiter)
+        for node_idx, node in self.nodes.items():
+            ssh_client = self.ssh.clients[node['host']]
+            results_dir = f'{node["run_dir"]}/results'
+            self.live_monitor.follow_simulation_log(
+                ssh_client,
+                f'while ! ls {results_dir}/*/simulation.log >/dev/null 2>&1; do sleep 0.2; done; '
+                f'tail -F -n +1 $(ls -1t {results_dir}/*/simulation.log | head -1)',
+                f'simulation-{node_idx}'
+            )
+        return self.live_monitor.start()
+
+    @property
+    def slo_violation(self):
+        """
+        :return: description of violated SLO threshold or None
+        """
+        if self.live_monitor is None:
+            return None
+        return self.live_monitor.violation
+
+    def follow_node_logs(self):
+        """
+        Follow logs of all nodes with a single channel per host, simulation start and completion messages
+        are detected as soon as they are written
+        """
+        if self.log_follower is not None:
+            self.log_follower.stop()
+        self.log_follower = LogFollower(self.ssh.clients)
+        log_files = self.log_follower.follow_nodes(self.nodes)
+        self.started_waiter = self.log_follower.expect(f'Simulation {self.scenario} started...', log_files)
+        self.completed_waiter = self.log_follower.expect(f'Simulation {self.scenario} completed', log_files)
 
     def wait_scenario_started(self):
-        started_log_message = f'Simulation {self.scenario} started...'
-        self.wait_message(started_log_message, timeout=self.start_timeout)
+        if not self.started_waiter.wait(self.start_timeout):
+            raise TidenException(f'Simulation {self.scenario} not started in {self.start_timeout} seconds '
+                                 f'at {", ".join(self.started_waiter.pending_files)}')
 
     def wait_scenario_completed(self, timeout):
-        completed_log_message = f'Simulation {self.scenario} completed'
-        self.wait_message(completed_log_message, timeout=timeout)
+        if self.live_monitor is not None:
+            if not self.live_monitor.wait_completed(timeout):
+                raise TidenException(f'Simulation {self.scenario} not completed in {timeout} seconds')
+            return
+        if not self.completed_waiter.wait(timeout):
+            raise TidenException(f'Simulation {self.scenario} not completed in {timeout} seconds '
+                                 f'at {", ".join(self.completed_waiter.pending_files)}')
 
     def stop(self, wait=True, timeout=120):
         if wait:
             self.wait_scenario_completed(timeout)
+        if self.live_monitor is not None:
+            self.live_monitor.stop()
+        if self.generator_monitor is not None:
+            self.generator_monitor.stop()
+        if self.log_follower is not None:
+            self.log_follower.stop()
         self.kill_nodes()
+        self.stop_aggregators()
 
     def get_node_args(self, node_idx):
+        if self.binaries_dirs and node_idx in self.binaries_dirs:
+            return f'-nr -s {self.scenario} -bf {self.binaries_dirs[node_idx]}'
         return f'-nr -s {self.scenario}'
 
     def get_node_jvm_options(self, node_idx):
@@ -83,24 +435,67 @@ class Gatling(JavaApp):
             return '-D' + arg + '=' + res
 
         jvm_options_arr = [super().get_node_jvm_options(node_idx)]
+        if self.node_sizing and node_idx in self.node_sizing:
+            jvm_options_arr = [
+                option for option in jvm_options_arr[0].split(' ')
+                if option and not option.startswith(SIZED_JVM_OPTIONS)
+            ]
+            jvm_options_arr.extend(self.node_sizing[node_idx].jvm_options())
+            jvm_options_arr.append(f'-D{NODE_MARKER_PROPERTY}={node_idx}')
         if self.scenario_jvm_options:
             jvm_options_arr.extend(self.scenario_jvm_options)
         jvm_options_arr.extend([
-            _pack_val(arg, val) for arg, val in self.scenario_args.items()
+            _pack_val(arg, val) for arg, val in self.get_node_scenario_args(node_idx).items()
         ])
 
         return ' '.join(jvm_options_arr)
 
-    def fetch_simulation_results(self, local_unpack=True, remote_remove=True):
+    def get_node_scenario_args(self, node_idx):
+        """
+        :return: scenario arguments of the given node, in distributed mode partitioned_args and
+                 injection profile rates are split between nodes and common injection start time
+                 is added as start_at argument
+        """
+        if not self.distributed:
+            if self.scenario_args.get('injection') is None:
+                return self.scenario_args
+            node_args = dict(self.scenario_args)
+            node_args['injection'] = injection_arg(node_args['injection'])
+            return node_args
+        node_ids = sorted(self.nodes.keys())
+        node_n = node_ids.index(node_idx)
+        node_args = dict(self.scenario_args)
+        for arg in self.partitioned_args:
+            if arg in node_args:
+                node_args[arg] = _partition(node_args[arg], len(node_ids), node_n)
+        if node_args.get('injection') is not None:
+            node_args['injection'] = injection_arg(node_args['injection'], len(node_ids), node_n)
+        node_args['start_at'] = self.start_at + int(self.stagger * 1000) * node_n
+        return node_args
+
+    def fetch_simulation_results(self, local_unpack=True, remote_remove=True, stream=False, raw=None):
         """
         Fetch Gatling simulation results to test directory
         :param local_unpack: unpack fetched archives after downloading
         :param remote_remove: remove remote archives after downloading
+        :param stream: stream compressed results from all nodes concurrently over single SSH session per node,
+                       decompressing them on the fly (local_unpack is implied)
+        :param raw: fetch raw simulation logs, by default they are fetched unless the simulation was started
+                    with aggregate=True, then only aggregates are fetched and raw logs are left at nodes
         :return: list of fetched simulation runs directories
         """
+        self.stop_aggregators()
+        if raw is None:
+            raw = not self.aggregate
+        patterns = (['*.log'] if raw else []) + ([AGGREGATE_FILE_NAME] if self.aggregate else [])
+        if not patterns:
+            return []
+        if stream:
+            return self._stream_simulation_results(remote_remove, patterns)
+
         # Gatling nodes produces simulation results into
         # {run_dir}/results/<scenarioname>-<timestamp>/simulation.log
-        # files.
+        # files (and simulation.agg aggregates in aggregate mode).
         #
         # We rename and pack each file one by one to
         # {run_dir}/results/<scenarioname>-<timestamp>/<node_id>-<timestamp>-simulation.log.tar.gz
@@ -119,7 +514,7 @@ class Gatling(JavaApp):
             f'  ls -1 | while read dir; do'
             f'    if [ -d $dir ]; then '
             f'      stamp=$(echo $dir | cut -d "-" -f 2);'
-            f'      for file in $dir/*.log; do'
+            f'      for file in {" ".join("$dir/" + pattern for pattern in patterns)}; do'
             f'         if [ -f $file ]; then'
             f'           res_file=$(dirname $file)/{node_idx}-$stamp-$(basename $file);'
             f'           mv $file $res_file;'
@@ -187,6 +582,71 @@ class Gatling(JavaApp):
 
         return scenarios_files.keys()
 
+    def _stream_simulation_results(self, remote_remove, patterns):
+        # Each node packs all {run_dir}/results/<scenarioname>-<timestamp>/<pattern> files into a single
+        # gzipped tar stream written to stdout (and optionally removes them in the same session).
+        # The stream is unpacked as it arrives into
+        # {test_dir}/results/.fetch-<node_id>/<scenarioname>-<timestamp>/<node_id>-<timestamp>-simulation.log
+        # and, once all nodes are done, files are renamed to
+        # {test_dir}/results/<scenarioname>-<mintimestamp>/<node_id>-<timestamp>-simulation.log
+        results_dir = path.join(self.test_dir, 'results')
+
+        def _fetch(node_idx):
+            node = self.nodes[node_idx]
+            remove_cmd = ' && rm -f $files' if remote_remove else ''
+            command = (
+                f'set -o pipefail; '
+                f'cd {node["run_dir"]}/results 2>/dev/null || exit 0; '
+                f'files=$(ls -1 {" ".join("*/" + pattern for pattern in patterns)} 2>/dev/null); '
+                f'[ -z "$files" ] && exit 0; '
+                f'tar -cf - $files | gzip -1{remove_cmd}'
+            )
+            fetch_dir = path.join(results_dir, f'.fetch-{node_idx}')
+            fetched = []
+            stdin, stdout, stderr = self.ssh.clients[node['host']].exec_command(command)
+            stdin.close()
+            try:
+                with TarFile.open(fileobj=stdout, mode='r|gz') as tar:
+                    for member in tar:
+                        if not member.isfile() or member.name.count('/') != 1 or '..' in member.name:
+                            continue
+                        dir_name, file_name = member.name.split('/')
+                        stamp = dir_name.split('-')[-1]
+                        res_file = f'{dir_name}/{node_idx}-{stamp}-{file_name}'
+                        makedirs(path.join(fetch_dir, dir_name), exist_ok=True)
+                        with open(path.join(fetch_dir, res_file), 'wb') as file:
+                            copyfileobj(tar.extractfile(member), file)
+                        fetched.append(res_file)
+            except ReadError:
+                # empty stream: no results at node
+                pass
+            rc = stdout.channel.recv_exit_status()
+            if rc != 0:
+                raise TidenException(f"Can't fetch simulation results from node {node_idx} ({node['host']}): "
+                                     f"{stderr.read().decode('utf-8', errors='replace').strip()}")
+            return node_idx, fetched
+
+        pool = ThreadPool(max(1, len(self.nodes)))
+        fetched_files = dict(pool.map(_fetch, list(self.nodes.keys())))
+        pool.close()
+        pool.join()
+
+        scenarios_files = self._get_scenarios_files({
+            node_idx: '\n'.join(files) for node_idx, files in fetched_files.items()
+        })
+        for scenario_name, scenario_files in scenarios_files.items():
+            local_path = path.join(results_dir, scenario_name)
+            makedirs(local_path, exist_ok=True)
+            for node_idx, files in scenario_files.items():
+                for file in files:
+                    # file is 'results/<scenarioname>-<timestamp>/<node_id>-<timestamp>-simulation.log'
+                    src = path.join(results_dir, f'.fetch-{node_idx}', *file.split('/')[1:])
+                    replace(src, path.join(local_path, path.basename(file)))
+        for node_idx in fetched_files:
+            rmtree(path.join(results_dir, f'.fetch-{node_idx}'), ignore_errors=True)
+
+        return scenarios_files.keys()
+
     def _get_scenarios_files(self, results):
         scenario_files = {}
         all_data = {
@@ -241,12 +701,126 @@ class Gatling(JavaApp):
 
         return scenario_files
 
-    def generate_report(self, simulation_name, remove=True):
+    def find_capacity(self, scenario, scenario_args, load_arg='load_factor', start=10, strategy='binary',
+                      factor=2.0, increment=None, max_load=None, max_steps=10, skip_seconds=0,
+                      max_p99=None, max_error_rate=0.01, plateau_ratio=0.5, step_timeout=None, ramp_seconds=None,
+                      hold_seconds=None, **start_kwargs):
+        """
+        Search for max sustainable throughput running a sequence of load steps.
+        Only Gatling nodes are restarted between steps, the system under load keeps running.
+        :param scenario: simulation class name
+        :param scenario_args: scenario arguments of every step
+        :param load_arg: scenario argument varied between steps (closed model steps only)
+        :param start: load of the first step
+        :param strategy: 'binary' - bracket saturation and bisect, 'step' - step up until saturation
+        :param factor: load multiplier between steps
+        :param increment: load increment between steps ('step' strategy only)
+        :param max_load: max load to try
+        :param max_steps: max number of steps
+        :param skip_seconds: exclude requests of first seconds of each step (ramp up) from measurement
+        :param max_p99: p99 latency threshold, ms
+        :param max_error_rate: error rate threshold
+        :param plateau_ratio: min ratio of relative throughput gain to relative load gain
+        :param step_timeout: step completion timeout, by default scenario duration plus barrier delay and a minute
+        :param ramp_seconds: open model steps: seconds of arrival rate ramp up to the step load, excluded
+                             from measurement
+        :param hold_seconds: open model steps: seconds the step load is held, when set each step load is
+                             total arrival rate (requests per second) of ramp_then_hold injection profile
+        :param start_kwargs: other Gatling.start arguments, e.g. distributed=True
+        :return: CapacityResult
+        """
+        open_model = hold_seconds is not None
+        if open_model:
+            ramp_seconds = ramp_seconds or 0
+            skip_seconds = max(skip_seconds, ramp_seconds)
+            duration = ramp_seconds + hold_seconds
+        else:
+            duration = int(scenario_args.get('duration', 60))
+        if step_timeout is None:
+            step_timeout = duration + self.default_barrier_delay + 60
+
+        def _run_step(load):
+            step_args = dict(scenario_args)
+            if open_model:
+                step_args['injection'] = ramp_then_hold(load, ramp_seconds=ramp_seconds, hold_seconds=hold_seconds)
+                step_args['duration'] = duration
+                load_line = f'rate={load}/s'
+            else:
+                step_args[load_arg] = load
+                load_line = f'{load_arg}={load}'
+            log_print(f'Capacity search step: {load_line}')
+            self.start(scenario, step_args, **start_kwargs)
+            self.stop(wait=True, timeout=step_timeout)
+            for node_idx, reason in (self.generator_saturation or {}).items():
+                log_print(f'Gatling node {node_idx} saturated at {load_line}: {reason}', color='red')
+            simulation_names = list(self.fetch_simulation_results(stream=True))
+            self.merge_simulation_results(simulation_names)
+            step_stats = self.generate_report(simulation_names, skip_seconds=skip_seconds)
+            stats = SimulationStats()
+            for simulation_stats in step_stats.values():
+                stats.merge(simulation_stats)
+            return stats
+
+        search = CapacitySearch(_run_step, max_p99=max_p99, max_error_rate=max_error_rate,
+                                plateau_ratio=plateau_ratio)
+        if strategy == 'binary':
+            result = search.binary(start, factor=factor, max_load=max_load, max_steps=max_steps)
+        elif strategy == 'step':
+            result = search.step_up(start, factor=factor, increment=increment, max_load=max_load,
+                                    max_steps=max_steps)
+        else:
+            raise TidenException(f'Unknown capacity search strategy {strategy}')
+        for line in result.to_lines():
+            log_print(line)
+        return result
+
+    def merge_simulation_results(self, simulation_name, binary=True, remove=False, correct_skew=False):
+        """
+        Merge fetched per-node simulation logs into single time-ordered source
+        :param simulation_name: simulation name or list of simulation names
+        :param binary: write compact binary record stream next to per-node logs,
+                       otherwise per-node logs are replaced with single merged simulation.log
+        :param remove: remove per-node logs after merging to binary record stream
+        :param correct_skew: shift node timestamps by host clock offsets measured at start, not needed when
+                             host clocks are in sync (e.g. distributed mode relies on it anyway)
+        :return: dict of merged file path for each simulation name
+        """
+        result = {}
+        if type(simulation_name) == type(''):
+            simulation_names = [simulation_name]
+        else:
+            simulation_names = simulation_name
+        for simulation_name in simulation_names:
+            simulation_dir = path.join(self.test_dir, 'results', simulation_name)
+            node_logs = glob(path.join(simulation_dir, '*-simulation.log'))
+            if not node_logs:
+                # only aggregates were fetched, they are merged while reporting
+                continue
+            if binary:
+                merged_file = path.join(simulation_dir, MERGED_RECORD_STREAM_NAME)
+            else:
+                merged_file = path.join(simulation_dir, 'simulation.log')
+            merging_file = merged_file + '.merging'
+            merge_simulation_logs(node_logs, merging_file, binary=binary,
+                                  clock_offsets=self.clock_offsets if correct_skew else None)
+            if remove or not binary:
+                for node_log in node_logs:
+                    unlink(node_log)
+            replace(merging_file, merged_file)
+            result[simulation_name] = merged_file
+        return result
+
+    def generate_report(self, simulation_name, remove=True, html=False, html_timeout=60, skip_seconds=0,
+                        per_second=False):
         """
-        Generate HTML reports from fetched simulation results
-        :param simulation_name:
+        Parse fetched simulation results and optionally generate HTML reports
+        :param simulation_name: simulation name or list of simulation names
         :param remove: remove original files after generation
-        :return: dict of simulation stats for each simulation name
+        :param html: also run Gatling report generator to produce HTML report (requires local java)
+        :param html_timeout: HTML report generation timeout, seconds
+        :param skip_seconds: exclude requests of the first seconds of the run from statistics
+        :param per_second: also collect per-second time series into SimulationStats.per_second
+        :return: dict of SimulationStats for each simulation name
         """
         result = {}
         if type(simulation_name) == type(''):
@@ -256,34 +830,37 @@ class Gatling(JavaApp):
         results_dir = path.join(self.test_dir, 'results')
         for simulation_name in simulation_names:
             simulation_dir = path.join(results_dir, simulation_name)
-            java_args = [
-                '-cp',
-                self.config['artifacts'][self.app_type]['path'],
-                self.__class__.class_name,
-                '-ro',
-                simulation_name,
-                '-rf',
-                results_dir,
-            ]
-            simulation_stats = local_run(
-                proc='java',
-                env={},
-                args=java_args,
-                cwd=simulation_dir,
-                timeout=60,
+            simulation_stats = parse_simulation_logs(
+                find_simulation_logs(simulation_dir),
+                skip_seconds=skip_seconds,
+                per_second=per_second,
             )
-            result[simulation_name] = []
-            s = 0
-            for line in simulation_stats.splitlines():
-                if s == 0 and line.startswith('===='):
-                    s = 1
-                elif s == 1:
-                    if line.startswith('===='):
-                        break
-                    result[simulation_name].append(line)
+            result[simulation_name] = simulation_stats
             with open(path.join(simulation_dir, 'simulation_stats.txt'), 'w') as file:
-                file.write(simulation_stats)
-                file.close()
+                file.write('\n'.join(simulation_stats.to_lines()) + '\n')
+            with open(path.join(simulation_dir, 'simulation_stats.json'), 'w') as file:
+                dump(simulation_stats.as_dict(), file, indent=2)
+            if html:
+                if all(is_aggregate(file) for file in find_simulation_logs(simulation_dir)):
+                    log_print(f'HTML report of {simulation_name} skipped: raw simulation logs were not fetched')
+                else:
+                    self._generate_html_report(simulation_name, results_dir, html_timeout)
         return result
 
-
+    def _generate_html_report(self, simulation_name, results_dir, timeout):
+        java_args = [
+            '-cp',
+            self.config['artifacts'][self.app_type]['path'],
+            self.__class__.class_name,
+            '-ro',
+            simulation_name,
+            '-rf',
+            results_dir,
+        ]
+        local_run(
+            proc='java',
+            env={},
+            args=java_args,
+            cwd=path.join(results_dir, simulation_name),
+            timeout=timeout,
+        )
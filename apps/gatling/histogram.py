@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from math import sqrt
+from struct import Struct
+
+# sub_bucket_bits, count, total, total of squares, min, max (-1 for empty histogram), number of buckets
+_HEADER = Struct('<BQQdqqI')
+
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram of integer latency values (milliseconds).
+
+    Values below 2^sub_bucket_bits are counted exactly, larger values fall into buckets whose
+    width doubles with every power of two, so relative error stays below 2^-(sub_bucket_bits-1)
+    while memory is bounded by the number of distinct buckets, not the number of samples.
+    Histograms with the same sub_bucket_bits are mergeable exactly.
+    """
+
+    def __init__(self, sub_bucket_bits=7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.sub_bucket_half = self.sub_bucket_count >> 1
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.total_squares = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.sub_bucket_count + (shift - 1) * self.sub_bucket_half + (value >> shift) - self.sub_bucket_half
+
+    def _highest_equivalent(self, index):
+        if index < self.sub_bucket_count:
+            return index
+        shift, mantissa = divmod(index - self.sub_bucket_count, self.sub_bucket_half)
+        shift += 1
+        return ((mantissa + self.sub_bucket_half + 1) << shift) - 1
+
+    def record(self, value, count=1):
+        if value < 0:
+            value = 0
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.total_squares += value * value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Add all values of other histogram to this one
+        :param other: LatencyHistogram with the same sub_bucket_bits
+        :return: self
+        """
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError(f"Can't merge histograms with different precision: "
+                             f"{self.sub_bucket_bits} != {other.sub_bucket_bits}")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.total_squares += other.total_squares
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    def percentile(self, percentile):
+        """
+        :param percentile: percentile in range 0..100
+        :return: highest value equivalent to the requested percentile or None for empty histogram
+        """
+        if not self.count:
+            return None
+        target = max(1, int(round(self.count * percentile / 100.0 + 0.4999999)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def percentiles(self, percentiles):
+        return {percentile: self.percentile(percentile) for percentile in percentiles}
+
+    def count_between(self, low, high=None):
+        """
+        Approximate number of values v such that low <= v < high
+        """
+        result = 0
+        for index, count in self.counts.items():
+            value = self._highest_equivalent(index)
+            if value >= low and (high is None or value < high):
+                result += count
+        return result
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    @property
+    def stddev(self):
+        if not self.count:
+            return None
+        mean = self.total / self.count
+        return sqrt(max(0.0, self.total_squares / self.count - mean * mean))
+
+    def to_bytes(self):
+        """
+        Serialize histogram into compact binary form: fixed header followed by
+        varint encoded (bucket index delta, count) pairs
+        """
+        data = bytearray(_HEADER.pack(
+            self.sub_bucket_bits,
+            self.count,
+            self.total,
+            float(self.total_squares),
+            -1 if self.min is None else self.min,
+            -1 if self.max is None else self.max,
+            len(self.counts),
+        ))
+        prev_index = 0
+        for index in sorted(self.counts):
+            _write_varint(data, index - prev_index)
+            _write_varint(data, self.counts[index])
+            prev_index = index
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
+        """
+        :return: tuple (LatencyHistogram, offset after the histogram data)
+        """
+        sub_bucket_bits, count, total, total_squares, min_value, max_value, buckets = \
+            _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        histogram = cls(sub_bucket_bits)
+        histogram.count = count
+        histogram.total = total
+        histogram.total_squares = total_squares
+        histogram.min = None if min_value < 0 else min_value
+        histogram.max = None if max_value < 0 else max_value
+        index = 0
+        for _ in range(buckets):
+            delta, offset = _read_varint(data, offset)
+            bucket_count, offset = _read_varint(data, offset)
+            index += delta
+            histogram.counts[index] = bucket_count
+        return histogram, offset
+
+    def bucket_values(self):
+        """
+        :return: sorted list of (bucket value, count)
+        """
+        return [(self._highest_equivalent(index), self.counts[index]) for index in sorted(self.counts)]
+
+
+def _write_varint(data, value):
+    while value >= 0x80:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def _read_varint(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
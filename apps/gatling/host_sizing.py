@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from threading import Lock
+
+from apps.logfollower import RemoteTail
+
+# prints number of available cores, then total and available memory in KB
+HOST_PROBE_COMMAND = "nproc; awk '/^(MemTotal|MemAvailable):/ {print $2}' /proc/meminfo"
+
+# JVM options replaced by host sizing
+SIZED_JVM_OPTIONS = ('-Xms', '-Xmx', '-XX:ParallelGCThreads=', '-XX:ConcGCThreads=', '-XX:ActiveProcessorCount=')
+
+# JVM system property which marks Gatling node process, used to find its pid
+NODE_MARKER_PROPERTY = 'tiden.gatling.node'
+
+
+class HostResources:
+    """
+    Cores and memory of Gatling host
+    """
+
+    def __init__(self, host, cores, mem_total_mb, mem_available_mb):
+        self.host = host
+        self.cores = cores
+        self.mem_total_mb = mem_total_mb
+        self.mem_available_mb = mem_available_mb
+
+    @classmethod
+    def parse(cls, host, output):
+        """
+        :param output: HOST_PROBE_COMMAND output
+        """
+        values = [int(line) for line in output.split() if line.strip().isdigit()]
+        if len(values) < 2:
+            return None
+        cores, mem_total_kb = values[0], values[1]
+        mem_available_kb = values[2] if len(values) > 2 else mem_total_kb
+        return cls(host, cores, mem_total_kb // 1024, mem_available_kb // 1024)
+
+    def __str__(self):
+        return f'{self.host}: {self.cores} cores, {self.mem_total_mb} MB total, {self.mem_available_mb} MB available'
+
+
+class NodeSizing:
+    """
+    JVM sizing and CPU set of single Gatling node
+    """
+
+    def __init__(self, node_idx, host, cpus, heap_mb, cpu_set=None):
+        self.node_idx = node_idx
+        self.host = host
+        self.cpus = cpus
+        self.heap_mb = heap_mb
+        # list of CPU ids or None when node is not pinned
+        self.cpu_set = cpu_set
+
+    @property
+    def cpu_list(self):
+        """
+        :return: CPU set in taskset format
+        """
+        if not self.cpu_set:
+            return None
+        return f'{self.cpu_set[0]}-{self.cpu_set[-1]}' if len(self.cpu_set) > 1 else str(self.cpu_set[0])
+
+    def jvm_options(self):
+        return [
+            f'-Xms{self.heap_mb}m',
+            f'-Xmx{self.heap_mb}m',
+            f'-XX:ActiveProcessorCount={self.cpus}',
+            f'-XX:ParallelGCThreads={self.cpus}',
+            f'-XX:ConcGCThreads={max(1, self.cpus // 4)}',
+            f'-Dio.netty.availableProcessors={self.cpus}',
+            f'-Dio.netty.eventLoopThreads={self.cpus}',
+        ]
+
+    def __str__(self):
+        pinned = f', CPUs {self.cpu_list}' if self.cpu_set else ''
+        return f'node {self.node_idx} at {self.host}: {self.cpus} CPUs{pinned}, heap {self.heap_mb} MB'
+
+
+def plan_node_sizing(nodes, resources, heap_share=0.5, min_heap_mb=512, max_heap_mb=31744, reserved_cores=1):
+    """
+    Split host resources between Gatling nodes running at the host
+    :param nodes: Gatling nodes dict
+    :param resources: dict host -> HostResources
+    :param heap_share: share of available host memory given to Gatling heaps
+    :param min_heap_mb: min heap size
+    :param max_heap_mb: max heap size (keeps compressed oops)
+    :param reserved_cores: cores left to OS and SSH when host has enough cores
+    :return: dict node_idx -> NodeSizing
+    """
+    host_nodes = {}
+    for node_idx in sorted(nodes.keys()):
+        host_nodes.setdefault(nodes[node_idx]['host'], []).append(node_idx)
+
+    result = {}
+    for host, node_ids in host_nodes.items():
+        host_resources = resources.get(host)
+        if host_resources is None:
+            continue
+        count = len(node_ids)
+        reserved = reserved_cores if host_resources.cores > count + reserved_cores else 0
+        cpus = (host_resources.cores - reserved) // count
+        heap_mb = int(host_resources.mem_available_mb * heap_share / count)
+        heap_mb = max(min_heap_mb, min(max_heap_mb, heap_mb))
+        for node_n, node_idx in enumerate(node_ids):
+            if cpus >= 1:
+                first_cpu = reserved + node_n * cpus
+                result[node_idx] = NodeSizing(node_idx, host, cpus, heap_mb, list(range(first_cpu, first_cpu + cpus)))
+            else:
+                # more nodes than cores: nodes share all cores
+                result[node_idx] = NodeSizing(node_idx, host, host_resources.cores, heap_mb)
+    return result
+
+
+def node_pid_command(node_idx):
+    """
+    :return: shell expression printing pid of Gatling node JVM
+    """
+    # bracket keeps the pattern from matching command lines of shells running this expression,
+    # shells which launched the JVM are skipped by process name
+    return (
+        f"for p in $(pgrep -f -- '[-]D{NODE_MARKER_PROPERTY}={node_idx} '); do "
+        f'[ "$(cat /proc/$p/comm 2>/dev/null)" = java ] && echo $p && break; done'
+    )
+
+
+def pin_node_command(node_idx, cpu_list):
+    """
+    :return: shell command pinning all threads of Gatling node JVM to CPU set
+    """
+    return (
+        f'for i in $(seq 50); do pid=$({node_pid_command(node_idx)}); [ -n "$pid" ] && break; sleep 0.1; done; '
+        f'[ -n "$pid" ] && taskset -a -p -c {cpu_list} $pid >/dev/null'
+    )
+
+
+def monitor_node_command(node_idx, interval=1):
+    """
+    :return: shell command which prints '<epoch ms> <process CPU ticks> <clock ticks per second> <GC seconds>'
+             every interval while Gatling node JVM runs
+    """
+    return (
+        f'pid=$({node_pid_command(node_idx)}); [ -z "$pid" ] && exit 0; '
+        f'hz=$(getconf CLK_TCK); '
+        f'jstat=${{JAVA_HOME:+$JAVA_HOME/bin/}}jstat; '
+        f'$jstat -gcutil $pid {int(interval * 1000)} 2>/dev/null | '
+        f'while read -r line; do '
+        f'  gct=$(echo "$line" | awk \'{{print $NF}}\'); '
+        f'  ticks=$(awk \'{{print $14 + $15}}\' /proc/$pid/stat 2>/dev/null) || break; '
+        f'  echo "$(date +%s%3N) $ticks $hz $gct"; '
+        f'done'
+    )
+
+
+class GeneratorSample:
+    __slots__ = ('timestamp', 'cpu_ticks', 'hz', 'gc_seconds')
+
+    def __init__(self, timestamp, cpu_ticks, hz, gc_seconds):
+        self.timestamp = timestamp
+        self.cpu_ticks = cpu_ticks
+        self.hz = hz
+        self.gc_seconds = gc_seconds
+
+
+class GeneratorMonitor:
+    """
+    Samples CPU and GC time of Gatling node JVMs to detect load generator saturation.
+
+    A node is saturated when its CPU usage stays above max_cpu of its CPU share for at least
+    saturated_share of the samples, or when it spends more than max_gc of wall time in GC.
+    """
+
+    def __init__(self, sizing, max_cpu=0.9, max_gc=0.1, saturated_share=0.2, warmup_seconds=10):
+        """
+        :param sizing: dict node_idx -> NodeSizing
+        :param max_cpu: CPU usage threshold, share of node CPUs
+        :param max_gc: GC time threshold, share of wall time
+        :param saturated_share: share of samples above CPU threshold to declare saturation
+        :param warmup_seconds: samples of the first seconds are ignored (JIT compilation)
+        """
+        self.sizing = sizing
+        self.max_cpu = max_cpu
+        self.max_gc = max_gc
+        self.saturated_share = saturated_share
+        self.warmup_seconds = warmup_seconds
+        self.samples = {node_idx: [] for node_idx in sizing}
+        self.tails = []
+        self._lock = Lock()
+
+    def follow(self, ssh_client, node_idx, interval=1):
+        tail = {'data': b''}
+
+        def _on_data(data):
+            lines = (tail['data'] + data).split(b'\n')
+            tail['data'] = lines.pop()
+            for line in lines:
+                self._record(node_idx, line)
+
+        self.tails.append(
+            RemoteTail(ssh_client, monitor_node_command(node_idx, interval), _on_data, f'generator-{node_idx}').start()
+        )
+
+    def _record(self, node_idx, line):
+        fields = line.strip().split()
+        if len(fields) != 4:
+            return
+        try:
+            sample = GeneratorSample(int(fields[0]), int(fields[1]), int(fields[2]), float(fields[3]))
+        except ValueError:
+            return
+        with self._lock:
+            self.samples[node_idx].append(sample)
+
+    def stop(self):
+        for tail in self.tails:
+            tail.stop()
+
+    def node_usage(self, node_idx):
+        """
+        :return: list of (CPU usage share of node CPUs, GC time share) for every sampling interval after warmup
+        """
+        with self._lock:
+            samples = list(self.samples.get(node_idx, []))
+        if not samples:
+            return []
+        cpus = self.sizing[node_idx].cpus
+        warmup_end = samples[0].timestamp + self.warmup_seconds * 1000
+        usage = []
+        for prev, cur in zip(samples, samples[1:]):
+            elapsed = (cur.timestamp - prev.timestamp) / 1000.0
+            if elapsed <= 0 or cur.timestamp < warmup_end:
+                continue
+            cpu = (cur.cpu_ticks - prev.cpu_ticks) / cur.hz / elapsed / cpus
+            gc = (cur.gc_seconds - prev.gc_seconds) / elapsed
+            usage.append((cpu, gc))
+        return usage
+
+    def saturation(self):
+        """
+        :return: dict node_idx -> saturation reason for saturated nodes
+        """
+        result = {}
+        for node_idx in sorted(self.samples):
+            usage = self.node_usage(node_idx)
+            if not usage:
+                continue
+            busy = sum(1 for cpu, _ in usage if cpu >= self.max_cpu)
+            gc_share = sum(gc for _, gc in usage) / len(usage)
+            if busy >= self.saturated_share * len(usage):
+                result[node_idx] = (f'CPU above {100.0 * self.max_cpu:.0f}% of {self.sizing[node_idx].cpus} CPUs '
+                                    f'in {busy} of {len(usage)} seconds')
+            elif gc_share > self.max_gc:
+                result[node_idx] = f'{100.0 * gc_share:.1f}% of time in GC'
+        return result
+
+    def to_lines(self):
+        lines = []
+        for node_idx in sorted(self.samples):
+            usage = self.node_usage(node_idx)
+            if not usage:
+                lines.append(f'node {node_idx}: no samples')
+                continue
+            cpu = [value for value, _ in usage]
+            gc_share = sum(gc for _, gc in usage) / len(usage)
+            lines.append(f'node {node_idx}: CPU mean {100.0 * sum(cpu) / len(cpu):.1f}%, '
+                         f'max {100.0 * max(cpu):.1f}% of {self.sizing[node_idx].cpus} CPUs, '
+                         f'GC {100.0 * gc_share:.1f}% of time')
+        return lines
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from math import ceil
+
+from tiden import TidenException
+
+# Open model injection profile is passed to simulation as 'injection' scenario argument:
+# comma separated phases, each phase is colon separated kind and numbers
+#   constant:<rate>:<seconds>         - constantUsersPerSec(rate) during seconds
+#   ramp:<from rate>:<to rate>:<seconds> - rampUsersPerSec(from) to (to) during seconds
+#   nothing:<seconds>                 - nothingFor(seconds)
+#   once:<users>                      - atOnceUsers(users)
+# Every injected user sends a single request, so rates are requests per second.
+
+
+class Phase:
+    """
+    Single injection phase, rates are total requests per second of all Gatling nodes
+    """
+
+    def __init__(self, kind, seconds=0, rate=0.0, to_rate=None, users=0):
+        self.kind = kind
+        self.seconds = seconds
+        self.rate = rate
+        self.to_rate = to_rate
+        self.users = users
+
+    @property
+    def injects(self):
+        """
+        :return: True when the phase injects at least one request
+        """
+        if self.kind == 'once':
+            return self.users > 0
+        if self.kind == 'nothing' or self.seconds <= 0:
+            return False
+        return self.rate > 0 or (self.to_rate or 0) > 0
+
+    def partition(self, parts, part_n):
+        """
+        :return: share of the phase injected by part_n-th of parts Gatling nodes
+        """
+        users = self.users // parts + (1 if part_n < self.users % parts else 0)
+        to_rate = self.to_rate / parts if self.to_rate is not None else None
+        return Phase(self.kind, self.seconds, self.rate / parts, to_rate, users)
+
+    def to_arg(self):
+        if self.kind == 'constant':
+            return f'constant:{_num(self.rate)}:{_num(self.seconds)}'
+        if self.kind == 'ramp':
+            return f'ramp:{_num(self.rate)}:{_num(self.to_rate)}:{_num(self.seconds)}'
+        if self.kind == 'once':
+            return f'once:{self.users}'
+        return f'nothing:{_num(self.seconds)}'
+
+
+class InjectionProfile:
+    """
+    Open model injection profile: a sequence of phases with arrival rates independent of response times
+    """
+
+    def __init__(self, phases):
+        self.phases = []
+        for phase in phases:
+            if isinstance(phase, InjectionProfile):
+                self.phases.extend(phase.phases)
+            elif isinstance(phase, (list, tuple)):
+                self.phases.extend(phase)
+            else:
+                self.phases.append(phase)
+
+    @property
+    def duration(self):
+        """
+        :return: total duration of phases, seconds
+        """
+        return sum(phase.seconds for phase in self.phases)
+
+    def partition(self, parts, part_n):
+        return InjectionProfile([phase.partition(parts, part_n) for phase in self.phases])
+
+    def to_arg(self):
+        # zero user bursts are left out, e.g. at_once(1) share of the second of two nodes
+        return ','.join(
+            phase.to_arg() for phase in self.phases if (phase.users > 0 if phase.kind == 'once' else phase.seconds > 0)
+        )
+
+
+def pause(seconds):
+    return Phase('nothing', seconds)
+
+
+def constant_rate(rate, seconds):
+    """
+    Constant arrival rate
+    :param rate: requests per second
+    :param seconds: phase duration
+    """
+    if rate <= 0:
+        return pause(seconds)
+    return Phase('constant', seconds, float(rate))
+
+
+def ramp_rate(from_rate, to_rate, seconds):
+    """
+    Arrival rate linearly changing from from_rate to to_rate
+    """
+    return Phase('ramp', seconds, float(from_rate), float(to_rate))
+
+
+def at_once(users):
+    """
+    Burst of simultaneous requests
+    """
+    return Phase('once', users=int(users))
+
+
+def ramp_then_hold(rate, ramp_seconds, hold_seconds, from_rate=0):
+    """
+    Ramp arrival rate up to the target and hold it
+    """
+    return InjectionProfile([ramp_rate(from_rate, rate, ramp_seconds), constant_rate(rate, hold_seconds)])
+
+
+def stepped_rate(start_rate, step_rate, steps, step_seconds, ramp_seconds=0):
+    """
+    Arrival rate increased by step_rate every step_seconds, optionally with linear ramps between steps
+    :param start_rate: rate of the first step
+    :param step_rate: rate increment between steps
+    :param steps: number of steps
+    :param step_seconds: duration of each step
+    :param ramp_seconds: duration of ramp between steps
+    """
+    phases = []
+    for step in range(steps):
+        rate = start_rate + step * step_rate
+        if step and ramp_seconds:
+            phases.append(ramp_rate(rate - step_rate, rate, ramp_seconds))
+        phases.append(constant_rate(rate, step_seconds))
+    return InjectionProfile(phases)
+
+
+def spike(base_rate, spike_rate, before_seconds, spike_seconds, after_seconds):
+    """
+    Constant base rate interrupted by a short period of spike rate
+    """
+    return InjectionProfile([
+        constant_rate(base_rate, before_seconds),
+        constant_rate(spike_rate, spike_seconds),
+        constant_rate(base_rate, after_seconds),
+    ])
+
+
+def injection_arg(profile, parts=1, part_n=0):
+    """
+    :param profile: InjectionProfile or list of phases
+    :return: 'injection' scenario argument value of part_n-th of parts Gatling nodes
+    """
+    if not isinstance(profile, InjectionProfile):
+        profile = InjectionProfile(profile)
+    # empty argument makes simulation silently fall back to the closed model
+    if not any(phase.injects for phase in profile.phases):
+        raise TidenException('Injection profile injects no requests: all phases are empty or have zero duration')
+    if parts > 1:
+        profile = profile.partition(parts, part_n)
+        if not any(phase.injects for phase in profile.phases):
+            raise TidenException(f'Injection profile is too small to split between {parts} Gatling nodes: '
+                                 f'node {part_n + 1} of {parts} injects no requests')
+    return profile.to_arg()
+
+
+def injection_duration(profile):
+    """
+    :return: profile duration rounded up to whole seconds
+    """
+    if not isinstance(profile, InjectionProfile):
+        profile = InjectionProfile(profile)
+    return int(ceil(profile.duration))
+
+
+def _num(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return f'{value:.6g}'
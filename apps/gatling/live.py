@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from queue import Queue, Empty
+from threading import Thread, Event, Lock, current_thread
+from time import time
+
+from apps.logfollower import RemoteTail
+
+from .histogram import LatencyHistogram
+from .simulation_log import SimulationLogParser
+
+
+class LiveSnapshot:
+    """
+    Live metrics over the rolling window ending at the given second
+    """
+
+    def __init__(self, second, window, count, errors, histogram):
+        self.second = second
+        self.window = window
+        self.count = count
+        self.errors = errors
+        self.throughput = count / window
+        self.error_rate = errors / count if count else 0.0
+        self.p50 = histogram.percentile(50)
+        self.p99 = histogram.percentile(99)
+        self.max = histogram.max
+
+    def __str__(self):
+        return (f'{self.throughput:.1f} req/s, errors {100.0 * self.error_rate:.2f}%, '
+                f'p50 {self.p50} ms, p99 {self.p99} ms, max {self.max} ms')
+
+
+class LiveMetrics:
+    """
+    Thread-safe per-second request counters and latency histograms, keyed by request end second
+    """
+
+    def __init__(self, history_seconds=300):
+        self.history_seconds = history_seconds
+        self.seconds = {}
+        self.last_second = None
+        self._lock = Lock()
+
+    def record(self, name, start, end, ok, message):
+        second = end // 1000
+        with self._lock:
+            bucket = self.seconds.get(second)
+            if bucket is None:
+                bucket = [0, 0, LatencyHistogram()]
+                self.seconds[second] = bucket
+            bucket[0] += 1
+            if not ok:
+                bucket[1] += 1
+            bucket[2].record(end - start)
+            if self.last_second is None or second > self.last_second:
+                self.last_second = second
+                for old_second in [s for s in self.seconds if s <= second - self.history_seconds]:
+                    del self.seconds[old_second]
+
+    def snapshot(self, second, window=1):
+        """
+        :param second: last second of the window (epoch seconds)
+        :param window: rolling window length, seconds
+        :return: LiveSnapshot
+        """
+        count, errors, histogram = 0, 0, LatencyHistogram()
+        with self._lock:
+            for cur_second in range(second - window + 1, second + 1):
+                bucket = self.seconds.get(cur_second)
+                if bucket is not None:
+                    count += bucket[0]
+                    errors += bucket[1]
+                    histogram.merge(bucket[2])
+        return LiveSnapshot(second, window, count, errors, histogram)
+
+
+class SLO:
+    """
+    Service level thresholds checked against live snapshots
+    """
+
+    def __init__(self, max_p50=None, max_p99=None, max_error_rate=None, min_throughput=None,
+                 grace_period=0, breach_seconds=3):
+        """
+        :param max_p50: max allowed median latency, ms
+        :param max_p99: max allowed 99th percentile latency, ms
+        :param max_error_rate: max allowed error rate, 0..1
+        :param min_throughput: min allowed throughput, req/s
+        :param grace_period: seconds from the first snapshot during which thresholds are not checked (warmup)
+        :param breach_seconds: number of consecutive breached snapshots to declare SLO violation
+        """
+        self.max_p50 = max_p50
+        self.max_p99 = max_p99
+        self.max_error_rate = max_error_rate
+        self.min_throughput = min_throughput
+        self.grace_period = grace_period
+        self.breach_seconds = breach_seconds
+        self._first_second = None
+        self._breaches = 0
+
+    def check(self, snapshot):
+        """
+        :return: violation description or None
+        """
+        if self._first_second is None:
+            self._first_second = snapshot.second
+        if snapshot.second - self._first_second < self.grace_period:
+            return None
+        breach = None
+        if self.max_p50 is not None and snapshot.p50 is not None and snapshot.p50 > self.max_p50:
+            breach = f'p50 {snapshot.p50} ms > {self.max_p50} ms'
+        elif self.max_p99 is not None and snapshot.p99 is not None and snapshot.p99 > self.max_p99:
+            breach = f'p99 {snapshot.p99} ms > {self.max_p99} ms'
+        elif self.max_error_rate is not None and snapshot.error_rate > self.max_error_rate:
+            breach = f'error rate {snapshot.error_rate:.4f} > {self.max_error_rate}'
+        elif self.min_throughput is not None and snapshot.throughput < self.min_throughput:
+            breach = f'throughput {snapshot.throughput:.1f} req/s < {self.min_throughput} req/s'
+        if breach is None:
+            self._breaches = 0
+            return None
+        self._breaches += 1
+        if self._breaches >= self.breach_seconds:
+            return breach
+        return None
+
+
+class LiveMonitor:
+    """
+    Follows simulation logs of all Gatling nodes and publishes rolling metrics once per second.
+
+    Snapshots are delivered to callbacks and can be iterated over; a second is published
+    when settle_seconds passed after it, so that slower nodes have a chance to report.
+    """
+
+    def __init__(self, window=5, settle_seconds=2, slo=None, on_breach=None):
+        """
+        :param window: rolling window, seconds
+        :param settle_seconds: delay before publishing a second
+        :param slo: optional SLO instance
+        :param on_breach: callback(message) called once when SLO is violated
+        """
+        self.window = window
+        self.settle_seconds = settle_seconds
+        self.slo = slo
+        self.on_breach = on_breach
+        self.metrics = LiveMetrics()
+        self.callbacks = []
+        self.violation = None
+        self.tails = []
+        self._completed = Event()
+        self._stopped = Event()
+        self._queues = []
+        self._queues_lock = Lock()
+        self._published_second = None
+        self._thread = Thread(target=self._run, name='gatling-live-monitor', daemon=True)
+
+    def add_callback(self, callback):
+        """
+        :param callback: callable(LiveSnapshot)
+        """
+        self.callbacks.append(callback)
+
+    def follow_simulation_log(self, ssh_client, command, name):
+        parser = SimulationLogParser(on_request=self.metrics.record)
+        self.tails.append(RemoteTail(ssh_client, command, parser.feed, name).start())
+
+    def set_completion(self, waiter):
+        """
+        :param waiter: LogWaiter of simulation completion messages of all nodes
+        """
+        waiter.add_callback(lambda _: self._completed.set())
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(1):
+            last_second = self.metrics.last_second
+            if last_second is None:
+                continue
+            ready_second = min(last_second, int(time())) - self.settle_seconds
+            if self._published_second is None:
+                self._published_second = ready_second - 1
+            while self._published_second < ready_second:
+                self._published_second += 1
+                self._publish(self.metrics.snapshot(self._published_second, self.window))
+
+    def _publish(self, snapshot):
+        for callback in self.callbacks:
+            callback(snapshot)
+        with self._queues_lock:
+            for queue in self._queues:
+                queue.put(snapshot)
+        if self.slo is not None and self.violation is None:
+            violation = self.slo.check(snapshot)
+            if violation is not None:
+                self.violation = violation
+                if self.on_breach is not None:
+                    self.on_breach(violation)
+                self._completed.set()
+
+    def __iter__(self):
+        """
+        Iterate over published snapshots until the simulation completes or monitor stops
+        """
+        queue = Queue()
+        with self._queues_lock:
+            self._queues.append(queue)
+        try:
+            while True:
+                try:
+                    yield queue.get(timeout=1)
+                except Empty:
+                    if self._completed.is_set() or self._stopped.is_set():
+                        break
+        finally:
+            with self._queues_lock:
+                self._queues.remove(queue)
+
+    def wait_completed(self, timeout):
+        """
+        :return: True when all nodes completed simulation or SLO was violated
+        """
+        return self._completed.wait(timeout)
+
+    def stop(self):
+        self._stopped.set()
+        for tail in self.tails:
+            tail.stop()
+        if self._thread.is_alive() and self._thread is not current_thread():
+            self._thread.join(5)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from heapq import heappush, heappop, merge
+from itertools import chain
+from os import path
+
+from .record_stream import RecordStreamWriter
+from .simulation_log import DEFAULT_CHUNK_SIZE, read_log_lines, request_name_index
+
+# Gatling writes records when they complete, so records of a single node log are only nearly ordered;
+# this many records are buffered per node to restore exact order
+DEFAULT_REORDER_WINDOW = 10000
+
+_TEXT_BUFFER_SIZE = 1024 * 1024
+
+
+def _timestamp_fields(fields):
+    """
+    :param fields: simulation log record fields
+    :return: tuple (indexes of timestamp fields, index of the field to order record by)
+    """
+    record_type = fields[0]
+    if record_type == 'REQUEST':
+        name_idx = request_name_index(fields)
+        if name_idx is not None:
+            return (name_idx + 1, name_idx + 2), name_idx + 2
+    elif record_type == 'USER':
+        # Gatling 3.3:  USER scenario userId START|END start end
+        # Gatling 3.4+: USER scenario START|END start end
+        for event_idx in (2, 3):
+            if len(fields) > event_idx + 2 and fields[event_idx] in ('START', 'END'):
+                key_idx = event_idx + 1 if fields[event_idx] == 'START' else event_idx + 2
+                return (event_idx + 1, event_idx + 2), key_idx
+    elif record_type == 'RUN':
+        if len(fields) > 3:
+            return (3,), 3
+    elif record_type == 'GROUP':
+        # Gatling 3.3:  GROUP userId groups start end cumulated status
+        # Gatling 3.4+: GROUP groups start end cumulated status
+        start_idx = 3 if len(fields) > 6 else 2
+        if len(fields) > start_idx + 1:
+            return (start_idx, start_idx + 1), start_idx + 1
+    elif record_type == 'ERROR':
+        if len(fields) > 2:
+            return (2,), 2
+    return (), None
+
+
+def _read_records(file_path, chunk_size):
+    for line in read_log_lines(file_path, chunk_size):
+        yield line.decode('utf-8', errors='replace').split('\t')
+
+
+def _ordered_records(records, node, offset, reorder_window):
+    """
+    Shift record timestamps by clock offset and restore record order within reorder window
+    :return: generator of (key, node, seq, fields)
+    """
+    heap = []
+    last_key = 0
+    for seq, fields in enumerate(records):
+        timestamp_idxs, key_idx = _timestamp_fields(fields)
+        try:
+            for idx in timestamp_idxs:
+                fields[idx] = int(fields[idx]) - offset
+        except ValueError:
+            continue
+        if key_idx is not None:
+            last_key = fields[key_idx]
+        heappush(heap, (last_key, node, seq, fields))
+        if len(heap) > reorder_window:
+            yield heappop(heap)
+    while heap:
+        yield heappop(heap)
+
+
+def _node_index(file_path, default):
+    # fetched per-node logs are named <node_idx>-<timestamp>-simulation.log
+    prefix = path.basename(file_path).split('-')[0]
+    return int(prefix) if prefix.isdigit() else default
+
+
+def merge_simulation_logs(files, output, binary=True, clock_offsets=None,
+                          reorder_window=DEFAULT_REORDER_WINDOW, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    K-way merge of per-node simulation logs into single time-ordered log.
+
+    Only one record per node plus the reorder window is kept in memory at any time.
+
+    :param files: list of per-node simulation log files
+    :param output: output file path
+    :param binary: write compact binary record stream (RUN, USER and REQUEST records only)
+                   instead of Gatling text log
+    :param clock_offsets: dict node index -> measured clock offset of the node host (milliseconds, node clock
+                          minus local clock), timestamps of each node are shifted back by its offset
+    :param reorder_window: number of records buffered per node to fix local disorder
+    :param chunk_size: read buffer size
+    :return: dict of applied clock offsets (milliseconds) per node index
+    """
+    sources = {}
+    for file_n, file_path in enumerate(sorted(files)):
+        node = _node_index(file_path, file_n)
+        records = _read_records(file_path, chunk_size)
+        first_record = next(records, None)
+        if first_record is None:
+            continue
+        sources[node] = chain([first_record], records)
+
+    offsets = {node: int((clock_offsets or {}).get(node, 0)) for node in sources}
+
+    merged = merge(*[
+        _ordered_records(records, node, offsets[node], reorder_window) for node, records in sources.items()
+    ])
+
+    if binary:
+        with RecordStreamWriter(output) as writer:
+            for _, node, _, fields in merged:
+                _write_binary_record(writer, node, fields)
+    else:
+        with open(output, 'w', buffering=_TEXT_BUFFER_SIZE) as file:
+            for _, _, _, fields in merged:
+                file.write('\t'.join(str(field) for field in fields) + '\n')
+    return offsets
+
+
+def _write_binary_record(writer, node, fields):
+    record_type = fields[0]
+    if record_type == 'REQUEST':
+        name_idx = request_name_index(fields)
+        if name_idx is None:
+            return
+        message = fields[name_idx + 4] if len(fields) > name_idx + 4 else ''
+        writer.write_request(
+            node, fields[name_idx], fields[name_idx + 1], fields[name_idx + 2], fields[name_idx + 3] == 'OK', message
+        )
+    elif record_type == 'USER':
+        timestamp_idxs, key_idx = _timestamp_fields(fields)
+        if key_idx is not None:
+            started = key_idx == timestamp_idxs[0]
+            writer.write_user(node, started, fields[key_idx], fields[1])
+    elif record_type == 'RUN':
+        if len(fields) > 3:
+            writer.write_run(node, fields[3], fields[1])
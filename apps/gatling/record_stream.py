@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from struct import Struct
+
+# Compact binary stream of simulation records.
+#
+# File starts with MAGIC followed by records, each record starts with one byte tag:
+#   STRING:  uint32 id, uint16 length, utf-8 bytes - entry of string table, precedes the first use of the id
+#   RUN:     uint16 node, int64 start, uint32 simulation string id
+#   USER:    uint16 node, uint8 event (0 - start, 1 - end), int64 timestamp, uint32 scenario string id
+#   REQUEST: uint16 node, uint8 ok, int64 start, uint32 duration, uint32 name string id, uint32 message string id
+# All numbers are little endian, message id NO_STRING means no message.
+
+MAGIC = b'GTLB\x01'
+
+TAG_STRING = 0
+TAG_RUN = 1
+TAG_USER = 2
+TAG_REQUEST = 3
+
+NO_STRING = 0xFFFFFFFF
+
+_TAG = Struct('<B')
+_STRING = Struct('<IH')
+_RUN = Struct('<HqI')
+_USER = Struct('<HBqI')
+_REQUEST = Struct('<HBqIII')
+
+_WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class RecordStreamWriter:
+    """
+    Writes simulation records to a binary record stream file
+    """
+
+    def __init__(self, file_path):
+        self.file = open(file_path, 'wb', buffering=_WRITE_BUFFER_SIZE)
+        self.file.write(MAGIC)
+        self.strings = {}
+
+    def _string_id(self, value):
+        string_id = self.strings.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings[value] = string_id
+            data = value.encode('utf-8')[:0xFFFF]
+            self.file.write(_TAG.pack(TAG_STRING) + _STRING.pack(string_id, len(data)) + data)
+        return string_id
+
+    def write_run(self, node, start, simulation):
+        self.file.write(_TAG.pack(TAG_RUN) + _RUN.pack(node, start, self._string_id(simulation)))
+
+    def write_user(self, node, started, timestamp, scenario):
+        self.file.write(
+            _TAG.pack(TAG_USER) + _USER.pack(node, 0 if started else 1, timestamp, self._string_id(scenario))
+        )
+
+    def write_request(self, node, name, start, end, ok, message):
+        message_id = self._string_id(message) if message else NO_STRING
+        self.file.write(_TAG.pack(TAG_REQUEST) + _REQUEST.pack(
+            node, 1 if ok else 0, start, max(0, end - start), self._string_id(name), message_id
+        ))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def is_record_stream(file_path):
+    with open(file_path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def read_record_stream(file_path):
+    """
+    Iterate over records of binary record stream
+    :return: generator of tuples:
+        (TAG_RUN, node, start, simulation)
+        (TAG_USER, node, started, timestamp, scenario)
+        (TAG_REQUEST, node, name, start, end, ok, message)
+    """
+    strings = {NO_STRING: ''}
+    with open(file_path, 'rb', buffering=_WRITE_BUFFER_SIZE) as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{file_path} is not a simulation record stream')
+        read = file.read
+        while True:
+            tag = read(1)
+            if not tag:
+                break
+            tag = tag[0]
+            if tag == TAG_REQUEST:
+                node, ok, start, duration, name_id, message_id = _REQUEST.unpack(read(_REQUEST.size))
+                yield TAG_REQUEST, node, strings[name_id], start, start + duration, ok == 1, strings[message_id]
+            elif tag == TAG_STRING:
+                string_id, length = _STRING.unpack(read(_STRING.size))
+                strings[string_id] = read(length).decode('utf-8', errors='replace')
+            elif tag == TAG_USER:
+                node, event, timestamp, scenario_id = _USER.unpack(read(_USER.size))
+                yield TAG_USER, node, event == 0, timestamp, strings[scenario_id]
+            elif tag == TAG_RUN:
+                node, start, simulation_id = _RUN.unpack(read(_RUN.size))
+                yield TAG_RUN, node, start, strings[simulation_id]
+            else:
+                raise ValueError(f'Unknown record tag {tag} in {file_path}')
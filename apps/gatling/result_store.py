@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+from json import dumps, loads
+from math import sqrt, erfc
+from os import makedirs, path
+from sqlite3 import connect
+from time import time
+
+from .histogram import LatencyHistogram
+from .simulation_log import GLOBAL_STATS_NAME
+
+_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS runs ('
+    '  id INTEGER PRIMARY KEY AUTOINCREMENT,'
+    '  name TEXT NOT NULL,'
+    '  simulation TEXT,'
+    '  created REAL NOT NULL,'
+    '  duration_ms INTEGER,'
+    '  tags TEXT NOT NULL'
+    ')',
+    'CREATE TABLE IF NOT EXISTS run_requests ('
+    '  run_id INTEGER NOT NULL REFERENCES runs(id),'
+    '  request TEXT NOT NULL,'
+    '  ok_histogram BLOB NOT NULL,'
+    '  ko_histogram BLOB NOT NULL,'
+    '  PRIMARY KEY (run_id, request)'
+    ')',
+    'CREATE TABLE IF NOT EXISTS run_series ('
+    '  run_id INTEGER PRIMARY KEY REFERENCES runs(id),'
+    '  start_second INTEGER NOT NULL,'
+    '  counts BLOB NOT NULL,'
+    '  errors BLOB NOT NULL,'
+    '  p99 BLOB NOT NULL'
+    ')',
+    'CREATE TABLE IF NOT EXISTS baselines ('
+    '  name TEXT NOT NULL,'
+    '  run_id INTEGER NOT NULL REFERENCES runs(id),'
+    '  created REAL NOT NULL'
+    ')',
+]
+
+
+class StoredRun:
+    """
+    Benchmark run loaded from the store
+    """
+
+    def __init__(self, run_id, name, simulation, created, duration_ms, tags):
+        self.id = run_id
+        self.name = name
+        self.simulation = simulation
+        self.created = created
+        self.duration_ms = duration_ms
+        self.tags = tags
+        # request name -> (ok LatencyHistogram, ko LatencyHistogram)
+        self.requests = {}
+        self.start_second = None
+        # per-second number of requests, errors and p99 latency
+        self.counts = []
+        self.errors = []
+        self.p99 = []
+
+
+class Regression:
+    """
+    Statistically significant degradation of a metric against baseline
+    """
+
+    def __init__(self, request, metric, baseline, current, p_value):
+        self.request = request
+        self.metric = metric
+        self.baseline = baseline
+        self.current = current
+        self.p_value = p_value
+
+    def __str__(self):
+        return (f'{self.request}: {self.metric} {self.baseline:.2f} -> {self.current:.2f} '
+                f'(p-value {self.p_value:.2g})')
+
+
+class ResultStore:
+    """
+    Append-only SQLite store of parsed benchmark results.
+
+    Every run keeps per-request latency histograms, per-second throughput time series and free-form tags
+    (Ignite version, JVM options, environment). Runs are never modified, baselines are named references
+    to runs, the latest reference with the same name wins.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = path.abspath(db_path)
+        makedirs(path.dirname(self.db_path), exist_ok=True)
+        self.connection = connect(self.db_path)
+        with self.connection:
+            for statement in _SCHEMA:
+                self.connection.execute(statement)
+
+    def close(self):
+        self.connection.close()
+
+    def save_run(self, name, stats, tags=None):
+        """
+        :param name: benchmark name, e.g. test method name
+        :param stats: SimulationStats, per-second time series is stored when collected
+        :param tags: dict of run attributes
+        :return: run id
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (name, simulation, created, duration_ms, tags) VALUES (?, ?, ?, ?, ?)',
+                (name, stats.simulation, time(), stats.duration_ms, dumps(tags or {}, sort_keys=True, default=str))
+            )
+            run_id = cursor.lastrowid
+            for request in [stats.total] + list(stats.requests.values()):
+                self.connection.execute(
+                    'INSERT INTO run_requests (run_id, request, ok_histogram, ko_histogram) VALUES (?, ?, ?, ?)',
+                    (run_id, request.name, request.ok.to_bytes(), request.ko.to_bytes())
+                )
+            if stats.per_second:
+                start_second = min(stats.per_second)
+                counts, errors, p99 = array('I'), array('I'), array('I')
+                for second in range(start_second, max(stats.per_second) + 1):
+                    second_stats = stats.per_second.get(second)
+                    counts.append(second_stats.count if second_stats else 0)
+                    errors.append(second_stats.ko if second_stats else 0)
+                    p99.append((second_stats.histogram.percentile(99) or 0) if second_stats else 0)
+                self.connection.execute(
+                    'INSERT INTO run_series (run_id, start_second, counts, errors, p99) VALUES (?, ?, ?, ?, ?)',
+                    (run_id, start_second, counts.tobytes(), errors.tobytes(), p99.tobytes())
+                )
+        return run_id
+
+    def set_baseline(self, baseline_name, run_id):
+        """
+        Make run the reference of the named baseline, invalid runs (tagged valid=False) are rejected
+        """
+        row = self.connection.execute('SELECT tags FROM runs WHERE id = ?', (run_id,)).fetchone()
+        if row is None:
+            raise KeyError(f'Unknown run {run_id}')
+        if loads(row[0]).get('valid', True) is False:
+            raise ValueError(f'Run {run_id} is not valid and can not be a baseline')
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO baselines (name, run_id, created) VALUES (?, ?, ?)', (baseline_name, run_id, time())
+            )
+
+    def get_baseline_run_id(self, baseline_name):
+        """
+        :return: id of the latest valid run referenced by the named baseline or None
+        """
+        for run_id, run_tags in self.connection.execute(
+                'SELECT baselines.run_id, runs.tags FROM baselines JOIN runs ON runs.id = baselines.run_id '
+                'WHERE baselines.name = ? ORDER BY baselines.created DESC, baselines.rowid DESC', (baseline_name,)):
+            if loads(run_tags).get('valid', True) is not False:
+                return run_id
+        return None
+
+    def find_runs(self, name=None, **tags):
+        """
+        :return: ids of runs with the given name and tag values, oldest first
+        """
+        result = []
+        query = 'SELECT id, tags FROM runs'
+        params = ()
+        if name is not None:
+            query += ' WHERE name = ?'
+            params = (name,)
+        for run_id, run_tags in self.connection.execute(query + ' ORDER BY id', params):
+            run_tags = loads(run_tags)
+            if all(run_tags.get(tag) == value for tag, value in tags.items()):
+                result.append(run_id)
+        return result
+
+    def load_run(self, run_id):
+        row = self.connection.execute(
+            'SELECT id, name, simulation, created, duration_ms, tags FROM runs WHERE id = ?', (run_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        run = StoredRun(*row[:5], loads(row[5]))
+        for request, ok_data, ko_data in self.connection.execute(
+                'SELECT request, ok_histogram, ko_histogram FROM run_requests WHERE run_id = ?', (run_id,)):
+            run.requests[request] = (LatencyHistogram.from_bytes(ok_data)[0], LatencyHistogram.from_bytes(ko_data)[0])
+        series = self.connection.execute(
+            'SELECT start_second, counts, errors, p99 FROM run_series WHERE run_id = ?', (run_id,)
+        ).fetchone()
+        if series is not None:
+            run.start_second = series[0]
+            run.counts, run.errors, run.p99 = [_unpack_series(data) for data in series[1:]]
+        return run
+
+    def compare(self, run_id, baseline_name, alpha=0.01, min_change=0.05, trim_seconds=5):
+        """
+        Compare run against named baseline with one-sided Mann-Whitney U tests on distributions:
+        latencies of every request (from histograms) and per-second throughput.
+        A regression is reported when the test is significant and the median (latency) or mean (throughput)
+        changed for the worse by more than min_change.
+        :param run_id: compared run id
+        :param baseline_name: baseline name
+        :param alpha: significance level
+        :param min_change: min relative change worth reporting
+        :param trim_seconds: seconds cut from both ends of throughput time series (ramp up and down)
+        :return: list of Regression
+        """
+        baseline_run_id = self.get_baseline_run_id(baseline_name)
+        if baseline_run_id is None:
+            raise KeyError(f'Unknown baseline {baseline_name}')
+        baseline = self.load_run(baseline_run_id)
+        current = self.load_run(run_id)
+        regressions = []
+
+        for request, (current_ok, current_ko) in current.requests.items():
+            if request not in baseline.requests:
+                continue
+            baseline_ok, baseline_ko = baseline.requests[request]
+            if current_ok.count and baseline_ok.count:
+                p_value = mann_whitney_greater(current_ok.bucket_values(), baseline_ok.bucket_values())
+                baseline_p50, current_p50 = baseline_ok.percentile(50), current_ok.percentile(50)
+                if p_value < alpha and current_p50 > baseline_p50 * (1.0 + min_change):
+                    regressions.append(Regression(request, 'median latency, ms', baseline_p50, current_p50, p_value))
+            baseline_errors = _error_rate(baseline_ok, baseline_ko)
+            current_errors = _error_rate(current_ok, current_ko)
+            if current_errors > baseline_errors + min_change * max(baseline_errors, 0.01):
+                p_value = _proportions_greater(
+                    current_ko.count, current_ok.count + current_ko.count,
+                    baseline_ko.count, baseline_ok.count + baseline_ko.count,
+                )
+                if p_value < alpha:
+                    regressions.append(Regression(request, 'error rate', baseline_errors, current_errors, p_value))
+
+        current_tput = _trim(current.counts, trim_seconds)
+        baseline_tput = _trim(baseline.counts, trim_seconds)
+        if current_tput and baseline_tput:
+            p_value = mann_whitney_greater(_as_groups(baseline_tput), _as_groups(current_tput))
+            baseline_mean = sum(baseline_tput) / len(baseline_tput)
+            current_mean = sum(current_tput) / len(current_tput)
+            if p_value < alpha and current_mean < baseline_mean * (1.0 - min_change):
+                regressions.append(Regression(GLOBAL_STATS_NAME, 'throughput, req/s',
+                                              baseline_mean, current_mean, p_value))
+        return regressions
+
+
+def mann_whitney_greater(first, second):
+    """
+    One-sided Mann-Whitney U test with normal approximation and tie correction
+    on grouped samples
+    :param first: sorted list of (value, count)
+    :param second: sorted list of (value, count)
+    :return: p-value of hypothesis that values of the first sample tend to be greater
+    """
+    n1 = sum(count for _, count in first)
+    n2 = sum(count for _, count in second)
+    if not n1 or not n2:
+        return 1.0
+    groups = {}
+    for value, count in first:
+        groups.setdefault(value, [0, 0])[0] += count
+    for value, count in second:
+        groups.setdefault(value, [0, 0])[1] += count
+    rank = 0
+    rank_sum = 0.0
+    ties = 0.0
+    for value in sorted(groups):
+        count1, count2 = groups[value]
+        tied = count1 + count2
+        rank_sum += count1 * (rank + (tied + 1) / 2.0)
+        ties += tied ** 3 - tied
+        rank += tied
+    total = n1 + n2
+    u1 = rank_sum - n1 * (n1 + 1) / 2.0
+    mean = n1 * n2 / 2.0
+    variance = n1 * n2 / 12.0 * ((total + 1) - ties / (total * (total - 1))) if total > 1 else 0.0
+    if variance <= 0:
+        return 1.0
+    z = (u1 - mean - 0.5) / sqrt(variance)
+    return 0.5 * erfc(z / sqrt(2.0))
+
+
+def _proportions_greater(k1, n1, k2, n2):
+    if not n1 or not n2:
+        return 1.0
+    pooled = (k1 + k2) / (n1 + n2)
+    variance = pooled * (1 - pooled) * (1.0 / n1 + 1.0 / n2)
+    if variance <= 0:
+        return 1.0
+    z = (k1 / n1 - k2 / n2) / sqrt(variance)
+    return 0.5 * erfc(z / sqrt(2.0))
+
+
+def _error_rate(ok, ko):
+    total = ok.count + ko.count
+    return ko.count / total if total else 0.0
+
+
+def _unpack_series(data):
+    series = array('I')
+    series.frombytes(data)
+    return series.tolist()
+
+
+def _trim(series, trim_seconds):
+    if len(series) <= 2 * trim_seconds:
+        return list(series)
+    return list(series[trim_seconds:len(series) - trim_seconds])
+
+
+def _as_groups(values):
+    groups = {}
+    for value in values:
+        groups[value] = groups.get(value, 0) + 1
+    return sorted(groups.items())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from hashlib import sha1
+from io import BytesIO
+from os import makedirs, path, replace, stat
+from subprocess import run, PIPE, STDOUT
+from tarfile import TarFile, TarInfo
+from tempfile import mkdtemp
+from shutil import rmtree
+from time import time
+from zipfile import ZipFile
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+from tiden import TidenException
+
+from .injection import injection_arg
+
+TEMPLATES_DIR = path.join(path.dirname(path.abspath(__file__)), 'templates')
+SIMULATION_TEMPLATE = 'simulation.tmpl.scala'
+
+
+class HttpRequest:
+    """
+    Single HTTP request of generated simulation
+    """
+
+    def __init__(self, name, path='', method='GET', body=None, headers=None, status=200, checks=None, pause=None):
+        """
+        :param name: request name in reports
+        :param path: URL relative to base_url, Gatling EL (${feeder_key}) is allowed
+        :param method: HTTP method
+        :param body: request body string
+        :param headers: dict of request headers
+        :param status: expected HTTP status, None to skip status check
+        :param checks: list of Gatling check expressions in Scala, e.g. 'jsonPath("$.successStatus").is("0")'
+        :param pause: pause after request, seconds
+        """
+        self.name = name
+        self.path = path
+        self.method = method
+        self.body = body
+        self.headers = headers or {}
+        self.status = status
+        self.checks = checks or []
+        self.pause = pause
+
+
+class Feeder:
+    """
+    Feeder of generated simulation: inline records or CSV file at Gatling hosts
+    """
+
+    def __init__(self, records=None, csv=None, strategy='circular'):
+        """
+        :param records: list of dicts
+        :param csv: CSV file path
+        :param strategy: queue, random, shuffle or circular
+        """
+        self.records = records or []
+        self.csv = csv
+        self.strategy = strategy
+
+
+class SimulationSpec:
+    """
+    HTTP simulation declared from Python and rendered into Scala simulation class.
+
+    Generated simulation accepts the same scenario arguments as perftest.HttpLoadScenario (base_url, duration,
+    load_factor, load_throttle, injection, start_at), values given here are only defaults, so changing
+    load does not require recompilation.
+    """
+
+    package = 'generated'
+
+    def __init__(self, class_name, requests, base_url='http://localhost/', feeder=None, headers=None,
+                 injection=None, duration=60, load_factor=1, load_throttle=1, scenario_name=None):
+        """
+        :param class_name: simulation class name (without package)
+        :param requests: list of HttpRequest executed by every user
+        :param base_url: default base URL
+        :param feeder: Feeder
+        :param headers: dict of headers common for all requests
+        :param injection: default open model injection profile (InjectionProfile or list of phases)
+        :param duration: default closed model duration, seconds
+        :param load_factor: default closed model number of users
+        :param load_throttle: default closed model pace, seconds
+        :param scenario_name: scenario name in reports
+        """
+        self.class_name = class_name
+        self.requests = requests
+        self.base_url = base_url
+        self.feeder = feeder
+        self.headers = headers or {}
+        self.injection = injection_arg(injection) if injection is not None else ''
+        self.duration = int(duration)
+        self.load_factor = int(load_factor)
+        self.load_throttle = int(load_throttle)
+        self.scenario_name = scenario_name or class_name
+
+    @property
+    def full_name(self):
+        return f'{self.package}.{self.class_name}'
+
+    def render(self):
+        """
+        :return: Scala source of the simulation
+        """
+        environment = Environment(
+            loader=FileSystemLoader(TEMPLATES_DIR),
+            undefined=StrictUndefined,
+            keep_trailing_newline=True,
+        )
+        environment.filters['scala_string'] = scala_string
+        return environment.get_template(SIMULATION_TEMPLATE).render(spec=self)
+
+
+def scala_string(value):
+    """
+    :return: Scala string literal
+    """
+    value = str(value)
+    result = ['"']
+    for char in value:
+        if char == '"':
+            result.append('\\"')
+        elif char == '\\':
+            result.append('\\\\')
+        elif char == '\n':
+            result.append('\\n')
+        elif char == '\r':
+            result.append('\\r')
+        elif char == '\t':
+            result.append('\\t')
+        elif ord(char) < 0x20:
+            result.append(f'\\u{ord(char):04x}')
+        else:
+            result.append(char)
+    result.append('"')
+    return ''.join(result)
+
+
+class SimulationCompiler:
+    """
+    Compiles generated simulations into thin jars against Gatling dependency jar.
+
+    Only simulation sources are compiled (with Scala compiler from the dependency jar), thin jars are cached by
+    hash of the source and the dependency jar, so unchanged simulations are never recompiled.
+    """
+
+    default_cache_dir = '~/.tiden/gatling-simulations'
+
+    compiler_class = 'scala.tools.nsc.Main'
+
+    def __init__(self, dependency_jar, cache_dir=None, java='java', timeout=300):
+        """
+        :param dependency_jar: Gatling jar with dependencies (Gatling, Scala library and compiler)
+        :param cache_dir: thin jars cache directory
+        :param java: java executable
+        :param timeout: compilation timeout, seconds
+        """
+        self.dependency_jar = path.abspath(dependency_jar)
+        self.cache_dir = path.abspath(path.expanduser(cache_dir or self.default_cache_dir))
+        self.java = java
+        self.timeout = timeout
+        # seconds spent in the last compilation, None when the last simulation was taken from cache
+        self.compile_time = None
+        self._dependency_key = None
+
+    def _get_dependency_key(self):
+        if self._dependency_key is None:
+            jar_stat = stat(self.dependency_jar)
+            self._dependency_key = f'{self.dependency_jar}:{jar_stat.st_size}:{int(jar_stat.st_mtime)}'
+        return self._dependency_key
+
+    def get_key(self, source):
+        return sha1((self._get_dependency_key() + '\n' + source).encode('utf-8')).hexdigest()
+
+    def compile(self, spec):
+        """
+        :param spec: SimulationSpec
+        :return: tuple (thin jar path, cache key)
+        """
+        source = spec.render()
+        key = self.get_key(source)
+        jar_path = path.join(self.cache_dir, f'{spec.class_name}-{key[:16]}.jar')
+        self.compile_time = None
+        if path.isfile(jar_path):
+            return jar_path, key
+
+        makedirs(self.cache_dir, exist_ok=True)
+        work_dir = mkdtemp(prefix=f'{spec.class_name}-', dir=self.cache_dir)
+        try:
+            source_file = path.join(work_dir, f'{spec.class_name}.scala')
+            with open(source_file, 'w', encoding='utf-8') as file:
+                file.write(source)
+            compiled_jar = path.join(work_dir, 'simulation.jar')
+            started = time()
+            result = run(
+                [
+                    self.java, '-cp', self.dependency_jar, self.compiler_class,
+                    '-usejavacp', '-nowarn', '-d', compiled_jar, source_file,
+                ],
+                stdout=PIPE, stderr=STDOUT, cwd=work_dir, timeout=self.timeout,
+            )
+            if result.returncode != 0 or not path.isfile(compiled_jar):
+                raise TidenException(f"Can't compile simulation {spec.full_name}:\n"
+                                     f"{result.stdout.decode('utf-8', errors='replace')}")
+            replace(compiled_jar, jar_path)
+            # keep source next to the jar for troubleshooting
+            replace(source_file, jar_path[:-len('.jar')] + '.scala')
+            self.compile_time = time() - started
+        finally:
+            rmtree(work_dir, ignore_errors=True)
+        return jar_path, key
+
+
+def jar_to_tar(jar_path):
+    """
+    :return: uncompressed tar archive (bytes) with classes of the thin jar, for unpacking into Gatling binaries folder
+    """
+    data = BytesIO()
+    with ZipFile(jar_path) as jar, TarFile.open(fileobj=data, mode='w') as tar:
+        for entry in jar.infolist():
+            if entry.is_dir() or not entry.filename.endswith('.class'):
+                continue
+            content = jar.read(entry)
+            info = TarInfo(entry.filename)
+            info.size = len(content)
+            info.mtime = int(time())
+            tar.addfile(info, BytesIO(content))
+    return data.getvalue()
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from glob import glob
+from os import path
+
+from .aggregate import AGGREGATE_FILE_NAME, is_aggregate, read_aggregate, request_name_index, TAG_SECOND, \
+    TAG_USERS, TAG_ERROR, TAG_RUN as AGGREGATE_TAG_RUN
+from .histogram import LatencyHistogram
+from .record_stream import is_record_stream, read_record_stream, TAG_REQUEST, TAG_USER, TAG_RUN
+
+# read simulation logs by 4Mb chunks
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+DEFAULT_PERCENTILES = (50, 75, 95, 99)
+
+GLOBAL_STATS_NAME = 'Global Information'
+
+# name of time-ordered binary record stream produced by merging per-node simulation logs
+MERGED_RECORD_STREAM_NAME = 'simulation.bin'
+
+
+class RequestStats:
+    """
+    Counters and latency histograms of a single request name (or of all requests together)
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.ok = LatencyHistogram()
+        self.ko = LatencyHistogram()
+        self.first_start = None
+        self.last_end = None
+
+    def record(self, start, end, ok):
+        (self.ok if ok else self.ko).record(end - start)
+        if self.first_start is None or start < self.first_start:
+            self.first_start = start
+        if self.last_end is None or end > self.last_end:
+            self.last_end = end
+
+    def merge(self, other):
+        self.ok.merge(other.ok)
+        self.ko.merge(other.ko)
+        if other.first_start is not None and (self.first_start is None or other.first_start < self.first_start):
+            self.first_start = other.first_start
+        if other.last_end is not None and (self.last_end is None or other.last_end > self.last_end):
+            self.last_end = other.last_end
+        return self
+
+    @property
+    def all(self):
+        return LatencyHistogram(self.ok.sub_bucket_bits).merge(self.ok).merge(self.ko)
+
+    @property
+    def count(self):
+        return self.ok.count + self.ko.count
+
+    @property
+    def error_rate(self):
+        if not self.count:
+            return 0.0
+        return self.ko.count / self.count
+
+    def throughput(self, duration_ms):
+        """
+        :param duration_ms: run duration in milliseconds
+        :return: (total, ok, ko) mean requests per second
+        """
+        if not duration_ms:
+            return 0.0, 0.0, 0.0
+        seconds = duration_ms / 1000.0
+        return self.count / seconds, self.ok.count / seconds, self.ko.count / seconds
+
+    def as_dict(self, duration_ms, percentiles=DEFAULT_PERCENTILES):
+        def _hist_dict(hist):
+            return {
+                'count': hist.count,
+                'min': hist.min,
+                'max': hist.max,
+                'mean': hist.mean,
+                'stddev': hist.stddev,
+                'percentiles': hist.percentiles(percentiles),
+            }
+
+        total_rps, ok_rps, ko_rps = self.throughput(duration_ms)
+        return {
+            'name': self.name,
+            'count': self.count,
+            'error_rate': self.error_rate,
+            'throughput': {'all': total_rps, 'ok': ok_rps, 'ko': ko_rps},
+            'all': _hist_dict(self.all),
+            'ok': _hist_dict(self.ok),
+            'ko': _hist_dict(self.ko),
+        }
+
+
+class SecondStats:
+    """
+    Requests completed within one second: coarse latency histogram and number of failed requests
+    """
+
+    # ~3% precision is enough for time series while keeping per-second histograms small
+    sub_bucket_bits = 5
+
+    def __init__(self):
+        self.histogram = LatencyHistogram(self.sub_bucket_bits)
+        self.ko = 0
+
+    @property
+    def count(self):
+        return self.histogram.count
+
+    def record(self, latency, ok):
+        self.histogram.record(latency)
+        if not ok:
+            self.ko += 1
+
+    def merge(self, other):
+        self.histogram.merge(other.histogram)
+        self.ko += other.ko
+        return self
+
+    def record_histograms(self, ok, ko):
+        """
+        Add requests of finer latency histograms, each bucket is counted by its highest equivalent value
+        """
+        for histogram in (ok, ko):
+            for value, count in histogram.bucket_values():
+                self.histogram.record(value, count)
+        self.ko += ko.count
+
+
+class SimulationStats:
+    """
+    Aggregated statistics of a Gatling simulation run
+    """
+
+    def __init__(self, per_second=False):
+        """
+        :param per_second: also collect per-second time series of all requests (by request end second)
+        """
+        self.per_second = {} if per_second else None
+        self.simulation = None
+        self.run_start = None
+        self.requests = OrderedDict()
+        self.total = RequestStats(GLOBAL_STATS_NAME)
+        self.errors = OrderedDict()
+        self.users_started = 0
+        self.users_finished = 0
+
+    @property
+    def run_end(self):
+        return self.total.last_end
+
+    @property
+    def duration_ms(self):
+        start = self.run_start if self.run_start is not None else self.total.first_start
+        if start is None or self.run_end is None:
+            return 0
+        return max(1, self.run_end - start)
+
+    def get_request(self, name):
+        stats = self.requests.get(name)
+        if stats is None:
+            stats = RequestStats(name)
+            self.requests[name] = stats
+        return stats
+
+    def merge(self, other):
+        if self.simulation is None:
+            self.simulation = other.simulation
+        if other.run_start is not None and (self.run_start is None or other.run_start < self.run_start):
+            self.run_start = other.run_start
+        for name, request in other.requests.items():
+            self.get_request(name).merge(request)
+        self.total.merge(other.total)
+        for message, count in other.errors.items():
+            self.errors[message] = self.errors.get(message, 0) + count
+        self.users_started += other.users_started
+        self.users_finished += other.users_finished
+        if self.per_second is not None and other.per_second is not None:
+            for second, second_stats in other.per_second.items():
+                self.get_second(second).merge(second_stats)
+        return self
+
+    def get_second(self, second):
+        second_stats = self.per_second.get(second)
+        if second_stats is None:
+            second_stats = SecondStats()
+            self.per_second[second] = second_stats
+        return second_stats
+
+    def as_dict(self, percentiles=DEFAULT_PERCENTILES):
+        duration_ms = self.duration_ms
+        return {
+            'simulation': self.simulation,
+            'run_start': self.run_start,
+            'run_end': self.run_end,
+            'duration_ms': duration_ms,
+            'users': {'started': self.users_started, 'finished': self.users_finished},
+            'total': self.total.as_dict(duration_ms, percentiles),
+            'requests': OrderedDict(
+                (name, request.as_dict(duration_ms, percentiles)) for name, request in self.requests.items()
+            ),
+            'errors': OrderedDict(self.errors),
+        }
+
+    def to_lines(self, percentiles=DEFAULT_PERCENTILES):
+        """
+        Render statistics in a layout close to the Gatling console summary
+        :return: list of text lines
+        """
+        def _val(value, fmt='{:.0f}'):
+            return '-' if value is None else fmt.format(value)
+
+        def _row(title, all_value, ok_value, ko_value):
+            return f'> {title:<40} {all_value:>10} (OK={ok_value:<7} KO={ko_value:<7})'
+
+        def _section(title):
+            return f'---- {title} '.ljust(80, '-')
+
+        duration_ms = self.duration_ms
+        lines = []
+        for request in [self.total] + list(self.requests.values()):
+            all_hist = request.all
+            lines.append(_section(request.name))
+            lines.append(_row('request count', request.count, request.ok.count, request.ko.count))
+            for title, attr in (('min response time', 'min'), ('max response time', 'max'),
+                                ('mean response time', 'mean'), ('std deviation', 'stddev')):
+                lines.append(_row(
+                    title,
+                    _val(getattr(all_hist, attr)),
+                    _val(getattr(request.ok, attr)),
+                    _val(getattr(request.ko, attr))
+                ))
+            for percentile in percentiles:
+                lines.append(_row(
+                    f'response time {percentile}th percentile',
+                    _val(all_hist.percentile(percentile)),
+                    _val(request.ok.percentile(percentile)),
+                    _val(request.ko.percentile(percentile)),
+                ))
+            total_rps, ok_rps, ko_rps = request.throughput(duration_ms)
+            lines.append(_row(
+                'mean requests/sec',
+                _val(total_rps, '{:.2f}'),
+                _val(ok_rps, '{:.2f}'),
+                _val(ko_rps if request.ko.count else None, '{:.2f}'),
+            ))
+
+        count = self.total.count
+        lines.append(_section('Response Time Distribution'))
+        for title, low, high in (('t < 800 ms', 0, 800),
+                                 ('800 ms < t < 1200 ms', 800, 1200),
+                                 ('t > 1200 ms', 1200, None)):
+            value = self.total.ok.count_between(low, high)
+            lines.append(f'> {title:<40} {value:>10} ({_percent(value, count):>3}%)')
+        lines.append(f'> {"failed":<40} {self.total.ko.count:>10} ({_percent(self.total.ko.count, count):>3}%)')
+
+        if self.errors:
+            lines.append(_section('Errors'))
+            errors_count = sum(self.errors.values())
+            for message, value in sorted(self.errors.items(), key=lambda item: -item[1]):
+                lines.append(f'> {message:<60} {value:>8} ({100.0 * value / errors_count:5.2f}%)')
+        return lines
+
+
+def _percent(value, total):
+    if not total:
+        return 0
+    return int(round(100.0 * value / total))
+
+
+class SimulationLogParser:
+    """
+    Streaming parser of Gatling simulation.log files.
+
+    Data is consumed in chunks of bytes, only the incomplete tail line is kept between chunks,
+    so memory usage does not depend on the log size. Both Gatling 3.3 (with user id column)
+    and later (without user id column) record layouts are understood.
+    """
+
+    def __init__(self, stats=None, on_request=None, skip_seconds=0, first_request_start=None):
+        """
+        :param stats: SimulationStats to accumulate into, new one is created when None
+        :param on_request: optional callback(name, start, end, ok, message) called for each REQUEST record
+        :param skip_seconds: ignore requests started earlier than this number of seconds after the first request
+                             (e.g. warmup or ramp), throughput is then measured from the first counted request
+        :param first_request_start: start of the first request of all parsed logs (see find_first_request_start),
+                                    when None it is tracked while records are read, which is exact only when
+                                    records come in order of request start
+        """
+        self.stats = stats if stats is not None else SimulationStats()
+        self.on_request = on_request
+        self.skip_ms = int(skip_seconds * 1000)
+        self.first_request_start = first_request_start
+        self._tail = b''
+
+    def feed(self, data):
+        """
+        Consume next chunk of simulation log data
+        :param data: bytes
+        """
+        if not data:
+            return
+        lines = (self._tail + data).split(b'\n')
+        self._tail = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+
+    def flush(self):
+        """
+        Parse the incomplete line left after the last chunk, if any
+        """
+        if self._tail:
+            tail, self._tail = self._tail, b''
+            self._parse_line(tail)
+        return self.stats
+
+    def parse_file(self, file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        if is_record_stream(file_path):
+            return self.parse_record_stream(file_path)
+        if is_aggregate(file_path):
+            return self.parse_aggregate(file_path)
+        with open(file_path, 'rb') as file:
+            while True:
+                data = file.read(chunk_size)
+                if not data:
+                    break
+                self.feed(data)
+        return self.flush()
+
+    def parse_record_stream(self, file_path):
+        """
+        Consume merged binary record stream, see record_stream module
+        """
+        for record in read_record_stream(file_path):
+            tag = record[0]
+            if tag == TAG_REQUEST:
+                self._record_request(*record[2:])
+            elif tag == TAG_USER:
+                self._record_user(record[2])
+            elif tag == TAG_RUN:
+                self._record_run(record[3], record[2])
+        return self.stats
+
+    def parse_aggregate(self, file_path):
+        """
+        Consume simulation aggregates folded at Gatling node, see aggregate module.
+        Histograms are merged exactly, but skip_seconds is applied with one second precision by request end
+        and on_request is not called as there are no single requests in aggregates.
+        """
+        if self.skip_ms and self.first_request_start is None:
+            # skip window must be known before the first second is counted, so the file is read twice
+            self.first_request_start = find_first_request_start([file_path])
+        for record in read_aggregate(file_path):
+            tag = record[0]
+            if tag == TAG_SECOND:
+                second, name, first_start, last_end, ok, ko = record[1:]
+                if self.skip_ms and (second + 1) * 1000 <= self.first_request_start + self.skip_ms:
+                    continue
+                request = RequestStats(name)
+                request.ok, request.ko = ok, ko
+                request.first_start, request.last_end = first_start, last_end
+                self.stats.get_request(name).merge(request)
+                self.stats.total.merge(request)
+                if self.stats.per_second is not None:
+                    self.stats.get_second(second).record_histograms(ok, ko)
+            elif tag == TAG_USERS:
+                self.stats.users_started += record[1]
+                self.stats.users_finished += record[2]
+            elif tag == TAG_ERROR:
+                self.stats.errors[record[1]] = self.stats.errors.get(record[1], 0) + record[2]
+            elif tag == AGGREGATE_TAG_RUN:
+                self._record_run(record[2], record[1])
+        return self.stats
+
+    def _parse_line(self, line):
+        line = line.rstrip(b'\r')
+        if not line:
+            return
+        fields = line.decode('utf-8', errors='replace').split('\t')
+        record_type = fields[0]
+        if record_type == 'REQUEST':
+            name_idx = request_name_index(fields)
+            if name_idx is None:
+                return
+            start = _to_int(fields[name_idx + 1])
+            end = _to_int(fields[name_idx + 2])
+            if start is None or end is None:
+                return
+            message = fields[name_idx + 4] if len(fields) > name_idx + 4 else ''
+            self._record_request(fields[name_idx], start, end, fields[name_idx + 3] == 'OK', message)
+        elif record_type == 'USER':
+            if 'START' in fields:
+                self._record_user(True)
+            elif 'END' in fields:
+                self._record_user(False)
+        elif record_type == 'RUN':
+            if len(fields) > 3:
+                run_start = _to_int(fields[3])
+                if run_start is not None:
+                    self._record_run(fields[1], run_start)
+
+    def _record_run(self, simulation, run_start):
+        if self.stats.simulation is None:
+            self.stats.simulation = simulation
+        if self.skip_ms:
+            return
+        if self.stats.run_start is None or run_start < self.stats.run_start:
+            self.stats.run_start = run_start
+
+    def _record_user(self, started):
+        if started:
+            self.stats.users_started += 1
+        else:
+            self.stats.users_finished += 1
+
+    def _record_request(self, name, start, end, ok, message):
+        if self.skip_ms:
+            if self.first_request_start is None or start < self.first_request_start:
+                self.first_request_start = start
+            if start < self.first_request_start + self.skip_ms:
+                return
+        self.stats.get_request(name).record(start, end, ok)
+        self.stats.total.record(start, end, ok)
+        if self.stats.per_second is not None:
+            self.stats.get_second(end // 1000).record(end - start, ok)
+        if not ok:
+            message = message or 'unknown error'
+            self.stats.errors[message] = self.stats.errors.get(message, 0) + 1
+        if self.on_request is not None:
+            self.on_request(name, start, end, ok, message)
+
+
+def read_log_lines(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Read text log by chunks
+    :return: generator of non-empty lines (bytes, without line separator)
+    """
+    tail = b''
+    with open(file_path, 'rb') as file:
+        while True:
+            data = file.read(chunk_size)
+            if not data:
+                break
+            lines = (tail + data).split(b'\n')
+            tail = lines.pop()
+            for line in lines:
+                line = line.rstrip(b'\r')
+                if line:
+                    yield line
+    tail = tail.rstrip(b'\r')
+    if tail:
+        yield tail
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def find_first_request_start(files, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Scan simulation logs for the earliest request start, records of per-node logs are not ordered by start
+    :param files: list of simulation.log, record stream or aggregates file paths
+    :return: timestamp in milliseconds or None when there are no requests
+    """
+    first_start = None
+    for file_path in files:
+        if is_record_stream(file_path):
+            starts = (record[3] for record in read_record_stream(file_path) if record[0] == TAG_REQUEST)
+        elif is_aggregate(file_path):
+            starts = (record[3] for record in read_aggregate(file_path) if record[0] == TAG_SECOND)
+        else:
+            starts = _request_starts(file_path, chunk_size)
+        for start in starts:
+            if first_start is None or start < first_start:
+                first_start = start
+    return first_start
+
+
+def _request_starts(file_path, chunk_size):
+    for line in read_log_lines(file_path, chunk_size):
+        if not line.startswith(b'REQUEST'):
+            continue
+        fields = line.decode('utf-8', errors='replace').split('\t')
+        name_idx = request_name_index(fields)
+        if name_idx is not None:
+            start = _to_int(fields[name_idx + 1])
+            if start is not None:
+                yield start
+
+
+def find_simulation_logs(simulation_dir):
+    """
+    :return: merged record stream if present, otherwise sorted list of simulation log files
+             in the simulation directory, otherwise sorted list of simulation aggregates files
+    """
+    merged_stream = path.join(simulation_dir, MERGED_RECORD_STREAM_NAME)
+    if path.isfile(merged_stream):
+        return [merged_stream]
+    logs = sorted(glob(path.join(simulation_dir, '*simulation.log')))
+    if logs:
+        return logs
+    return sorted(glob(path.join(simulation_dir, f'*{AGGREGATE_FILE_NAME}')))
+
+
+def parse_simulation_logs(files, chunk_size=DEFAULT_CHUNK_SIZE, skip_seconds=0, per_second=False):
+    """
+    Parse one or more simulation.log files into single SimulationStats
+    :param files: file path or list of file paths
+    :param chunk_size: read buffer size
+    :param skip_seconds: ignore requests of first seconds of the run
+    :param per_second: collect per-second time series
+    :return: SimulationStats
+    """
+    if type(files) == type(''):
+        files = [files]
+    # requests are skipped relative to the first request of all files, so it is found before parsing
+    first_request_start = find_first_request_start(files, chunk_size) if skip_seconds else None
+    parser = SimulationLogParser(
+        SimulationStats(per_second=per_second), skip_seconds=skip_seconds, first_request_start=first_request_start
+    )
+    for file in files:
+        parser.parse_file(file, chunk_size=chunk_size)
+    return parser.stats
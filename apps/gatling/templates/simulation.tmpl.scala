@@ -0,0 +1,110 @@
+/*
+ * Copyright 2017-2020 GridGain Systems.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+// Generated by apps/gatling/simulation_builder.py, do not edit
+package {{ spec.package }}
+
+import io.gatling.core.Predef._
+import io.gatling.core.controller.inject.open.OpenInjectionStep
+import io.gatling.http.Predef._
+import io.gatling.http.protocol.HttpProtocolBuilder
+
+import scala.concurrent.duration._
+
+class {{ spec.class_name }} extends Simulation {
+
+  val base_url = System.getProperty("base_url", {{ spec.base_url | scala_string }})
+  val duration = Integer.getInteger("duration", {{ spec.duration }})
+  val load_factor = Integer.getInteger("load_factor", {{ spec.load_factor }})
+  val load_throttle = Integer.getInteger("load_throttle", {{ spec.load_throttle }})
+  // common injection start time (epoch millis) of all distributed load generators
+  val start_at = java.lang.Long.getLong("start_at", 0L)
+  val start_delay = math.max(0L, start_at - System.currentTimeMillis())
+  // open model injection profile, see apps/gatling/injection.py, closed model is used when empty
+  val injection = System.getProperty("injection", {{ spec.injection | scala_string }})
+
+  val httpProtocol: HttpProtocolBuilder = http
+    .baseUrl(base_url)
+    .acceptHeader("*/*")
+    .acceptEncodingHeader("gzip, deflate")
+{%- for name, value in spec.headers.items() %}
+    .header({{ name | scala_string }}, {{ value | scala_string }})
+{%- endfor %}
+    .disableFollowRedirect
+    .disableCaching
+{%- if spec.feeder %}
+
+  val feeder = {% if spec.feeder.csv %}csv({{ spec.feeder.csv | scala_string }}){% else %}Array(
+{%- for record in spec.feeder.records %}
+    Map({% for key, value in record.items() %}{{ key | scala_string }} -> {{ value | scala_string }}{% if not loop.last %}, {% endif %}{% endfor %}){% if not loop.last %},{% endif %}
+{%- endfor %}
+  ){% endif %}.{{ spec.feeder.strategy }}
+{%- endif %}
+
+  val requests =
+{%- if spec.feeder %}
+    feed(feeder)
+{%- endif %}
+{%- for request in spec.requests %}
+    {% if spec.feeder or not loop.first %}.{% endif %}exec(http({{ request.name | scala_string }})
+      .httpRequest({{ request.method | scala_string }}, {{ request.path | scala_string }})
+{%- for name, value in request.headers.items() %}
+      .header({{ name | scala_string }}, {{ value | scala_string }})
+{%- endfor %}
+{%- if request.body is not none %}
+      .body(StringBody({{ request.body | scala_string }}))
+{%- endif %}
+{%- if request.status is not none %}
+      .check(status.is({{ request.status }}))
+{%- endif %}
+{%- for check in request.checks %}
+      .check({{ check }})
+{%- endfor %}
+    )
+{%- if request.pause %}
+    .pause({{ (request.pause * 1000) | int }} milliseconds)
+{%- endif %}
+{%- endfor %}
+
+  val closedLoad = scenario({{ spec.scenario_name | scala_string }})
+    .forever(
+      pace(load_throttle seconds)
+        .exec(requests)
+    )
+
+  val openLoad = scenario({{ (spec.scenario_name ~ ' (open)') | scala_string }})
+    .exec(requests)
+
+  def phaseDuration(value: String): FiniteDuration = (value.toDouble * 1000).toLong milliseconds
+
+  def injectionSteps(profile: String): Seq[OpenInjectionStep] =
+    profile.split(",").toSeq.filter(_.nonEmpty).map(_.split(":") match {
+      case Array("constant", rate, during) => constantUsersPerSec(rate.toDouble).during(phaseDuration(during))
+      case Array("ramp", from, to, during) => rampUsersPerSec(from.toDouble).to(to.toDouble).during(phaseDuration(during))
+      case Array("nothing", during) => nothingFor(phaseDuration(during))
+      case Array("once", users) => atOnceUsers(users.toInt)
+      case phase => throw new IllegalArgumentException("Unknown injection phase: " + phase.mkString(":"))
+    })
+
+  val population =
+    if (injection.isEmpty)
+      closedLoad.inject(nothingFor(start_delay milliseconds), rampUsers(load_factor).during(duration seconds))
+    else
+      openLoad.inject(nothingFor(start_delay milliseconds) +: injectionSteps(injection))
+
+  setUp(population.protocols(httpProtocol))
+    .maxDuration(((duration + 5) seconds) + (start_delay milliseconds))
+}
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+from http.client import HTTPConnection, HTTPException
+from json import dumps, loads
+from math import isnan
+from struct import Struct
+from sys import byteorder
+from threading import Thread, Event, Lock
+from time import time, monotonic, thread_time
+from urllib.parse import quote
+
+from apps.gatling.histogram import LatencyHistogram
+
+# Columnar metrics file.
+#
+# File starts with MAGIC followed by blocks, one block per buffer flush:
+#   uint32 header length, utf-8 JSON header {"columns": [...], "rows": n, "nodes": [...]},
+#   then every column as n little endian float64 values.
+# Column 'node' holds index into the node list of the block header ('*' stands for cluster-wide values),
+# missing values are NaN.
+
+MAGIC = b'IGMC\x01'
+
+_HEADER_LENGTH = Struct('<I')
+
+CLUSTER_NODE = '*'
+
+
+class MetricsRingBuffer:
+    """
+    Fixed capacity columnar buffer of float samples. When full, the oldest rows are overwritten.
+    """
+
+    def __init__(self, columns, capacity=4096):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.data = [array('d', bytes(8 * capacity)) for _ in self.columns]
+        self.position = 0
+        self.size = 0
+        self.overwritten = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, row):
+        """
+        :param row: sequence of float values, one per column
+        """
+        for column, value in zip(self.data, row):
+            column[self.position] = value
+        self.position = (self.position + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.overwritten += 1
+
+    def drain(self):
+        """
+        Take all buffered rows out of the buffer
+        :return: list of column arrays, oldest row first
+        """
+        start = (self.position - self.size) % self.capacity
+        result = []
+        for column in self.data:
+            if start + self.size <= self.capacity:
+                result.append(column[start:start + self.size])
+            else:
+                result.append(column[start:] + column[:self.position])
+        self.size = 0
+        return result
+
+
+class MetricsFileWriter:
+    """
+    Appends ring buffer contents to a columnar metrics file
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = open(file_path, 'wb')
+        self.file.write(MAGIC)
+
+    def write_block(self, columns, data, nodes):
+        rows = len(data[0]) if data else 0
+        if not rows:
+            return
+        header = dumps({'columns': columns, 'rows': rows, 'nodes': nodes}).encode('utf-8')
+        self.file.write(_HEADER_LENGTH.pack(len(header)) + header)
+        for column in data:
+            if byteorder != 'little':
+                column = array('d', column)
+                column.byteswap()
+            self.file.write(column.tobytes())
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_metrics_file(file_path):
+    """
+    Read columnar metrics file
+    :return: dict column name -> list of values, 'node' column values are resolved to node ids
+    """
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f'{file_path} is not a metrics file')
+    result = {}
+    offset = len(MAGIC)
+    rows_before = 0
+    while offset < len(data):
+        header_length, = _HEADER_LENGTH.unpack_from(data, offset)
+        offset += _HEADER_LENGTH.size
+        header = loads(data[offset:offset + header_length].decode('utf-8'))
+        offset += header_length
+        rows = header['rows']
+        for name in header['columns']:
+            column = array('d')
+            column.frombytes(data[offset:offset + 8 * rows])
+            if byteorder != 'little':
+                column.byteswap()
+            offset += 8 * rows
+            values = column.tolist()
+            if name == 'node':
+                values = [header['nodes'][int(value)] for value in values]
+            else:
+                values = [None if isnan(value) else value for value in values]
+            # columns added by later blocks are padded for earlier rows
+            result.setdefault(name, [None] * rows_before).extend(values)
+        rows_before += rows
+        for values in result.values():
+            values.extend([None] * (rows_before - len(values)))
+    return result
+
+
+class _ConnectionPool:
+    """
+    Keep-alive HTTP connections to Ignite REST endpoints, one per endpoint
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.connections = {}
+
+    def get_json(self, endpoint, query):
+        connection = self.connections.get(endpoint)
+        if connection is None:
+            connection = HTTPConnection(endpoint[0], endpoint[1], timeout=self.timeout)
+            self.connections[endpoint] = connection
+        try:
+            connection.request('GET', '/ignite?' + query, headers={'Connection': 'keep-alive'})
+            response = connection.getresponse()
+            body = response.read()
+        except (HTTPException, OSError):
+            connection.close()
+            del self.connections[endpoint]
+            raise
+        if response.status != 200:
+            raise HTTPException(f'HTTP {response.status} from {endpoint[0]}:{endpoint[1]}')
+        result = loads(body.decode('utf-8'))
+        if result.get('successStatus', 0) != 0:
+            raise HTTPException(f'Ignite REST error from {endpoint[0]}:{endpoint[1]}: {result.get("error")}')
+        return result.get('response')
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.connections.clear()
+
+
+class RestMetricsSampler:
+    """
+    Background sampler of Ignite node metrics over REST.
+
+    Every interval node metrics of all cluster nodes (cmd=top&mtr=true) and sizes of given caches (cmd=size)
+    are requested over keep-alive connections, server REST endpoints are used in turn, so sampling
+    goes on when some node is down. Samples are kept in a ring buffer which is flushed to a columnar file
+    by the sampler thread when half full and on stop.
+
+    Overhead is bounded: single thread, one request in flight, request timeout below the interval,
+    ticks missed because of a slow round are skipped rather than caught up. Time and CPU spent in
+    sampling are measured, see overhead().
+    """
+
+    default_metrics = [
+        'heapMemoryUsed',
+        'nonHeapMemoryUsed',
+        'currentCpuLoad',
+        'currentGcCpuLoad',
+        'currentThreadCount',
+        'currentActiveJobs',
+        'currentWaitingJobs',
+        'averageJobWaitTime',
+        'outboundMessagesQueueSize',
+        'sentMessagesCount',
+        'receivedMessagesCount',
+    ]
+
+    def __init__(self, endpoints, file_path, interval=1.0, metrics=None, caches=None, capacity=3600, timeout=None):
+        """
+        :param endpoints: list of (host, REST port) of server nodes
+        :param file_path: columnar metrics file
+        :param interval: sampling interval, seconds
+        :param metrics: node metric names, default_metrics when not set
+        :param caches: names of caches to sample sizes of
+        :param capacity: ring buffer capacity, rows
+        :param timeout: REST request timeout, seconds, half of interval by default
+        """
+        self.endpoints = [(host, int(port)) for host, port in endpoints]
+        self.file_path = file_path
+        self.interval = interval
+        self.metrics = list(metrics or self.default_metrics)
+        self.caches = list(caches or [])
+        self.columns = ['time_ms', 'node'] + self.metrics + [f'cache.{cache}.size' for cache in self.caches]
+        self.buffer = MetricsRingBuffer(self.columns, capacity)
+        self.nodes = [CLUSTER_NODE]
+        self.pool = _ConnectionPool(timeout or max(0.1, interval / 2))
+        self.errors = 0
+        self.last_error = None
+        self.skipped = 0
+        # wall time of sampling rounds, microseconds
+        self.round_times = LatencyHistogram()
+        self.cpu_time = 0.0
+        self.started = None
+        self.stopped = None
+        self._next_endpoint = 0
+        self._writer = None
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name='ignite-metrics-sampler', daemon=True)
+
+    def start(self):
+        self._writer = MetricsFileWriter(self.file_path)
+        self.started = monotonic()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(max(5.0, 2 * self.interval))
+        self.stopped = monotonic()
+        self.pool.close()
+        if self._writer is not None:
+            self.flush()
+            self._writer.close()
+            self._writer = None
+
+    def flush(self):
+        with self._lock:
+            if self._writer is not None and len(self.buffer):
+                self._writer.write_block(self.columns, self.buffer.drain(), self.nodes)
+
+    def _run(self):
+        next_tick = monotonic()
+        while not self._stop.is_set():
+            round_start = monotonic()
+            cpu_start = thread_time()
+            self.sample()
+            if len(self.buffer) * 2 >= self.buffer.capacity:
+                self.flush()
+            self.cpu_time += thread_time() - cpu_start
+            self.round_times.record(int((monotonic() - round_start) * 1000000))
+
+            next_tick += self.interval
+            now = monotonic()
+            if next_tick < now:
+                missed = int((now - next_tick) / self.interval) + 1
+                self.skipped += missed
+                next_tick += missed * self.interval
+            self._stop.wait(next_tick - now)
+
+    def sample(self):
+        """
+        Run single sampling round
+        """
+        for attempt in range(len(self.endpoints)):
+            endpoint = self.endpoints[self._next_endpoint]
+            self._next_endpoint = (self._next_endpoint + 1) % len(self.endpoints)
+            try:
+                self._sample_endpoint(endpoint)
+                return True
+            except (HTTPException, OSError, ValueError) as e:
+                self.errors += 1
+                self.last_error = f'{endpoint[0]}:{endpoint[1]}: {e}'
+        return False
+
+    def _sample_endpoint(self, endpoint):
+        timestamp = time() * 1000.0
+        topology = self.pool.get_json(endpoint, 'cmd=top&mtr=true&attr=false')
+        cache_sizes = []
+        for cache in self.caches:
+            size = self.pool.get_json(endpoint, f'cmd=size&cacheName={quote(cache)}')
+            cache_sizes.append(float(size) if size is not None else float('nan'))
+
+        no_caches = [float('nan')] * len(self.caches)
+        with self._lock:
+            for node in topology or []:
+                metrics = node.get('metrics') or {}
+                self.buffer.append(
+                    [timestamp, self._node_index(node.get('nodeId'))] +
+                    [_to_float(metrics.get(metric)) for metric in self.metrics] +
+                    no_caches
+                )
+            if self.caches:
+                self.buffer.append([timestamp, 0] + [float('nan')] * len(self.metrics) + cache_sizes)
+
+    def _node_index(self, node_id):
+        try:
+            return self.nodes.index(node_id)
+        except ValueError:
+            self.nodes.append(node_id)
+            return len(self.nodes) - 1
+
+    def overhead(self):
+        """
+        :return: dict with number of rounds, skipped ticks, errors, round time percentiles (ms) and
+                 share of one CPU core used by the sampler thread
+        """
+        elapsed = (self.stopped or monotonic()) - self.started if self.started is not None else 0.0
+        return {
+            'rounds': self.round_times.count,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'overwritten': self.buffer.overwritten,
+            'round_ms': {
+                'mean': self.round_times.mean / 1000.0 if self.round_times.count else None,
+                'p99': self.round_times.percentile(99) / 1000.0 if self.round_times.count else None,
+                'max': self.round_times.max / 1000.0 if self.round_times.count else None,
+            },
+            'cpu_share': self.cpu_time / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def overhead_line(self):
+        overhead = self.overhead()
+        round_ms = overhead['round_ms']
+        if not overhead['rounds']:
+            return 'no samples'
+        return (f'{overhead["rounds"]} rounds, {overhead["skipped"]} skipped, {overhead["errors"]} errors, '
+                f'round mean {round_ms["mean"]:.1f} ms, p99 {round_ms["p99"]:.1f} ms, max {round_ms["max"]:.1f} ms, '
+                f'CPU {100.0 * overhead["cpu_share"]:.2f}% of one core')
+
+
+def _to_float(value):
+    if value is None:
+        return float('nan')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
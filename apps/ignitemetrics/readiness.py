@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http.client import HTTPException
+from time import monotonic, sleep
+
+from tiden import TidenException
+from tiden.util import log_print
+
+from .ignitemetrics import _ConnectionPool
+
+CLIENT_MODE_ATTRIBUTE = 'org.apache.ignite.cache.client'
+
+# Rebalance progress in Ignite node log: rebalancing is in progress while the last rebalance related
+# line of the log is one of REBALANCE_STARTED messages
+REBALANCE_STARTED = ('Rebalancing scheduled', 'Rebalancing started', 'Starting rebalance routine')
+REBALANCE_COMPLETED = ('Completed (final) rebalancing', 'Completed rebalance future', 'Skipping rebalancing')
+
+
+def rebalance_state_command(log_file):
+    """
+    :return: shell command printing the last rebalance related line of Ignite node log
+    """
+    patterns = '|'.join(message.replace('(', '\\(').replace(')', '\\)')
+                        for message in REBALANCE_STARTED + REBALANCE_COMPLETED)
+    return f"grep -E '{patterns}' {log_file} 2>/dev/null | tail -1"
+
+
+class ClusterReadiness:
+    """
+    Waits until Ignite cluster is ready for the test: topology has the expected number of server nodes,
+    cluster is active, caches are started on every server node and rebalance is finished.
+
+    Conditions are polled over REST (and node logs for rebalance) with exponential backoff, delay is reset
+    whenever cluster makes progress (another condition becomes the blocking one), so waiting ends shortly
+    after the cluster becomes ready instead of after a fixed sleep. Cluster is ready when all conditions
+    hold in stable_checks consecutive polls.
+    """
+
+    def __init__(self, ignite_app, servers=None, caches=None, active=True, rebalance=True, timeout=120,
+                 min_delay=0.1, max_delay=2.0, stable_checks=2):
+        """
+        :param ignite_app: Ignite application
+        :param servers: expected number of server nodes, all default nodes when not set
+        :param caches: names of caches to be started, when not set every server node must have the same caches
+        :param active: expected cluster state
+        :param rebalance: wait for rebalance to finish
+        :param timeout: deadline, seconds
+        :param min_delay: initial delay between polls, seconds
+        :param max_delay: max delay between polls, seconds
+        :param stable_checks: number of consecutive successful polls
+        """
+        self.ignite_app = ignite_app
+        self.server_nodes = {
+            node_idx: ignite_app.nodes[node_idx]
+            for node_idx in ignite_app.get_all_default_nodes()
+            if node_idx in ignite_app.nodes
+        }
+        self.servers = len(self.server_nodes) if servers is None else servers
+        self.caches = None if caches is None else set(caches)
+        self.active = active
+        self.rebalance = rebalance
+        self.timeout = timeout
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.stable_checks = stable_checks
+        self.endpoints = [
+            (node['host'], int(node['rest_port']))
+            for node in self.server_nodes.values()
+            if node.get('rest_port')
+        ]
+        self.polls = 0
+        self._pool = _ConnectionPool(timeout=max(1.0, max_delay))
+
+    def wait(self):
+        """
+        :return: seconds spent waiting
+        """
+        started = monotonic()
+        deadline = started + self.timeout
+        delay = self.min_delay
+        reason = None
+        passed = 0
+        try:
+            while True:
+                previous_reason = reason
+                reason = self.check()
+                passed = passed + 1 if reason is None else 0
+                if passed >= self.stable_checks:
+                    return monotonic() - started
+                if reason != previous_reason:
+                    delay = self.min_delay
+                now = monotonic()
+                if now >= deadline:
+                    raise TidenException(f'Ignite cluster is not ready in {self.timeout} seconds: {reason}')
+                sleep(min(delay, deadline - now))
+                delay = min(self.max_delay, delay * 2)
+        finally:
+            self._pool.close()
+
+    def check(self):
+        """
+        Poll cluster once
+        :return: None when cluster is ready, otherwise description of the first unmet condition
+        """
+        self.polls += 1
+        if not self.endpoints:
+            return 'no server nodes with REST port'
+        topology = None
+        for endpoint in self.endpoints:
+            try:
+                topology = self._pool.get_json(endpoint, 'cmd=top&attr=true&mtr=false')
+                state = self._get_state(endpoint)
+                break
+            except (HTTPException, OSError, ValueError) as e:
+                last_error = f'REST {endpoint[0]}:{endpoint[1]} is not available: {e}'
+        else:
+            return last_error
+
+        servers = [node for node in topology or [] if not _is_client(node)]
+        if len(servers) != self.servers:
+            return f'{len(servers)} of {self.servers} server nodes in topology'
+        if state != self.active:
+            return f'cluster is {"active" if state else "inactive"}'
+
+        if self.active:
+            node_caches = [_cache_names(node) for node in servers]
+            expected = self.caches if self.caches is not None else set().union(*node_caches)
+            for node, caches in zip(servers, node_caches):
+                missing = expected - caches
+                if missing:
+                    return f'caches {", ".join(sorted(missing))} are not started on node {node.get("nodeId")}'
+
+        if self.rebalance:
+            rebalancing = self._get_rebalancing_nodes()
+            if rebalancing:
+                return f'rebalance is in progress on nodes {", ".join(str(idx) for idx in rebalancing)}'
+        return None
+
+    def _get_state(self, endpoint):
+        try:
+            state = self._pool.get_json(endpoint, 'cmd=currentstate')
+        except HTTPException:
+            # newer Ignite versions replaced currentstate with state command
+            state = self._pool.get_json(endpoint, 'cmd=state')
+        if isinstance(state, str):
+            return 'ACTIVE' in state.upper() and 'INACTIVE' not in state.upper()
+        return bool(state)
+
+    def _get_rebalancing_nodes(self):
+        output = self.ignite_app.ssh.exec_at_nodes(
+            self.server_nodes,
+            lambda node_idx, node: rebalance_state_command(node['log'])
+        )
+        rebalancing = []
+        for node_idx, last_line in sorted(output.items()):
+            if isinstance(last_line, list):
+                last_line = '\n'.join(last_line)
+            if any(message in last_line for message in REBALANCE_STARTED):
+                rebalancing.append(node_idx)
+        return rebalancing
+
+
+def _is_client(node):
+    attributes = node.get('attributes') or {}
+    return str(attributes.get(CLIENT_MODE_ATTRIBUTE, 'false')).lower() == 'true'
+
+
+def _cache_names(node):
+    caches = node.get('caches') or []
+    if isinstance(caches, dict):
+        return set(caches.keys())
+    return {cache['name'] if isinstance(cache, dict) else cache for cache in caches}
+
+
+def wait_for_cluster_ready(ignite_app, **kwargs):
+    """
+    Wait until Ignite cluster is ready, see ClusterReadiness for arguments
+    :return: seconds spent waiting
+    """
+    readiness = ClusterReadiness(ignite_app, **kwargs)
+    elapsed = readiness.wait()
+    log_print(f'Ignite cluster is ready in {elapsed:.1f} seconds ({readiness.polls} polls)')
+    return elapsed
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from hashlib import sha1
+from http.client import HTTPException
+from json import dumps
+from urllib.parse import quote
+
+from tiden import TidenException
+from tiden.util import log_print
+
+from .ignitemetrics import _ConnectionPool
+from .readiness import ClusterReadiness, wait_for_cluster_ready
+
+
+class WarmCluster:
+    """
+    Keeps Ignite grid running between tests while its configuration is unchanged.
+
+    Configuration fingerprint is a hash of rendered server configs at node hosts, node JVM options and
+    the artifact. When a test acquires the cluster with the same fingerprint and the cluster is healthy,
+    its state is reset instead of restart: caches created by previous tests are destroyed and caches from
+    the configuration are cleared. Otherwise the grid is restarted.
+    """
+
+    def __init__(self, ignite_app, config_dir, health_timeout=30, ready_timeout=120):
+        """
+        :param ignite_app: Ignite application
+        :param config_dir: remote directory with rendered Ignite configs
+        :param health_timeout: timeout of health check of running cluster, seconds
+        :param ready_timeout: timeout of cluster readiness after start, seconds
+        """
+        self.ignite_app = ignite_app
+        self.config_dir = config_dir
+        self.health_timeout = health_timeout
+        self.ready_timeout = ready_timeout
+        self.fingerprint = None
+        # caches started from the configuration, they are cleared rather than destroyed
+        self.static_caches = set()
+        # remote test directory of the test which started the grid, node logs are there
+        self.test_dir = None
+        self.starts = 0
+        self.reuses = 0
+
+    @property
+    def running(self):
+        return self.fingerprint is not None
+
+    def get_fingerprint(self):
+        server_nodes = {
+            node_idx: self.ignite_app.nodes[node_idx] for node_idx in self.ignite_app.get_all_default_nodes()
+        }
+        output = self.ignite_app.ssh.exec_at_nodes(
+            server_nodes,
+            lambda node_idx, node: f"sha1sum {self.config_dir}/{node.get('config', '')} 2>/dev/null"
+        )
+        fingerprint = {
+            'configs': {
+                str(node_idx): ''.join(config_hash).split(' ')[0] if isinstance(config_hash, list)
+                else str(config_hash).split(' ')[0]
+                for node_idx, config_hash in output.items()
+            },
+            'nodes': {
+                str(node_idx): [node.get('host'), node.get('config'), node.get('jvm_options')]
+                for node_idx, node in server_nodes.items()
+            },
+            'artifact': self.ignite_app.config['artifacts'][self.ignite_app.name].get('path'),
+        }
+        return sha1(dumps(fingerprint, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def acquire(self):
+        """
+        Get the cluster ready for the next test
+        :return: True when running cluster was reused, False when the grid was (re)started
+        """
+        fingerprint = self.get_fingerprint()
+        if self.running:
+            if fingerprint != self.fingerprint:
+                log_print('Ignite configuration changed, restarting grid')
+            else:
+                try:
+                    ClusterReadiness(self.ignite_app, timeout=self.health_timeout).wait()
+                    self.reset()
+                    self.reuses += 1
+                    log_print(f'Reusing running Ignite grid ({self.reuses} times)')
+                    return True
+                except TidenException as e:
+                    log_print(f'Running Ignite grid is not healthy, restarting: {e}', color='red')
+            self.stop()
+
+        self.ignite_app.start_nodes()
+        self.ignite_app.cu.activate()
+        wait_for_cluster_ready(self.ignite_app, timeout=self.ready_timeout)
+        self.fingerprint = fingerprint
+        self.test_dir = self.ignite_app.remote_test_dir
+        self.static_caches = self.get_cache_names()
+        self.starts += 1
+        return False
+
+    def reset(self):
+        """
+        Destroy caches created since start and clear caches from configuration
+        """
+        caches = self.get_cache_names()
+        for cache in sorted(caches - self.static_caches):
+            self._rest(f'cmd=destcache&cacheName={quote(cache)}')
+        for cache in sorted(caches & self.static_caches):
+            self._rest(f'cmd=rmvall&cacheName={quote(cache)}')
+        missing = self.static_caches - caches
+        if missing:
+            raise TidenException(f'Caches {", ".join(sorted(missing))} of Ignite configuration are destroyed')
+        wait_for_cluster_ready(self.ignite_app, caches=self.static_caches, timeout=self.health_timeout)
+
+    def get_cache_names(self):
+        topology = self._rest('cmd=top&attr=false&mtr=false')
+        caches = set()
+        for node in topology or []:
+            node_caches = node.get('caches') or []
+            if isinstance(node_caches, dict):
+                caches.update(node_caches.keys())
+            else:
+                caches.update(cache['name'] if isinstance(cache, dict) else cache for cache in node_caches)
+        return caches
+
+    def _rest(self, query):
+        pool = _ConnectionPool(timeout=self.health_timeout)
+        last_error = None
+        try:
+            for node_idx in self.ignite_app.get_all_default_nodes():
+                node = self.ignite_app.nodes[node_idx]
+                if not node.get('rest_port'):
+                    continue
+                try:
+                    return pool.get_json((node['host'], int(node['rest_port'])), query)
+                except (HTTPException, OSError, ValueError) as e:
+                    last_error = e
+        finally:
+            pool.close()
+        raise TidenException(f'Ignite REST request {query} failed: {last_error}')
+
+    def stop(self):
+        if self.running:
+            self.ignite_app.stop_nodes(force=True)
+        self.fingerprint = None
+        self.static_caches = set()
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+from os import path
+from re import compile
+from time import localtime, strftime
+
+from apps.gatling.histogram import LatencyHistogram
+
+DEFAULT_PAUSE_PERCENTILES = (50, 90, 99, 100)
+
+# grid.<grid name>.gc.<node id>.<run counter>.log, see -Xloggc and -XX:LogFile in env_default.yaml
+_LOG_FILE_NAME = compile(r'^grid\.(.+)\.(gc|safepoint)\.(\d+)\.(\d+)\.log$')
+
+# 2020-03-10T12:34:56.789+0300: 12.345: ...
+_GC_STAMP = compile(r'^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}[+-]\d{4}): (\d+\.\d+): ')
+_GC_PAUSE = compile(r'\[(GC pause|GC remark|GC cleanup|Full GC)(?: \(([^)]*)\))?(?: \((young|mixed)\))?')
+_GC_PAUSE_TIME = compile(r', (\d+\.\d+) secs\]\s*$')
+_GC_EDEN = compile(r'\[Eden: ([\d.]+)([BKMG])\([^)]*\)->([\d.]+)([BKMG])')
+_GC_STOPPED = compile(
+    r'Total time for which application threads were stopped: (\d+\.\d+) seconds'
+    r'(?:, Stopping threads took: (\d+\.\d+) seconds)?'
+)
+
+# <hotspot_log version='160 1' process='12345' time_ms='1583833496789'>
+_SAFEPOINT_LOG_START = compile(r"<hotspot_log [^>]*time_ms='(\d+)'")
+#   12.345: G1IncCollectionPause  [ 45 0 0 ]  [ 0 0 0 0 12 ]  0
+_SAFEPOINT_STATS = compile(
+    r'^\s*(\d+\.\d+): (\S+)\s+\[\s*\d+\s+\d+\s+\d+\s*\]\s+'
+    r'\[\s*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s*\]'
+)
+
+_SIZE_UNITS = {'B': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+
+class JvmPause:
+    """
+    Single stop-the-world pause: GC pause or safepoint
+    """
+
+    __slots__ = ('start_ms', 'duration_us', 'kind', 'cause')
+
+    def __init__(self, start_ms, duration_us, kind, cause):
+        self.start_ms = start_ms
+        self.duration_us = duration_us
+        self.kind = kind
+        self.cause = cause
+
+    @property
+    def end_ms(self):
+        return self.start_ms + self.duration_us / 1000.0
+
+    def __str__(self):
+        return f'{self.cause} {self.duration_us / 1000.0:.1f} ms at {_format_time(self.start_ms)}'
+
+
+class NodePauses:
+    """
+    Pauses and allocations of a single JVM, timestamps are epoch milliseconds
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.jvm_start_ms = None
+        self.gc_pauses = []
+        self.safepoints = []
+        # (epoch ms, allocated bytes since previous GC)
+        self.allocations = []
+        self.first_ms = None
+        self.last_ms = None
+
+    def _seen(self, timestamp_ms):
+        if self.first_ms is None or timestamp_ms < self.first_ms:
+            self.first_ms = timestamp_ms
+        if self.last_ms is None or timestamp_ms > self.last_ms:
+            self.last_ms = timestamp_ms
+
+    def pauses(self, kind=None):
+        if kind == 'gc':
+            return self.gc_pauses
+        if kind == 'safepoint':
+            return self.safepoints
+        return self.gc_pauses + self.safepoints
+
+    def overlapping(self, start_ms, end_ms, kind=None):
+        """
+        :return: pauses which overlap [start_ms, end_ms)
+        """
+        return [pause for pause in self.pauses(kind) if pause.start_ms < end_ms and pause.end_ms > start_ms]
+
+    def pause_series(self, kind='safepoint'):
+        """
+        :return: dict epoch second -> milliseconds spent in pauses within that second
+        """
+        series = {}
+        for pause in self.pauses(kind):
+            start, end = pause.start_ms, pause.end_ms
+            while start < end:
+                second = int(start // 1000)
+                chunk_end = min(end, (second + 1) * 1000)
+                series[second] = series.get(second, 0.0) + chunk_end - start
+                start = chunk_end
+        return series
+
+    def pause_histogram(self, kind, start_ms=None, end_ms=None):
+        """
+        :return: LatencyHistogram of pause durations in microseconds
+        """
+        histogram = LatencyHistogram()
+        for pause in self.pauses(kind):
+            if _in_window(pause.start_ms, start_ms, end_ms):
+                histogram.record(pause.duration_us)
+        return histogram
+
+    def allocation_rate(self, start_ms=None, end_ms=None):
+        """
+        :return: mean allocation rate within the window, bytes per second, or None when unknown
+        """
+        allocations = [(timestamp, size) for timestamp, size in self.allocations
+                       if _in_window(timestamp, start_ms, end_ms)]
+        if not allocations:
+            return None
+        window_start = start_ms if start_ms is not None else (self.jvm_start_ms or self.first_ms)
+        window_end = allocations[-1][0] if end_ms is None else min(end_ms, max(allocations[-1][0], window_start))
+        if window_start is None or window_end <= window_start:
+            return None
+        return sum(size for _, size in allocations) * 1000.0 / (window_end - window_start)
+
+    def as_dict(self, start_ms=None, end_ms=None, percentiles=DEFAULT_PAUSE_PERCENTILES):
+        result = {'node': self.node, 'allocation_rate': self.allocation_rate(start_ms, end_ms)}
+        for kind in ('gc', 'safepoint'):
+            histogram = self.pause_histogram(kind, start_ms, end_ms)
+            result[kind] = {
+                'count': histogram.count,
+                'total_ms': histogram.total / 1000.0,
+                'percentiles_ms': {
+                    str(percentile): _us_to_ms(value)
+                    for percentile, value in histogram.percentiles(percentiles).items()
+                },
+            }
+        return result
+
+
+class GcLogParser:
+    """
+    Streaming parser of JDK 8 G1 GC log written with -XX:+PrintGCDetails -XX:+PrintGCDateStamps
+    -XX:+PrintGCTimeStamps -XX:+PrintGCApplicationStoppedTime.
+
+    Collects GC pauses (young, mixed, remark, cleanup and full), application stopped times
+    (all safepoints) and the amount of memory allocated in eden between GCs.
+    """
+
+    def __init__(self, pauses):
+        """
+        :param pauses: NodePauses to fill
+        """
+        self.pauses = pauses
+        self.stopped = []
+        self._eden_after = None
+
+    def parse_file(self, file_path):
+        with open(file_path, encoding='utf-8', errors='replace') as file:
+            for line in file:
+                self.parse_line(line)
+        return self
+
+    def parse_line(self, line):
+        stamp = _GC_STAMP.match(line)
+        if stamp is not None:
+            timestamp_ms = _parse_date_stamp(stamp.group(1))
+            if self.pauses.jvm_start_ms is None:
+                self.pauses.jvm_start_ms = timestamp_ms - int(float(stamp.group(2)) * 1000)
+            self.pauses._seen(timestamp_ms)
+
+            stopped = _GC_STOPPED.search(line, stamp.end())
+            if stopped is not None:
+                # stopped time is printed when safepoint ends
+                duration_us = int(float(stopped.group(1)) * 1000000)
+                self.stopped.append(JvmPause(timestamp_ms - duration_us / 1000.0, duration_us, 'safepoint', 'stopped'))
+                return
+
+            pause = _GC_PAUSE.search(line, stamp.end())
+            if pause is not None:
+                pause_time = _GC_PAUSE_TIME.search(line)
+                if pause_time is not None:
+                    cause = pause.group(1) + ''.join(f' ({item})' for item in pause.groups()[1:] if item)
+                    self.pauses.gc_pauses.append(
+                        JvmPause(timestamp_ms, int(float(pause_time.group(1)) * 1000000), 'gc', cause)
+                    )
+            return
+
+        eden = _GC_EDEN.search(line)
+        if eden is not None and self.pauses.gc_pauses:
+            eden_before = _parse_size(eden.group(1), eden.group(2))
+            allocated = eden_before - (self._eden_after or 0)
+            if allocated > 0:
+                self.pauses.allocations.append((self.pauses.gc_pauses[-1].start_ms, allocated))
+            self._eden_after = _parse_size(eden.group(3), eden.group(4))
+
+
+class SafepointLogParser:
+    """
+    Streaming parser of -XX:+PrintSafepointStatistics output in JVM log file (-XX:LogFile).
+
+    Safepoint timestamps are JVM uptime, converted to epoch with the log start time or
+    with the JVM start time known from the GC log.
+    """
+
+    def __init__(self, pauses):
+        self.pauses = pauses
+        self.safepoints = []
+
+    def parse_file(self, file_path):
+        with open(file_path, encoding='utf-8', errors='replace') as file:
+            for line in file:
+                self.parse_line(line)
+        return self
+
+    def parse_line(self, line):
+        stats = _SAFEPOINT_STATS.match(line)
+        if stats is not None:
+            if self.pauses.jvm_start_ms is None:
+                return
+            operation = stats.group(2)
+            spin, block, sync, cleanup, vmop = [int(value) for value in stats.groups()[2:]]
+            start_ms = self.pauses.jvm_start_ms + int(float(stats.group(1)) * 1000)
+            self.safepoints.append(JvmPause(start_ms, (sync + cleanup + vmop) * 1000, 'safepoint', operation))
+            self.pauses._seen(start_ms)
+            return
+        if self.pauses.jvm_start_ms is None:
+            log_start = _SAFEPOINT_LOG_START.search(line)
+            if log_start is not None:
+                self.pauses.jvm_start_ms = int(log_start.group(1))
+
+
+def parse_jvm_logs(files):
+    """
+    Parse GC and safepoint logs of Ignite nodes, files are grouped into JVMs by their names
+    (grid.<grid>.gc.<node>.<run>.log, grid.<grid>.safepoint.<node>.<run>.log).
+    Safepoints are taken from safepoint log when it has statistics (operation names are known),
+    otherwise from application stopped times of GC log.
+    :param files: list of local file paths
+    :return: dict node name -> NodePauses
+    """
+    jvms = {}
+    for file in files:
+        name = _LOG_FILE_NAME.match(path.basename(file))
+        if name is None:
+            continue
+        grid, log_type, node_id, run_counter = name.groups()
+        jvms.setdefault(f'{grid}.{node_id}.{run_counter}', {})[log_type] = file
+
+    result = {}
+    for node, logs in sorted(jvms.items()):
+        pauses = NodePauses(node)
+        stopped = []
+        if 'gc' in logs:
+            stopped = GcLogParser(pauses).parse_file(logs['gc']).stopped
+        safepoints = []
+        if 'safepoint' in logs:
+            safepoints = SafepointLogParser(pauses).parse_file(logs['safepoint']).safepoints
+        pauses.safepoints = safepoints or stopped
+        result[node] = pauses
+    return result
+
+
+class LatencySpike:
+    """
+    Second of the load timeline with abnormally high latency and JVM pauses which could have caused it
+    """
+
+    def __init__(self, second, p99, max_latency, count, pauses):
+        self.second = second
+        self.p99 = p99
+        self.max = max_latency
+        self.count = count
+        # list of (node, JvmPause)
+        self.pauses = pauses
+
+    def __str__(self):
+        line = f'{_format_time(self.second * 1000)} p99 {self.p99} ms, max {self.max} ms, {self.count} requests'
+        if not self.pauses:
+            return line + ': no JVM pauses'
+        return line + ': ' + '; '.join(f'{node} {pause}' for node, pause in self.pauses)
+
+
+class JvmPauseReport:
+    """
+    GC and safepoint pauses of Ignite nodes aligned with Gatling per-second latency time series.
+
+    A second is a latency spike when its p99 is at least spike_ratio times the median per-second p99
+    and not less than min_latency. Pauses overlapping a spike are pauses which intersect
+    [second start - max latency of the second - slack, second end + slack]: only they could
+    delay requests completed within that second.
+    """
+
+    def __init__(self, nodes, per_second, spike_ratio=3.0, min_latency=20, slack_ms=200, start_ms=None,
+                 end_ms=None):
+        """
+        :param nodes: dict node name -> NodePauses
+        :param per_second: SimulationStats.per_second, dict epoch second -> SecondStats
+        :param spike_ratio: min ratio of spike p99 to median p99
+        :param min_latency: min spike p99, ms
+        :param slack_ms: allowed clock difference between Gatling and Ignite hosts, ms
+        :param start_ms: start of the simulation, pauses before it are not reported (logs of a node running
+                         across several simulations), by default the first second of per_second
+        :param end_ms: end of the simulation, by default the end of the last second of per_second
+        """
+        self.nodes = nodes
+        self.per_second = per_second or {}
+        if start_ms is None and self.per_second:
+            start_ms = min(self.per_second) * 1000
+        if end_ms is None and self.per_second:
+            end_ms = (max(self.per_second) + 1) * 1000
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        p99s = sorted(stats.histogram.percentile(99) for stats in self.per_second.values() if stats.count)
+        self.median_p99 = p99s[len(p99s) // 2] if p99s else None
+        self.spike_threshold = max(min_latency, spike_ratio * self.median_p99) if p99s else None
+        self.spikes = self._find_spikes(slack_ms)
+
+    def _find_spikes(self, slack_ms):
+        spikes = []
+        if self.spike_threshold is None:
+            return spikes
+        for second in sorted(self.per_second):
+            stats = self.per_second[second]
+            p99 = stats.histogram.percentile(99)
+            if p99 is None or p99 < self.spike_threshold:
+                continue
+            max_latency = stats.histogram.max
+            window_start = second * 1000 - max_latency - slack_ms
+            window_end = (second + 1) * 1000 + slack_ms
+            pauses = []
+            for node, node_pauses in sorted(self.nodes.items()):
+                for pause in node_pauses.overlapping(window_start, window_end):
+                    pauses.append((node, pause))
+            pauses.sort(key=lambda item: -item[1].duration_us)
+            spikes.append(LatencySpike(second, p99, max_latency, stats.count, pauses))
+        return spikes
+
+    @property
+    def explained_spikes(self):
+        return [spike for spike in self.spikes if spike.pauses]
+
+    def as_dict(self):
+        return {
+            'start_ms': self.start_ms,
+            'end_ms': self.end_ms,
+            'median_p99': self.median_p99,
+            'spike_threshold': self.spike_threshold,
+            'nodes': [pauses.as_dict(self.start_ms, self.end_ms) for _, pauses in sorted(self.nodes.items())],
+            'spikes': [
+                {
+                    'second': spike.second,
+                    'p99': spike.p99,
+                    'max': spike.max,
+                    'count': spike.count,
+                    'pauses': [
+                        {
+                            'node': node,
+                            'kind': pause.kind,
+                            'cause': pause.cause,
+                            'start_ms': pause.start_ms,
+                            'duration_ms': pause.duration_us / 1000.0,
+                        }
+                        for node, pause in spike.pauses
+                    ],
+                }
+                for spike in self.spikes
+            ],
+        }
+
+    def to_lines(self, max_pauses=3):
+        lines = []
+        for node, pauses in sorted(self.nodes.items()):
+            stats = pauses.as_dict(self.start_ms, self.end_ms)
+            allocation_rate = stats['allocation_rate']
+            allocation = f'{allocation_rate / (1 << 20):.1f} MB/s' if allocation_rate is not None else '-'
+            lines.append(f'{node}: allocation rate {allocation}')
+            for kind in ('gc', 'safepoint'):
+                kind_stats = stats[kind]
+                percentiles = ', '.join(
+                    f'p{percentile} {_format_ms(value)}' if percentile != '100' else f'max {_format_ms(value)}'
+                    for percentile, value in kind_stats['percentiles_ms'].items()
+                )
+                lines.append(f'  {kind:<9} {kind_stats["count"]:>6} pauses, total {kind_stats["total_ms"]:.1f} ms'
+                             + (f', {percentiles}' if kind_stats['count'] else ''))
+        if self.spike_threshold is None:
+            lines.append('No per-second latency time series')
+            return lines
+        lines.append(f'Latency spikes (p99 >= {self.spike_threshold:.0f} ms, median p99 {self.median_p99} ms): '
+                     f'{len(self.spikes)}, overlapping JVM pauses: {len(self.explained_spikes)}')
+        for spike in self.spikes:
+            shown = LatencySpike(spike.second, spike.p99, spike.max, spike.count, spike.pauses[:max_pauses])
+            lines.append(f'  {shown}' + (f' (+{len(spike.pauses) - max_pauses} more)'
+                                         if len(spike.pauses) > max_pauses else ''))
+        return lines
+
+
+def _parse_date_stamp(value):
+    return int(datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f%z').timestamp() * 1000)
+
+
+def _parse_size(value, unit):
+    return int(float(value) * _SIZE_UNITS[unit])
+
+
+def _in_window(timestamp, start_ms, end_ms):
+    return (start_ms is None or timestamp >= start_ms) and (end_ms is None or timestamp < end_ms)
+
+
+def _us_to_ms(value):
+    return value / 1000.0 if value is not None else None
+
+
+def _format_ms(value):
+    return f'{value:.1f} ms' if value is not None else '-'
+
+
+def _format_time(timestamp_ms):
+    return strftime('%H:%M:%S', localtime(timestamp_ms / 1000.0)) + f'.{int(timestamp_ms) % 1000:03d}'
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+from re import compile
+from threading import Thread, Event, Lock
+
+# header printed by tail when it switches between followed files
+_HEADER = compile(r'^==> (.+) <==$')
+
+# tail message about a file which appeared or was replaced, its lines follow without header
+_APPEARED = compile(r"^tail: ['\u2018](.+)['\u2019] has (?:appeared|been replaced)")
+
+
+class RemoteTail:
+    """
+    Runs `tail -F`-like command at remote host in background thread and passes received data to callback
+    """
+
+    def __init__(self, ssh_client, command, on_data, name=None):
+        self.ssh_client = ssh_client
+        self.command = command
+        self.on_data = on_data
+        self.name = name or command
+        self.channel = None
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, name=f'tail-{self.name}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        # pty makes remote tail die together with the channel
+        _, stdout, _ = self.ssh_client.exec_command(self.command, get_pty=True)
+        self.channel = stdout.channel
+        while not self._stopped.is_set():
+            try:
+                data = self.channel.recv(65536)
+            except (OSError, EOFError):
+                break
+            if not data:
+                break
+            self.on_data(data)
+
+    def stop(self, timeout=5):
+        self._stopped.set()
+        if self.channel is not None:
+            self.channel.close()
+        self._thread.join(timeout)
+
+
+class LogWaiter:
+    """
+    Waits for a pattern to appear in every one of given log files
+    """
+
+    def __init__(self, pattern, files):
+        self.pattern = pattern
+        self.files = set(files)
+        # file -> first matching line
+        self.matched = {}
+        self.callbacks = []
+        self._done = Event()
+
+    def match(self, file, line):
+        if file not in self.files or file in self.matched or not _matches(self.pattern, line):
+            return False
+        self.matched[file] = line
+        if len(self.matched) == len(self.files):
+            self._done.set()
+            for callback in self.callbacks:
+                callback(self)
+        return True
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def pending_files(self):
+        return sorted(self.files - set(self.matched))
+
+    def add_callback(self, callback):
+        """
+        :param callback: callable(LogWaiter) called once the pattern is found in all files
+        """
+        self.callbacks.append(callback)
+        if self.done:
+            callback(self)
+
+    def wait(self, timeout=None):
+        """
+        :return: True when the pattern was found in all files
+        """
+        return self._done.wait(timeout)
+
+
+def _matches(pattern, line):
+    if isinstance(pattern, str):
+        return pattern in line
+    return pattern.search(line) is not None
+
+
+class _HostStream:
+    """
+    Demultiplexes output of single `tail -F` of several files at a host into lines per file
+    """
+
+    def __init__(self, host, files, on_line):
+        self.host = host
+        self.files = list(files)
+        self.on_line = on_line
+        self.current_file = self.files[0] if len(self.files) == 1 else None
+        self.buffer = b''
+        # tail separates header from previous file output with an empty line, it is held until the next line
+        self.empty_line = False
+
+    def feed(self, data):
+        lines = (self.buffer + data).split(b'\n')
+        self.buffer = lines.pop()
+        for raw_line in lines:
+            line = raw_line.decode('utf-8', errors='replace').rstrip('\r')
+            header = _HEADER.match(line) or _APPEARED.match(line)
+            if header and header.group(1) in self.files:
+                self.current_file = header.group(1)
+                self.empty_line = False
+                continue
+            if self.current_file is None or line.startswith('tail: '):
+                continue
+            if self.empty_line:
+                self.on_line(self.current_file, '')
+            self.empty_line = not line
+            if line:
+                self.on_line(self.current_file, line)
+
+
+class LogFollower:
+    """
+    Follows remote log files with a single long-lived `tail -F` channel per host and matches lines
+    against registered waiters and subscriptions as soon as they arrive.
+
+    Recent lines of every file are kept, so a waiter registered after its line arrived is resolved
+    immediately. Adding files of a host restarts its channel, lines already seen are skipped.
+    """
+
+    def __init__(self, ssh_clients, history_lines=10000):
+        """
+        :param ssh_clients: dict host -> paramiko SSHClient
+        :param history_lines: number of recent lines kept per file
+        """
+        self.ssh_clients = ssh_clients
+        self.history_lines = history_lines
+        self.host_files = {}
+        self.tails = {}
+        self.history = {}
+        self.lines_seen = {}
+        self.waiters = []
+        self.subscriptions = []
+        self._skip = {}
+        self._lock = Lock()
+
+    def follow(self, host, files):
+        """
+        Start following files at host, files which don't exist yet are followed as soon as they appear
+        """
+        with self._lock:
+            host_files = self.host_files.setdefault(host, [])
+            new_files = [file for file in files if file not in host_files]
+            if not new_files:
+                return
+            host_files.extend(new_files)
+            for file in new_files:
+                self.history.setdefault(file, deque(maxlen=self.history_lines))
+                self.lines_seen.setdefault(file, 0)
+            tail = self.tails.pop(host, None)
+        if tail is not None:
+            tail.stop()
+        with self._lock:
+            # restarted tail prints followed files from the beginning again
+            for file in host_files:
+                self._skip[file] = self.lines_seen[file]
+        files_arg = ' '.join(f"'{file}'" for file in host_files)
+        stream = _HostStream(host, host_files, self._on_line)
+        self.tails[host] = RemoteTail(
+            self.ssh_clients[host], f'tail -F -n +1 {files_arg} 2>&1', stream.feed, f'logs-{host}'
+        ).start()
+
+    def follow_nodes(self, nodes, log_key='log'):
+        """
+        Follow logs of application nodes
+        :param nodes: dict node_idx -> node with 'host' and log file path
+        :return: list of followed files
+        """
+        host_files = {}
+        for node in nodes.values():
+            host_files.setdefault(node['host'], []).append(node[log_key])
+        for host, files in host_files.items():
+            self.follow(host, files)
+        return [file for files in host_files.values() for file in files]
+
+    def _on_line(self, file, line):
+        with self._lock:
+            if self._skip.get(file):
+                self._skip[file] -= 1
+                return
+            self.lines_seen[file] += 1
+            self.history[file].append(line)
+            waiters = list(self.waiters)
+            subscriptions = list(self.subscriptions)
+        for waiter in waiters:
+            if waiter.match(file, line) and waiter.done:
+                with self._lock:
+                    if waiter in self.waiters:
+                        self.waiters.remove(waiter)
+        for pattern, files, callback in subscriptions:
+            if (files is None or file in files) and _matches(pattern, line):
+                callback(file, line)
+
+    def expect(self, pattern, files):
+        """
+        :param pattern: substring or compiled regular expression
+        :param files: log files the pattern must appear in, each of them
+        :return: LogWaiter
+        """
+        waiter = LogWaiter(pattern, files)
+        with self._lock:
+            self.waiters.append(waiter)
+            history = {file: list(self.history.get(file, ())) for file in waiter.files}
+        # lines received from now on are matched by _on_line
+        for file, lines in history.items():
+            for line in lines:
+                if waiter.match(file, line):
+                    break
+        if waiter.done:
+            with self._lock:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+        return waiter
+
+    def subscribe(self, pattern, callback, files=None):
+        """
+        Call callback(file, line) for every new line matching pattern
+        :param files: log files to match lines of, all followed files when not set
+        """
+        with self._lock:
+            self.subscriptions.append((pattern, set(files) if files is not None else None, callback))
+
+    def last_line(self, file, pattern):
+        """
+        :return: the last received line of file matching pattern or None
+        """
+        with self._lock:
+            for line in reversed(self.history.get(file, ())):
+                if _matches(pattern, line):
+                    return line
+        return None
+
+    def stop(self):
+        for tail in self.tails.values():
+            tail.stop()
+        self.tails.clear()
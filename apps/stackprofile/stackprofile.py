@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from bisect import bisect_right
+from html import escape, unescape
+from re import compile
+from sys import intern
+
+_SVG_FRAME = compile(
+    r'<title>([^<]*)</title>\s*<rect x="([-\d.]+)" y="([-\d.]+)" width="([\d.]+)"'
+)
+_SVG_TITLE = compile(r'^(.*) \(([\d,]+) samples?(?:, [\d.]+%)?\)$')
+
+
+class _Frame:
+    __slots__ = ('total', 'self', 'children')
+
+    def __init__(self):
+        self.total = 0
+        self.self = 0
+        self.children = {}
+
+
+class StackProfile:
+    """
+    Weighted call stack profile kept as a prefix tree of frames.
+
+    Collapsed stack files ("frame1;frame2;frame3 samples" per line) are read line by line, common
+    stack prefixes are shared, so memory depends on the number of distinct frames, not the file size.
+    """
+
+    def __init__(self):
+        self.root = _Frame()
+
+    @property
+    def total(self):
+        return self.root.total
+
+    def add_stack(self, frames, count):
+        if count <= 0:
+            return
+        node = self.root
+        node.total += count
+        for name in frames:
+            child = node.children.get(name)
+            if child is None:
+                child = _Frame()
+                node.children[intern(name)] = child
+            child.total += count
+            node = child
+        node.self += count
+
+    def read_collapsed(self, file_path):
+        """
+        Add stacks from collapsed stacks file
+        :return: self
+        """
+        with open(file_path, encoding='utf-8', errors='replace') as file:
+            for line in file:
+                line = line.rstrip('\n')
+                stack, _, count = line.rpartition(' ')
+                if not stack or not count.isdigit():
+                    continue
+                self.add_stack(stack.split(';'), int(count))
+        return self
+
+    def merge(self, other):
+        """
+        Add all samples of other profile
+        :return: self
+        """
+        def _merge(target, source):
+            target.total += source.total
+            target.self += source.self
+            for name, source_child in source.children.items():
+                target_child = target.children.get(name)
+                if target_child is None:
+                    target_child = _Frame()
+                    target.children[name] = target_child
+                _merge(target_child, source_child)
+
+        _merge(self.root, other.root)
+        return self
+
+    def iter_stacks(self):
+        """
+        :return: generator of (list of frames, self samples)
+        """
+        stack = [(self.root, [])]
+        while stack:
+            node, frames = stack.pop()
+            if node.self and frames:
+                yield frames, node.self
+            for name, child in node.children.items():
+                stack.append((child, frames + [name]))
+
+    def write_collapsed(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as file:
+            for frames, count in self.iter_stacks():
+                file.write(';'.join(frames) + ' ' + str(count) + '\n')
+
+    def find(self, frames):
+        node = self.root
+        for name in frames:
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def hot_frames(self):
+        """
+        Aggregate samples by frame name: self samples and total samples of stacks containing the frame
+        (recursive frames are counted once per stack)
+        :return: dict of frame name -> [self, total]
+        """
+        result = {}
+        stack = [(self.root, None, frozenset())]
+        while stack:
+            node, name, on_path = stack.pop()
+            if name is not None:
+                frame = result.get(name)
+                if frame is None:
+                    frame = [0, 0]
+                    result[name] = frame
+                frame[0] += node.self
+                if name not in on_path:
+                    frame[1] += node.total
+                    on_path = on_path | {name}
+            for child_name, child in node.children.items():
+                stack.append((child, child_name, on_path))
+        return result
+
+    def top_frames(self, limit=20, by='self'):
+        """
+        :param limit: number of frames
+        :param by: 'self' or 'total'
+        :return: list of (frame name, self samples, total samples)
+        """
+        key = 0 if by == 'self' else 1
+        frames = sorted(self.hot_frames().items(), key=lambda item: -item[1][key])
+        return [(name, values[0], values[1]) for name, values in frames[:limit]]
+
+    def top_frames_lines(self, limit=20, by='self'):
+        total = self.total or 1
+        lines = [f'{"self":>8} {"self%":>7} {"total":>8} {"total%":>7}  frame']
+        for name, self_samples, total_samples in self.top_frames(limit, by):
+            lines.append(f'{self_samples:>8} {100.0 * self_samples / total:>6.2f}% '
+                         f'{total_samples:>8} {100.0 * total_samples / total:>6.2f}%  {name}')
+        return lines
+
+
+def read_flamegraph_svg(file_path):
+    """
+    Restore stack profile from flame graph SVG produced by async profiler (or FlameGraph.pl):
+    frame sample counts are taken from frame titles, call tree is rebuilt from frame positions
+    :return: StackProfile
+    """
+    with open(file_path, encoding='utf-8', errors='replace') as file:
+        data = file.read()
+    levels = {}
+    for match in _SVG_FRAME.finditer(data):
+        title = _SVG_TITLE.match(unescape(match.group(1)))
+        if title is None:
+            continue
+        levels.setdefault(float(match.group(3)), []).append((
+            float(match.group(2)), float(match.group(4)), title.group(1), int(title.group(2).replace(',', ''))
+        ))
+    profile = StackProfile()
+    if not levels:
+        return profile
+
+    ys = sorted(levels)
+    # root level is the widest one, either at the bottom (flame graph) or at the top (icicle graph)
+    if sum(frame[3] for frame in levels[ys[-1]]) >= sum(frame[3] for frame in levels[ys[0]]):
+        ys.reverse()
+
+    frames = {}
+    parents = None
+    for y in ys:
+        level = sorted(levels[y])
+        level_frames = []
+        for x, width, name, samples in level:
+            if parents is None:
+                path = (name,)
+            else:
+                parent_n = bisect_right(parents[0], x + width / 2) - 1
+                if parent_n < 0:
+                    continue
+                parent_path = parents[1][parent_n]
+                path = parent_path + (name,)
+                frames[parent_path][1] -= samples
+            frames[path] = [samples, samples]
+            level_frames.append((x, path))
+        parents = ([x for x, _ in level_frames], [path for _, path in level_frames])
+
+    roots = [path for path in frames if len(path) == 1]
+    skip_root = len(roots) == 1 and roots[0][0] == 'all'
+    for path, (_, self_samples) in frames.items():
+        if skip_root:
+            path = path[1:]
+        if path and self_samples > 0:
+            profile.add_stack(path, self_samples)
+    return profile
+
+
+def render_flamegraph(profile, file_path, title='Flame Graph', baseline=None, width=1200, frame_height=16,
+                      min_width=0.2):
+    """
+    Render profile into flame graph SVG. When baseline profile is given, frames are colored by the change
+    of their share of samples: red - grew against baseline, blue - shrunk.
+    """
+    total = profile.total
+    if not total:
+        return
+    scale = (width - 20) / total
+    baseline_total = baseline.total if baseline is not None and baseline.total else None
+
+    # collect visible frames: (depth, x, width, name, node, baseline node)
+    visible = []
+    max_depth = 0
+    stack = [(profile.root, baseline.root if baseline_total else None, 0, 10.0)]
+    while stack:
+        node, base_node, depth, x = stack.pop()
+        for name, child in node.children.items():
+            child_width = child.total * scale
+            if child_width >= min_width:
+                base_child = base_node.children.get(name) if base_node is not None else None
+                visible.append((depth, x, child_width, name, child, base_child))
+                max_depth = max(max_depth, depth)
+                stack.append((child, base_child, depth + 1, x))
+            x += child_width
+
+    max_delta = 0.0
+    deltas = []
+    for depth, x, frame_width, name, node, base_node in visible:
+        delta = None
+        if baseline_total:
+            delta = node.total / total - (base_node.total / baseline_total if base_node is not None else 0.0)
+            max_delta = max(max_delta, abs(delta))
+        deltas.append(delta)
+
+    height = (max_depth + 1) * frame_height + 60
+    lines = [
+        '<?xml version="1.0" standalone="no"?>',
+        f'<svg version="1.1" width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">',
+        '<style>text { font-family: monospace; font-size: 11px; }</style>',
+        f'<rect x="0" y="0" width="{width}" height="{height}" fill="#f8f8f8"/>',
+        f'<text x="{width // 2}" y="24" text-anchor="middle" style="font-size:16px">{escape(title)}</text>',
+    ]
+    for (depth, x, frame_width, name, node, base_node), delta in zip(visible, deltas):
+        y = height - 20 - (depth + 1) * frame_height
+        percent = 100.0 * node.total / total
+        if delta is None:
+            fill = _flame_color(name)
+            label = f'{name} ({node.total} samples, {percent:.2f}%)'
+        else:
+            fill = _diff_color(delta, max_delta)
+            label = f'{name} ({node.total} samples, {percent:.2f}%, {100.0 * delta:+.2f}%)'
+        lines.append(
+            f'<g><title>{escape(label)}</title>'
+            f'<rect x="{x:.2f}" y="{y}" width="{frame_width:.2f}" height="{frame_height - 1}" fill="{fill}"/>'
+        )
+        chars = int(frame_width / 7)
+        if chars >= 3:
+            text = name if len(name) <= chars else name[:chars - 2] + '..'
+            lines.append(f'<text x="{x + 3:.1f}" y="{y + frame_height - 4}">{escape(text)}</text>')
+        lines.append('</g>')
+    lines.append('</svg>')
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+def _flame_color(name):
+    seed = sum(ord(char) for char in name[:16])
+    return f'rgb({205 + seed % 50},{(seed * 7) % 180 + 50},{(seed * 13) % 55})'
+
+
+def _diff_color(delta, max_delta):
+    if not max_delta:
+        return 'rgb(220,220,220)'
+    intensity = int(200 * min(1.0, abs(delta) / max_delta))
+    if delta > 0:
+        return f'rgb(255,{220 - intensity},{220 - intensity})'
+    return f'rgb({220 - intensity},{220 - intensity},255)'
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from tiden.tidenplugin import TidenPlugin
+from tiden.tidenfabric import TidenFabric
+from tiden.util import log_print
+from tiden import TidenException
+
+from fnmatch import fnmatch
+from json import load, dump
+from multiprocessing.dummy import Pool as ThreadPool
+from os import makedirs, replace
+from os.path import join, exists, dirname, getsize
+from time import time
+from zlib import decompressobj, MAX_WBITS
+
+TIDEN_PLUGIN_VERSION = '1.0.0'
+
+# name of the per-host manifest of collected files, kept in the local host directory
+MANIFEST_FILE_NAME = '.tiden-collector-manifest.json'
+
+# separates head and tail of files truncated by size cap
+TRUNCATION_MARKER = '\n\n... {skipped} bytes skipped by log collector ...\n\n'
+
+# max number of byte ranges fetched by single remote command
+MAX_RANGES_PER_COMMAND = 256
+
+
+def parse_size(size):
+    """
+    :param size: number of bytes or string with K, M or G suffix, e.g. '256M'
+    :return: number of bytes
+    """
+    if isinstance(size, int):
+        return size
+    size = str(size).strip().upper()
+    for suffix, multiplier in (('K', 1024), ('M', 1024 ** 2), ('G', 1024 ** 3)):
+        if size.endswith(suffix):
+            return int(float(size[:-1]) * multiplier)
+    return int(size)
+
+
+class FileRange:
+    """
+    Byte range of remote file to fetch
+    """
+
+    __slots__ = ('rel_path', 'start', 'length')
+
+    def __init__(self, rel_path, start, length):
+        self.rel_path = rel_path
+        self.start = start
+        self.length = length
+
+
+class HostCollector:
+    """
+    Collects files of remote directory of single host into local directory incrementally.
+
+    The manifest remembers inode and collected size of every file: new files are fetched completely,
+    appended files only from the collected size, files with another inode or smaller size (rotated
+    or rewritten) are fetched again. Files larger than max_file_size are kept as head and tail halves,
+    the tail is moved forward locally and only bytes appended since the previous collection are fetched.
+    All ranges are fetched by a single remote command as a gzip stream.
+    """
+
+    def __init__(self, host, ssh_client, remote_dir, local_dir, include=('*',), exclude=(), max_file_size=None):
+        self.host = host
+        self.ssh_client = ssh_client
+        self.remote_dir = remote_dir
+        self.local_dir = local_dir
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.max_file_size = max_file_size
+        self.manifest_path = join(local_dir, MANIFEST_FILE_NAME)
+        self.manifest = self._load_manifest()
+        self.wire_bytes = 0
+
+    def _load_manifest(self):
+        if not exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path) as file:
+                return load(file)
+        except ValueError:
+            return {}
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            dump(self.manifest, file)
+        replace(tmp_path, self.manifest_path)
+
+    def _exec(self, command):
+        stdin, stdout, stderr = self.ssh_client.exec_command(command)
+        stdin.close()
+        return stdout, stderr
+
+    def list_files(self):
+        """
+        :return: dict path relative to remote directory -> (inode, size) of files matching masks
+        """
+        stdout, _ = self._exec(f"cd {self.remote_dir} 2>/dev/null && find . -type f -printf '%i %s %P\\n'")
+        files = {}
+        for line in stdout.read().decode('utf-8', errors='replace').splitlines():
+            fields = line.split(' ', 2)
+            if len(fields) != 3 or not fields[0].isdigit() or not fields[1].isdigit():
+                continue
+            rel_path = fields[2]
+            if MANIFEST_FILE_NAME in rel_path:
+                continue
+            if not any(fnmatch(rel_path, mask) for mask in self.include):
+                continue
+            if any(fnmatch(rel_path, mask) for mask in self.exclude):
+                continue
+            files[rel_path] = (int(fields[0]), int(fields[1]))
+        return files
+
+    def plan(self, files):
+        """
+        :return: list of (rel_path, inode, size, list of FileRange, capped, head length kept from local file,
+                 (offset, length) of tail bytes kept from local file or None)
+        """
+        plan = []
+        for rel_path, (inode, size) in sorted(files.items()):
+            known = self.manifest.get(rel_path)
+            same_file = known is not None and known[0] == inode and known[1] <= size
+            collected = known[1] if same_file else 0
+            if same_file and collected == size:
+                continue
+            if self.max_file_size is None or size <= self.max_file_size:
+                ranges = [FileRange(rel_path, collected, size - collected)]
+                plan.append((rel_path, inode, size, ranges, False, 0, None))
+                continue
+            half = self.max_file_size // 2
+            tail_start = size - half
+            local_path = join(self.local_dir, rel_path)
+            # local copy ends with the last collected byte whether it was capped or not
+            local_size = getsize(local_path) if same_file and exists(local_path) else None
+            ranges = []
+            keep_head = half if local_size is not None and collected >= half else 0
+            if not keep_head:
+                ranges.append(FileRange(rel_path, 0, half))
+            keep_tail = None
+            fetch_start = tail_start
+            if local_size is not None and collected > tail_start and local_size >= collected - tail_start:
+                keep_tail = (local_size - (collected - tail_start), collected - tail_start)
+                fetch_start = collected
+            ranges.append(FileRange(rel_path, fetch_start, size - fetch_start))
+            plan.append((rel_path, inode, size, ranges, True, keep_head, keep_tail))
+        return plan
+
+    def fetch_command(self, ranges):
+        parts = []
+        for file_range in ranges:
+            file_path = file_range.rel_path.replace("'", "'\\''")
+            # ranges are padded with zeros when file shrinks meanwhile, so the stream keeps exact framing
+            parts.append(
+                f"{{ tail -c +{file_range.start + 1} '{file_path}' 2>/dev/null | head -c {file_range.length}; "
+                f"head -c {file_range.length} /dev/zero; }} | head -c {file_range.length}"
+            )
+        return f"cd {self.remote_dir} && {{ {'; '.join(parts)}; }} | gzip -1 -c"
+
+    def fetch(self, ranges):
+        """
+        Stream ranges of remote files
+        :return: generator of (FileRange, data chunk), compressed bytes are counted in self.wire_bytes
+        """
+        stdout, stderr = self._exec(self.fetch_command(ranges))
+        decompressor = decompressobj(16 + MAX_WBITS)
+        range_iter = iter(ranges)
+        current = next(range_iter, None)
+        left = current.length if current else 0
+        while True:
+            compressed = stdout.read(1024 * 1024)
+            if not compressed:
+                break
+            self.wire_bytes += len(compressed)
+            data = decompressor.decompress(compressed)
+            while data and current is not None:
+                chunk, data = data[:left], data[left:]
+                left -= len(chunk)
+                yield current, chunk
+                while current is not None and left == 0:
+                    current = next(range_iter, None)
+                    left = current.length if current else 0
+        if current is not None:
+            raise TidenException(f"Can't collect files from {self.host}:{self.remote_dir}: "
+                                 f"{stderr.read().decode('utf-8', errors='replace').strip() or 'stream ended'}")
+
+    def collect(self):
+        """
+        :return: dict with numbers of collected and unchanged files, collected and transferred bytes
+        """
+        started = time()
+        self.wire_bytes = 0
+        files = self.list_files()
+        plan = self.plan(files)
+        collected_bytes = 0
+        for batch_start in range(0, len(plan), MAX_RANGES_PER_COMMAND):
+            batch = plan[batch_start:batch_start + MAX_RANGES_PER_COMMAND]
+            writers = {}
+            for rel_path, inode, size, file_ranges, capped, keep_head, keep_tail in batch:
+                skipped = size - 2 * (self.max_file_size // 2) if capped else 0
+                writer = _LocalFileWriter(
+                    join(self.local_dir, rel_path), file_ranges, capped, keep_head, keep_tail, skipped
+                )
+                for file_range in file_ranges:
+                    writers[id(file_range)] = writer
+            ranges = [file_range for _, _, _, file_ranges, _, _, _ in batch for file_range in file_ranges]
+            try:
+                for file_range, chunk in self.fetch(ranges):
+                    writers[id(file_range)].write(file_range, chunk)
+                    collected_bytes += len(chunk)
+            finally:
+                for writer in set(writers.values()):
+                    writer.close()
+            for rel_path, inode, size, _, _, _, _ in batch:
+                self.manifest[rel_path] = [inode, size]
+        # files removed at remote side are forgotten, local copies are kept
+        for rel_path in list(self.manifest):
+            if rel_path not in files:
+                del self.manifest[rel_path]
+        self._save_manifest()
+        return {
+            'files': len(plan),
+            'unchanged': len(files) - len(plan),
+            'bytes': collected_bytes,
+            'wire_bytes': self.wire_bytes,
+            'seconds': time() - started,
+        }
+
+
+def _copy_bytes(source, target, length):
+    while length > 0:
+        data = source.read(min(length, 1024 * 1024))
+        if not data:
+            break
+        target.write(data)
+        length -= len(data)
+
+
+class _LocalFileWriter:
+    """
+    Writes fetched ranges of single remote file into its local copy: appended ranges in place,
+    files above size cap as head, truncation marker and tail (kept local part followed by fetched part)
+    into a new file
+    """
+
+    def __init__(self, local_path, file_ranges, capped, keep_head, keep_tail, skipped):
+        self.local_path = local_path
+        self.capped = capped
+        self.keep_head = keep_head
+        self.keep_tail = keep_tail
+        self.skipped = skipped
+        self.tail_range = file_ranges[-1]
+        self.file = None
+        self.marker_written = False
+        makedirs(dirname(local_path), exist_ok=True)
+
+    def _open(self):
+        if not self.capped:
+            start = self.tail_range.start
+            self.file = open(self.local_path, 'r+b' if start and exists(self.local_path) else 'wb')
+            self.file.seek(start)
+            return
+        self.file = open(self.local_path + '.tmp', 'wb')
+        if self.keep_head:
+            with open(self.local_path, 'rb') as file:
+                self.file.write(file.read(self.keep_head))
+
+    def _write_marker(self):
+        self.file.write(TRUNCATION_MARKER.format(skipped=self.skipped).encode('utf-8'))
+        if self.keep_tail is not None:
+            offset, length = self.keep_tail
+            with open(self.local_path, 'rb') as file:
+                file.seek(offset)
+                _copy_bytes(file, self.file, length)
+        self.marker_written = True
+
+    def write(self, file_range, chunk):
+        if self.file is None:
+            self._open()
+        if self.capped and file_range is self.tail_range and not self.marker_written:
+            self._write_marker()
+        self.file.write(chunk)
+
+    def close(self):
+        if self.file is None:
+            return
+        if not self.capped:
+            self.file.truncate()
+            self.file.close()
+            return
+        if not self.marker_written:
+            self._write_marker()
+        self.file.close()
+        replace(self.local_path + '.tmp', self.local_path)
+
+
+class IncrementalLogCollector(TidenPlugin):
+    """
+    Collects remote test directories of all hosts after every test method (or class) incrementally,
+    in parallel over hosts. Replaces zipping and downloading the whole directory every time.
+    """
+
+    scope = 'method'
+    max_file_size = '256M'
+    include = ['*']
+    exclude = ['*.jar', '*.zip', '*.tar.gz']
+
+    def __init__(self, *args, **kwargs):
+        TidenPlugin.__init__(self, *args, **kwargs)
+        self.scope = self.options.get('scope', self.scope)
+        self.max_file_size = parse_size(self.options.get('max_file_size', self.max_file_size))
+        self.include = self.options.get('include', self.include)
+        self.exclude = self.options.get('exclude', self.exclude)
+        self.collectors = {}
+
+    def after_test_method_teardown(self, *args, **kwargs):
+        if self.scope == 'method':
+            self.collect()
+
+    def after_test_class_teardown(self, *args, **kwargs):
+        if self.scope == 'class':
+            self.collect()
+
+    def get_hosts(self):
+        environment = self.config['environment']
+        hosts = []
+        for host in (environment.get('server_hosts') or []) + (environment.get('client_hosts') or []):
+            if host not in hosts:
+                hosts.append(host)
+        return hosts
+
+    @staticmethod
+    def _get_ssh_client(host):
+        """
+        :return: connection of tiden ssh pool to the host, the same apps use
+        """
+        ssh_client = TidenFabric().getSshPool().clients.get(host)
+        if ssh_client is None:
+            raise TidenException(f'No ssh connection to {host} in tiden ssh pool')
+        return ssh_client
+
+    def _get_collector(self, host):
+        remote_dir = self.config['rt']['remote']['test_module_dir']
+        local_dir = join(self.options.get('local_dir', self.config['suite_var_dir']), 'remote', host)
+        collector = self.collectors.get(host)
+        if collector is not None:
+            # ssh pool may have reconnected since the last collection
+            collector.ssh_client = self._get_ssh_client(host)
+        if collector is None or collector.remote_dir != remote_dir or collector.local_dir != local_dir:
+            makedirs(local_dir, exist_ok=True)
+            collector = HostCollector(
+                host,
+                self._get_ssh_client(host),
+                remote_dir,
+                local_dir,
+                include=self.include,
+                exclude=self.exclude,
+                max_file_size=self.max_file_size,
+            )
+            self.collectors[host] = collector
+        return collector
+
+    def collect(self):
+        hosts = self.get_hosts()
+        if not hosts:
+            return
+
+        def _collect(host):
+            try:
+                return host, self._get_collector(host).collect()
+            except Exception as e:
+                return host, e
+
+        pool = ThreadPool(len(hosts))
+        results = pool.map(_collect, hosts)
+        pool.close()
+        pool.join()
+        for host, result in results:
+            if isinstance(result, Exception):
+                log_print(f"Can't collect logs from {host}: {result}", color='red')
+                continue
+            log_print(f"Collected {result['files']} changed files ({result['bytes']} bytes, "
+                      f"{result['wire_bytes']} transferred) from {host} in {result['seconds']:.1f} sec, "
+                      f"{result['unchanged']} unchanged")
@@ -18,23 +18,264 @@ from tiden.tidenplugin import TidenPlugin
 from tiden.util import log_print
 from tiden import TidenException
 
-from os import system, getcwd, chdir, unlink, walk
-from os.path import dirname, abspath, join, basename, getmtime
+from os import unlink, walk, stat, replace, killpg, link, listdir, makedirs, rename, utime, getpid
+from os.path import dirname, abspath, join, basename, relpath, exists, getsize, isdir, expanduser
+from shlex import split
+from shutil import get_terminal_size, copy2, rmtree
+from signal import SIGTERM
+from subprocess import Popen, DEVNULL, STDOUT
+from sys import stdout
+from time import time, sleep
 from datetime import datetime
+from fnmatch import fnmatch
 from glob import glob
-from re import match
+from hashlib import sha1
+from json import load, dump
+from re import compile
 
 TIDEN_PLUGIN_VERSION = '1.0.0'
 
 
+# name of the source manifest file stored next to built artifact jars
+MANIFEST_FILE_NAME = '.tiden-mvn-manifest.json'
+
+
+class SourceFilter:
+    """
+    Decides which files and directories of the build path are sources.
+
+    ignore_files is either a regular expression matched against file and directory names,
+    or a list of glob patterns: patterns with '/' are matched against path relative to build path
+    (e.g. 'src/test/*', 'target/'), other patterns against file and directory names (e.g. '*.log').
+    """
+
+    def __init__(self, ignore_files):
+        self.regex = None
+        self.name_globs = []
+        self.path_globs = []
+        if isinstance(ignore_files, str):
+            self.regex = compile(ignore_files)
+        else:
+            for pattern in ignore_files:
+                if '/' in pattern:
+                    self.path_globs.append(pattern.rstrip('/'))
+                else:
+                    self.name_globs.append(pattern)
+
+    def is_ignored(self, rel_path, name):
+        if self.regex is not None and self.regex.match(name):
+            return True
+        for pattern in self.name_globs:
+            if fnmatch(name, pattern):
+                return True
+        for pattern in self.path_globs:
+            if fnmatch(rel_path, pattern):
+                return True
+        return False
+
+
+def parse_size(size):
+    """
+    :param size: number of bytes or string with K, M or G suffix, e.g. '2G'
+    :return: number of bytes
+    """
+    if isinstance(size, str):
+        size = size.strip().upper()
+        for suffix, multiplier in (('K', 1024), ('M', 1024 ** 2), ('G', 1024 ** 3)):
+            if size.endswith(suffix):
+                return int(float(size[:-1]) * multiplier)
+    return int(size)
+
+
+class ArtifactCache:
+    """
+    Local content-addressed cache of built artifact jars.
+
+    Each entry is a directory named by cache key (hash of source tree, maven command and arguments)
+    holding built jars. Entries are restored by hard link (copy across file systems),
+    least recently used entries are evicted when total size exceeds the limit.
+    """
+
+    default_cache_dir = '~/.tiden/mvn-cache'
+    default_cache_size = '2G'
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def restore(self, cache_key, glob_path):
+        """
+        Place cached jars into artifact directory
+        :return: True on cache hit
+        """
+        entry_dir = join(self.cache_dir, cache_key)
+        if not isdir(entry_dir):
+            return False
+        cached_files = listdir(entry_dir)
+        if not cached_files:
+            return False
+        target_dir = dirname(abspath(glob_path))
+        makedirs(target_dir, exist_ok=True)
+        for stale_jar in glob(glob_path):
+            unlink(stale_jar)
+        for file in cached_files:
+            _link_or_copy(join(entry_dir, file), join(target_dir, file))
+        # mark entry as recently used
+        utime(entry_dir)
+        return True
+
+    def store(self, cache_key, files):
+        if not files:
+            return
+        makedirs(self.cache_dir, exist_ok=True)
+        entry_dir = join(self.cache_dir, cache_key)
+        if isdir(entry_dir):
+            return
+        tmp_dir = f'{entry_dir}.tmp-{getpid()}'
+        makedirs(tmp_dir, exist_ok=True)
+        try:
+            for file in files:
+                _link_or_copy(file, join(tmp_dir, basename(file)))
+            rename(tmp_dir, entry_dir)
+        except OSError:
+            rmtree(tmp_dir, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for name in listdir(self.cache_dir):
+            entry_dir = join(self.cache_dir, name)
+            if not isdir(entry_dir) or '.tmp-' in name:
+                continue
+            size = sum(getsize(join(entry_dir, file)) for file in listdir(entry_dir))
+            entries.append((stat(entry_dir).st_mtime, size, entry_dir))
+            total_size += size
+        for _, size, entry_dir in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+
+
+def _link_or_copy(src, dst):
+    try:
+        link(src, dst)
+    except OSError:
+        copy2(src, dst)
+
+
+class MavenBuildJob:
+    """
+    Single artifact build running as maven subprocess in artifact build path
+    """
+
+    def __init__(self, artifact_name, artifact, build_path, mvn_args, threads, source_files, cache_key):
+        self.artifact_name = artifact_name
+        self.artifact = artifact
+        self.build_path = abspath(build_path)
+        self.mvn_args = mvn_args
+        self.threads = threads
+        self.source_files = source_files
+        self.cache_key = cache_key
+        self.build_log_name = None
+        self.process = None
+        self.started = None
+
+    def start(self, mvn_command):
+        # built jars may be hard links to cache entries, never let maven write into them
+        for artifact_jar in glob(self.artifact['glob_path']):
+            unlink(artifact_jar)
+        timestamp = datetime.today().strftime('%Y-%m-%d-%H-%M-%S')
+        self.build_log_name = join(self.build_path, f'maven-build-{timestamp}.log')
+        args = split(mvn_command)
+        if self.threads:
+            args.extend(['-T', str(self.threads)])
+        args.extend(split(self.mvn_args))
+        try:
+            with open(self.build_log_name, 'wb') as build_log:
+                self.process = Popen(
+                    args,
+                    cwd=self.build_path,
+                    stdin=DEVNULL,
+                    stdout=build_log,
+                    stderr=STDOUT,
+                    start_new_session=True,
+                )
+        except OSError as e:
+            raise TidenException(f"Can't start maven build of artifact '{self.artifact_name}' "
+                                 f"in {self.build_path}: {e}")
+        self.started = time()
+
+    def poll(self):
+        return self.process.poll()
+
+    def elapsed(self):
+        return time() - self.started
+
+    def progress(self):
+        last_line = ''
+        try:
+            with open(self.build_log_name, 'rb') as build_log:
+                build_log.seek(max(0, getsize(self.build_log_name) - 4096))
+                lines = build_log.read().decode('utf-8', errors='replace').strip().splitlines()
+                if lines:
+                    last_line = lines[-1].strip()[:60]
+        except OSError:
+            pass
+        return f'{self.artifact_name} {self.elapsed():.0f}s: {last_line}'
+
+    def cancel(self):
+        if self.process is not None and self.process.poll() is None:
+            try:
+                killpg(self.process.pid, SIGTERM)
+            except OSError:
+                pass
+            self.process.wait()
+
+
+class _ProgressLine:
+    """
+    Single console line rewritten in place while builds are running (only when stdout is a terminal)
+    """
+
+    def __init__(self):
+        self.enabled = stdout.isatty()
+        self.width = 0
+
+    def update(self, text):
+        if not self.enabled or not text:
+            return
+        text = text[:get_terminal_size().columns - 1]
+        stdout.write('\r' + text.ljust(self.width))
+        stdout.flush()
+        self.width = len(text)
+
+    def clear(self):
+        if self.enabled and self.width:
+            stdout.write('\r' + ' ' * self.width + '\r')
+            stdout.flush()
+            self.width = 0
+
+
 class MavenBuild(TidenPlugin):
     # pattern of file names ignored when detecting source changes
     ignore_files = r'^(\.git.*|.*\.log)$'
 
+    # build output directories, never treated as sources
+    output_dirs = ['target']
+
     mvn_command = 'mvn'
     always_rebuild = False
     save_build_log = True
 
+    # max number of artifacts built at once
+    max_parallel_builds = 2
+
+    # default maven -T option value for artifact builds, e.g. 4 or '1C', None to use maven default
+    mvn_threads = None
+
     def __init__(self, *args, **kwargs):
         TidenPlugin.__init__(self, *args, **kwargs)
         if 'mvn_cmd' in self.options:
@@ -43,7 +284,16 @@ class MavenBuild(TidenPlugin):
             self.save_build_log = bool(self.options['save_build_log'])
         if 'always_rebuild' in self.options:
             self.always_rebuild = bool(self.options['always_rebuild'])
-        self.build_log_name = ''
+        if 'max_parallel_builds' in self.options:
+            self.max_parallel_builds = max(1, int(self.options['max_parallel_builds']))
+        if 'mvn_threads' in self.options:
+            self.mvn_threads = self.options['mvn_threads']
+        self.artifact_cache = None
+        if bool(self.options.get('use_cache', True)):
+            self.artifact_cache = ArtifactCache(
+                expanduser(self.options.get('cache_dir', ArtifactCache.default_cache_dir)),
+                parse_size(self.options.get('cache_size', ArtifactCache.default_cache_size)),
+            )
 
     def before_prepare_artifacts(self, *args, **kwargs):
         """
@@ -53,72 +303,199 @@ class MavenBuild(TidenPlugin):
         """
         config = args[0]
         if 'artifacts' in config:
+            jobs = []
             for artifact_name, artifact in config['artifacts'].items():
                 if 'mvn' in artifact:
                     if 'build_path' not in artifact['mvn']:
                         raise TidenException("mvn section of artifact must have 'build_path' attribute")
                     build_path = artifact['mvn']['build_path']
-                    if self._need_rebuild(
+                    mvn_args = artifact['mvn'].get('mvn_args', '')
+                    source_filter = SourceFilter(artifact['mvn'].get('ignore_files', MavenBuild.ignore_files))
+                    if self._need_rebuild(artifact, build_path, source_filter, mvn_args):
+                        manifest = self._load_manifest(self._get_manifest_path(artifact)) or {}
+                        source_files = self._scan_sources(build_path, source_filter, manifest.get('files', {}))
+                        cache_key = None
+                        if self.artifact_cache is not None and not self._always_rebuild(artifact):
+                            cache_key = self._get_cache_key(source_files, mvn_args)
+                            if self.artifact_cache.restore(cache_key, artifact['glob_path']):
+                                log_print(f"Maven artifact '{artifact_name}' restored from cache")
+                                self._save_manifest(artifact, mvn_args, source_files)
+                                del artifact['mvn']
+                                continue
+                        jobs.append(MavenBuildJob(
+                            artifact_name,
                             artifact,
                             build_path,
-                            artifact['mvn'].get('ignore_files', MavenBuild.ignore_files)
-                    ):
-                        mvn_args = artifact['mvn'].get('mvn_args', '')
-                        if not self._build_maven_artifact(artifact_name, build_path, mvn_args):
-                            build_log = basename(self._get_maven_build_log_name())
-                            raise TidenException(f"Can't build maven artifact '{artifact_name}', "
-                                                 f"inspect build log '{build_log}' in {build_path} for errors")
-                        else:
-                            if not self.save_build_log:
-                                build_log = self._get_maven_build_log_name()
-                                unlink(build_log)
+                            mvn_args,
+                            artifact['mvn'].get('threads', self.mvn_threads),
+                            source_files,
+                            cache_key,
+                        ))
                     del artifact['mvn']
+            if jobs:
+                self._build_maven_artifacts(jobs)
 
-    def _get_maven_build_log_name(self):
-        return self.build_log_name
-
-    def _build_maven_artifact(self, artifact_name, build_path, mvn_args):
-        log_print(f"Building maven artifact '{artifact_name}' ...")
-        build_path = abspath(build_path)
-        current_directory = getcwd()
-        timestamp = datetime.today().strftime('%Y-%m-%d-%H-%M-%S')
-        self.build_log_name = join(build_path, f'maven-build-{timestamp}.log')
-        chdir(build_path)
+    def _build_maven_artifacts(self, jobs):
+        """
+        Build maven artifacts in parallel, at most max_parallel_builds at once.
+        The first failed (or failed to start) build cancels all others.
+        """
+        pending = list(jobs)
+        running = []
+        progress = _ProgressLine()
         try:
-            rc = system(' '.join([self.mvn_command, mvn_args, f' > {self.build_log_name} 2>&1 ']))
+            while pending or running:
+                while pending and len(running) < self.max_parallel_builds:
+                    job = pending.pop(0)
+                    log_print(f"Building maven artifact '{job.artifact_name}' ...")
+                    job.start(self.mvn_command)
+                    running.append(job)
+                sleep(0.5)
+                for job in list(running):
+                    rc = job.poll()
+                    if rc is None:
+                        continue
+                    running.remove(job)
+                    progress.clear()
+                    if rc != 0:
+                        raise TidenException(f"Can't build maven artifact '{job.artifact_name}', "
+                                             f"inspect build log '{basename(job.build_log_name)}' "
+                                             f"in {job.build_path} for errors")
+                    log_print(f"Maven artifact '{job.artifact_name}' built in {job.elapsed():.0f} sec")
+                    if not self.save_build_log:
+                        unlink(job.build_log_name)
+                    self._save_manifest(job.artifact, job.mvn_args, job.source_files)
+                    if job.cache_key is not None:
+                        self.artifact_cache.store(job.cache_key, glob(job.artifact['glob_path']))
+                progress.update(' | '.join(job.progress() for job in running))
         finally:
-            chdir(current_directory)
-        return rc == 0
+            progress.clear()
+            for job in running:
+                job.cancel()
 
-    def _need_rebuild(self, artifact, build_path, ignore_files):
+    def _always_rebuild(self, artifact):
         if self.always_rebuild:
             return True
-        if 'always_rebuild' in artifact['mvn'] and bool(artifact['mvn']['always_rebuild']):
+        return 'always_rebuild' in artifact['mvn'] and bool(artifact['mvn']['always_rebuild'])
+
+    def _need_rebuild(self, artifact, build_path, source_filter, mvn_args):
+        if self._always_rebuild(artifact):
             return True
         artifact_jars = glob(artifact['glob_path'])
         if not artifact_jars:
             return True
 
-        max_jar_mtime = 0
-        for artifact_jar in artifact_jars:
-            cur_jar_mtime = getmtime(artifact_jar)
-            if cur_jar_mtime > max_jar_mtime:
-                max_jar_mtime = cur_jar_mtime
+        manifest_path = self._get_manifest_path(artifact)
+        manifest = self._load_manifest(manifest_path)
+        if manifest is None or manifest.get('mvn_args') != mvn_args:
+            return True
 
-        max_mtime = 0
-        for root, dirs, files in walk(build_path):
-            if root != build_path:
-                if root.startswith(join(build_path, 'target')):
-                    continue
+        # stat every source file, hash only files whose size or mtime differs from the manifest
+        known_files = manifest['files']
+        seen_files = 0
+        manifest_changed = False
+        for rel_path, file_stat in self._walk_sources(build_path, source_filter):
+            known = known_files.get(rel_path)
+            if known is None:
+                return True
+            seen_files += 1
+            size, mtime_ns, digest = known
+            if file_stat.st_size == size and file_stat.st_mtime_ns == mtime_ns:
+                continue
+            if file_stat.st_size != size or self._hash_file(join(build_path, rel_path)) != digest:
+                return True
+            # content is the same (e.g. after git checkout), just remember new mtime
+            known[1] = file_stat.st_mtime_ns
+            manifest_changed = True
+        if seen_files != len(known_files):
+            # some sources were removed
+            return True
 
+        if manifest_changed:
+            self._write_manifest(manifest_path, manifest)
+        return False
+
+    def _walk_sources(self, build_path, source_filter):
+        """
+        :return: generator of (path relative to build_path, os.stat_result) of source files
+        """
+        build_path = abspath(build_path)
+        for root, dirs, files in walk(build_path):
+            rel_root = relpath(root, build_path)
+            if rel_root == '.':
+                rel_root = ''
+            # prune ignored directories in-place, so that walk does not descend into them
+            dirs[:] = [
+                _dir for _dir in dirs
+                if not (rel_root == '' and _dir in self.output_dirs)
+                and not source_filter.is_ignored(join(rel_root, _dir), _dir)
+            ]
             for file in files:
-                if match(ignore_files, file):
+                rel_path = join(rel_root, file)
+                if fnmatch(file, 'maven-build-*.log') or source_filter.is_ignored(rel_path, file):
                     continue
-                cur_mtime = getmtime(join(root, file))
-                if cur_mtime > max_mtime:
-                    max_mtime = cur_mtime
-                    if max_mtime > max_jar_mtime:
-                        return True
+                yield rel_path, stat(join(root, file))
 
-        return False
+    @staticmethod
+    def _hash_file(file_path):
+        digest = sha1()
+        with open(file_path, 'rb') as file:
+            while True:
+                data = file.read(1024 * 1024)
+                if not data:
+                    break
+                digest.update(data)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _get_manifest_path(artifact):
+        return join(dirname(abspath(artifact['glob_path'])), MANIFEST_FILE_NAME)
+
+    @staticmethod
+    def _load_manifest(manifest_path):
+        if not exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path) as file:
+                return load(file)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _write_manifest(manifest_path, manifest):
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            dump(manifest, file)
+        replace(tmp_path, manifest_path)
+
+    def _scan_sources(self, build_path, source_filter, known_files):
+        """
+        Collect size, mtime and content hash of all source files,
+        hashes of files with the same stat as in known_files are reused
+        :return: dict of [size, mtime_ns, sha1] by path relative to build path
+        """
+        files = {}
+        for rel_path, file_stat in self._walk_sources(build_path, source_filter):
+            known = known_files.get(rel_path)
+            if known is not None and known[0] == file_stat.st_size and known[1] == file_stat.st_mtime_ns:
+                digest = known[2]
+            else:
+                digest = self._hash_file(join(build_path, rel_path))
+            files[rel_path] = [file_stat.st_size, file_stat.st_mtime_ns, digest]
+        return files
+
+    def _get_cache_key(self, source_files, mvn_args):
+        digest = sha1()
+        for rel_path in sorted(source_files):
+            digest.update(f'{rel_path}\0{source_files[rel_path][2]}\n'.encode('utf-8'))
+        digest.update(f'{self.mvn_command}\0{mvn_args}'.encode('utf-8'))
+        return digest.hexdigest()
 
+    def _save_manifest(self, artifact, mvn_args, source_files):
+        manifest_path = self._get_manifest_path(artifact)
+        if not exists(dirname(manifest_path)):
+            return
+        self._write_manifest(manifest_path, {
+            'mvn_args': mvn_args,
+            'files': source_files,
+        })
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from tiden.tidenplugin import TidenPlugin
+from tiden.util import log_print
+from tiden import TidenException
+
+from fcntl import flock, LOCK_EX, LOCK_UN
+from glob import glob
+from hashlib import sha1
+from json import load, dump
+from os import close, fdopen, listdir, makedirs, replace, stat, unlink, utime
+from os.path import abspath, basename, dirname, exists, expanduser, join, getmtime
+from re import sub
+from shutil import copyfileobj, rmtree
+from tempfile import mkstemp
+from time import time
+from zipfile import ZipFile, ZIP_DEFLATED
+
+TIDEN_PLUGIN_VERSION = '1.0.0'
+
+# input archive hashes by size and mtime, kept in the cache directory
+HASHES_FILE_NAME = 'hashes.json'
+
+# lock file of a cache entry, held while the entry is checked and filled, parallel runs share the cache
+LOCK_FILE_NAME = '.lock'
+
+
+def normalize_repack_ops(ops):
+    """
+    :return: list of repack operations with single spaces and without duplicate slashes,
+             the order of operations is kept as it matters
+    """
+    result = []
+    for op in ops:
+        words = [sub(r'/{2,}', '/', word) for word in str(op).split()]
+        result.append(' '.join(words))
+    return result
+
+
+def _self_path(path):
+    if not path.startswith('self:'):
+        raise TidenException(f"Unsupported repack path '{path}', only 'self:' paths are supported")
+    return path[len('self:'):].lstrip('/')
+
+
+class RepackPlan:
+    """
+    Maps entries of the source archive to entries of the repacked one.
+
+    Paths are relative to the archive root folder (the single top-level folder of the archive, if any).
+    'move src dst/' moves src into dst folder, 'move src dst' renames src to dst, 'delete path' removes
+    a file or a folder (trailing slash). Operations apply in order.
+    """
+
+    def __init__(self, ops):
+        self.ops = []
+        for op in normalize_repack_ops(ops):
+            words = op.split(' ')
+            if words[0] == 'move' and len(words) == 3:
+                self.ops.append(('move', _self_path(words[1]), _self_path(words[2])))
+            elif words[0] == 'delete' and len(words) == 2:
+                self.ops.append(('delete', _self_path(words[1]), None))
+            else:
+                raise TidenException(f"Unsupported repack operation '{op}'")
+
+    def map_name(self, name):
+        """
+        :param name: entry name relative to archive root
+        :return: new entry name or None when the entry is deleted
+        """
+        for op, path, target in self.ops:
+            folder = path.rstrip('/')
+            inside = name == folder or name.startswith(folder + '/')
+            if not inside:
+                continue
+            if op == 'delete':
+                return None
+            rest = name[len(folder):]
+            if target.endswith('/') or target == '':
+                name = target + basename(folder) + rest
+            else:
+                name = target + rest
+        return name
+
+
+def repack_archive(source_path, target_path, ops, compress_level=1):
+    """
+    Stream entries of source zip into target zip applying repack operations, nothing is extracted to disk
+    :return: number of written entries
+    """
+    plan = RepackPlan(ops)
+    tmp_fd, tmp_path = mkstemp(dir=dirname(target_path), suffix='.tmp')
+    close(tmp_fd)
+    try:
+        written = _repack_entries(source_path, tmp_path, plan, compress_level)
+    except BaseException:
+        unlink(tmp_path)
+        raise
+    replace(tmp_path, target_path)
+    return written
+
+
+def _repack_entries(source_path, tmp_path, plan, compress_level):
+    written = 0
+    with ZipFile(source_path) as source:
+        entries = source.infolist()
+        top_dirs = {entry.filename.split('/', 1)[0] for entry in entries}
+        root = ''
+        if len(top_dirs) == 1 and all('/' in entry.filename for entry in entries):
+            root = top_dirs.pop() + '/'
+        with ZipFile(tmp_path, 'w', ZIP_DEFLATED, compresslevel=compress_level) as target:
+            seen = set()
+            for entry in entries:
+                name = entry.filename[len(root):]
+                new_name = plan.map_name(name)
+                if new_name is None or new_name in seen:
+                    continue
+                seen.add(new_name)
+                info = entry.__class__(root + new_name, entry.date_time)
+                info.external_attr = entry.external_attr
+                info.create_system = entry.create_system
+                info.compress_type = ZIP_DEFLATED if not entry.is_dir() else entry.compress_type
+                if entry.is_dir():
+                    target.writestr(info, b'')
+                else:
+                    info.file_size = entry.file_size
+                    with source.open(entry) as src, target.open(info, 'w', force_zip64=entry.file_size > 0x7fffffff) \
+                            as dst:
+                        copyfileobj(src, dst, 1024 * 1024)
+                written += 1
+    return written
+
+
+class RepackCache(TidenPlugin):
+    """
+    Caches repacked artifacts locally, keyed by hash of the input archive and normalized repack operations.
+
+    On cache miss the archive is repacked by streaming entries from the input zip into the new one,
+    on cache hit the artifact is pointed to the cached archive. Either way the 'repack' section is removed
+    from the artifact, so the archive is never repacked again by the default artifact preparation.
+    Artifacts with repack operations other than 'self:' move and delete are left to the default preparation.
+    """
+
+    cache_dir = '~/.tiden/repack-cache'
+
+    # number of cached repacked archives kept
+    max_entries = 5
+
+    def __init__(self, *args, **kwargs):
+        TidenPlugin.__init__(self, *args, **kwargs)
+        self.cache_dir = abspath(expanduser(self.options.get('cache_dir', self.cache_dir)))
+        self.max_entries = int(self.options.get('max_entries', self.max_entries))
+
+    def before_prepare_artifacts(self, *args, **kwargs):
+        """
+        Before prepare artifacts
+        :param args:
+                config
+        """
+        config = args[0]
+        if 'artifacts' not in config:
+            return
+        for artifact_name, artifact in config['artifacts'].items():
+            if not artifact.get('repack'):
+                continue
+            source_paths = sorted(glob(artifact['glob_path']))
+            if not source_paths or not source_paths[-1].endswith('.zip'):
+                continue
+            try:
+                RepackPlan(artifact['repack'])
+            except TidenException as e:
+                log_print(f"Repack of artifact '{artifact_name}' is not cached: {e}")
+                continue
+            source_path = source_paths[-1]
+            cache_key = self._get_cache_key(source_path, artifact['repack'])
+            entry_dir = join(self.cache_dir, cache_key)
+            cached_path = join(entry_dir, basename(source_path))
+            makedirs(entry_dir, exist_ok=True)
+            with open(join(entry_dir, LOCK_FILE_NAME), 'a') as lock_file:
+                # parallel runs missing the same entry wait for the first one to fill it
+                flock(lock_file, LOCK_EX)
+                try:
+                    if exists(cached_path):
+                        utime(entry_dir)
+                        log_print(f"Repacked artifact '{artifact_name}' restored from cache")
+                    else:
+                        started = time()
+                        # entry may have been removed by a failed run holding the lock before
+                        makedirs(entry_dir, exist_ok=True)
+                        try:
+                            entries = repack_archive(source_path, cached_path, artifact['repack'])
+                        except BaseException:
+                            rmtree(entry_dir, ignore_errors=True)
+                            raise
+                        log_print(f"Artifact '{artifact_name}' repacked ({entries} entries) "
+                                  f"in {time() - started:.1f} sec")
+                finally:
+                    flock(lock_file, LOCK_UN)
+            self._evict()
+            artifact['glob_path'] = cached_path
+            del artifact['repack']
+
+    def _get_cache_key(self, source_path, ops):
+        digest = sha1()
+        digest.update(self._hash_archive(source_path).encode('utf-8'))
+        for op in normalize_repack_ops(ops):
+            digest.update(b'\n' + op.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _hash_archive(self, source_path):
+        hashes_path = join(self.cache_dir, HASHES_FILE_NAME)
+        hashes = {}
+        if exists(hashes_path):
+            try:
+                with open(hashes_path) as file:
+                    hashes = load(file)
+            except ValueError:
+                hashes = {}
+        source_path = abspath(source_path)
+        source_stat = stat(source_path)
+        known = hashes.get(source_path)
+        if known is not None and known[0] == source_stat.st_size and known[1] == source_stat.st_mtime_ns:
+            return known[2]
+        digest = sha1()
+        with open(source_path, 'rb') as file:
+            while True:
+                data = file.read(1024 * 1024)
+                if not data:
+                    break
+                digest.update(data)
+        hashes[source_path] = [source_stat.st_size, source_stat.st_mtime_ns, digest.hexdigest()]
+        makedirs(self.cache_dir, exist_ok=True)
+        tmp_fd, tmp_path = mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with fdopen(tmp_fd, 'w') as file:
+            dump(hashes, file)
+        replace(tmp_path, hashes_path)
+        return digest.hexdigest()
+
+    def _evict(self):
+        entries = [
+            join(self.cache_dir, name) for name in listdir(self.cache_dir)
+            if name != HASHES_FILE_NAME and not name.endswith('.tmp')
+        ]
+        entries.sort(key=getmtime, reverse=True)
+        for entry in entries[self.max_entries:]:
+            rmtree(entry, ignore_errors=True)
@@ -0,0 +1,12 @@
+#!/bin/bash
+
+environment=${USER}
+if [ ! -f config/env_${environment}.yaml ]; then
+  environment=default
+fi
+
+python3 run_parallel.py \
+    --ts=examples \
+    --tc=config/env_${environment}.yaml \
+    --tc=config/artifacts-ai.yaml \
+    --clean=tests
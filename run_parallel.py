@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017-2020 GridGain Systems.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Runs test classes of a suite in parallel, each class as a separate 'tiden run-tests' process.
+
+Host needs of a test class are taken from its 'required_hosts' attribute, e.g.
+
+    class TestSomething(AppTestCase):
+        required_hosts = {'server_hosts': 2, 'client_hosts': 1}
+
+otherwise from the largest @require(min_server_nodes=...) of its tests and 'servers_per_host' of the environment
+(at least one server host). Classes based on GeneralTestCase start no nodes and share hosts with everybody.
+
+Host pool allocator gives each application class a disjoint subset of environment hosts, classes which don't fit
+into free hosts wait for running ones to finish. Every class gets its own remote home directory
+('<home>/<class name>'), so 'clean' and test directories of concurrent runs don't collide.
+
+Usage:
+
+    python3 run_parallel.py --ts=examples --tc=config/env_${USER}.yaml --tc=config/artifacts-ai.yaml --clean=tests
+"""
+
+from argparse import ArgumentParser
+from ast import parse, ClassDef, Call, Name, Attribute, Assign, literal_eval
+from datetime import datetime
+from glob import glob
+from math import ceil
+from os import path, makedirs
+from subprocess import Popen, STDOUT
+from sys import exit
+from time import time, sleep
+
+from yaml import safe_load, safe_dump
+
+# test case base classes which don't start applications at environment hosts
+GENERAL_BASE_CLASSES = ('GeneralTestCase',)
+
+HOST_KINDS = ('server_hosts', 'client_hosts')
+
+
+class TestClassInfo:
+    """
+    Test class of a suite and its host needs
+    """
+
+    def __init__(self, module, name, shared_hosts, min_server_nodes=0, required_hosts=None):
+        self.module = module
+        self.name = name
+        self.shared_hosts = shared_hosts
+        self.min_server_nodes = min_server_nodes
+        self.required_hosts = required_hosts
+
+    def host_needs(self, environment):
+        """
+        :return: dict host kind -> number of exclusive hosts
+        """
+        if self.shared_hosts:
+            return {kind: 0 for kind in HOST_KINDS}
+        if self.required_hosts is not None:
+            return {kind: int(self.required_hosts.get(kind, 0)) for kind in HOST_KINDS}
+        servers_per_host = max(1, int(environment.get('servers_per_host', 1)))
+        return {
+            'server_hosts': max(1, int(ceil(self.min_server_nodes / servers_per_host))),
+            'client_hosts': 0,
+        }
+
+    def __str__(self):
+        return f'{self.module}.{self.name}'
+
+
+def discover_test_classes(suite_dir):
+    """
+    Find test classes in suite modules without importing them
+    :return: list of TestClassInfo
+    """
+    result = []
+    for module_file in sorted(glob(path.join(suite_dir, 'test_*.py'))):
+        module = path.basename(module_file)[:-len('.py')]
+        with open(module_file, encoding='utf-8') as file:
+            tree = parse(file.read(), module_file)
+        for node in tree.body:
+            if not isinstance(node, ClassDef) or not node.name.startswith('Test'):
+                continue
+            bases = [_name_of(base) for base in node.bases]
+            result.append(TestClassInfo(
+                module,
+                node.name,
+                shared_hosts=any(base in GENERAL_BASE_CLASSES for base in bases),
+                min_server_nodes=_max_required_server_nodes(node),
+                required_hosts=_class_attribute(node, 'required_hosts'),
+            ))
+    return result
+
+
+def _name_of(node):
+    if isinstance(node, Name):
+        return node.id
+    if isinstance(node, Attribute):
+        return node.attr
+    if isinstance(node, Call):
+        return _name_of(node.func)
+    return None
+
+
+def _max_required_server_nodes(class_node):
+    result = 0
+    for item in class_node.body:
+        for decorator in getattr(item, 'decorator_list', []):
+            if isinstance(decorator, Call) and _name_of(decorator) == 'require':
+                for keyword in decorator.keywords:
+                    if keyword.arg == 'min_server_nodes':
+                        result = max(result, int(literal_eval(keyword.value)))
+    return result
+
+
+def _class_attribute(class_node, name):
+    for item in class_node.body:
+        if isinstance(item, Assign) and any(_name_of(target) == name for target in item.targets):
+            return literal_eval(item.value)
+    return None
+
+
+class HostPool:
+    """
+    Allocates disjoint subsets of environment hosts. A host listed both as server and client host
+    is busy for both kinds once allocated.
+    """
+
+    def __init__(self, environment):
+        self.hosts = {kind: list(environment.get(kind) or []) for kind in HOST_KINDS}
+        self.busy = set()
+
+    def fits_ever(self, needs):
+        return all(needs[kind] <= len(self.hosts[kind]) for kind in HOST_KINDS)
+
+    def acquire(self, needs):
+        """
+        :return: dict host kind -> list of hosts or None when there are not enough free hosts
+        """
+        allocated = {}
+        taken = set()
+        for kind in HOST_KINDS:
+            free = [host for host in self.hosts[kind] if host not in self.busy and host not in taken]
+            if len(free) < needs[kind]:
+                return None
+            allocated[kind] = free[:needs[kind]]
+            taken.update(allocated[kind])
+        self.busy.update(taken)
+        return allocated
+
+    def release(self, allocated):
+        for hosts in allocated.values():
+            self.busy.difference_update(hosts)
+
+
+def merge_configs(config_files):
+    result = {}
+    for config_file in config_files:
+        with open(config_file, encoding='utf-8') as file:
+            _deep_update(result, safe_load(file) or {})
+    return result
+
+
+def _deep_update(target, source):
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _deep_update(target[key], value)
+        else:
+            target[key] = value
+
+
+class ParallelRun:
+    """
+    Single test class run
+    """
+
+    def __init__(self, suite, test_class, allocated, environment, work_dir, tiden_args):
+        self.test_class = test_class
+        self.allocated = allocated
+        self.config_file = path.join(work_dir, f'{test_class.name}.yaml')
+        self.log_file = path.join(work_dir, f'{test_class.name}.log')
+
+        overrides = {'home': path.join(environment['home'], test_class.name)}
+        if not test_class.shared_hosts:
+            overrides.update(allocated)
+        with open(self.config_file, 'w', encoding='utf-8') as file:
+            safe_dump({'environment': overrides}, file, default_flow_style=False)
+
+        self.command = ['tiden', 'run-tests', f'--ts={suite}.{test_class.module}.{test_class.name}']
+        self.command.extend(tiden_args)
+        self.command.append(f'--tc={self.config_file}')
+        self.process = None
+        self.started = None
+        self.elapsed = None
+
+    def start(self):
+        self.started = time()
+        with open(self.log_file, 'wb') as log:
+            self.process = Popen(self.command, stdout=log, stderr=STDOUT)
+        return self
+
+    def poll(self):
+        result = self.process.poll()
+        if result is not None and self.elapsed is None:
+            self.elapsed = time() - self.started
+        return result
+
+
+def schedule(suite, test_classes, environment, work_dir, tiden_args, max_parallel=None, poll_interval=1.0):
+    """
+    Run test classes in parallel on disjoint host subsets
+    :return: dict test class name -> tiden exit code
+    """
+    pool = HostPool(environment)
+    pending = sorted(test_classes, key=lambda test_class: -sum(test_class.host_needs(environment).values()))
+    running = []
+    results = {}
+    while pending or running:
+        for test_class in list(pending):
+            if max_parallel and len(running) >= max_parallel:
+                break
+            needs = test_class.host_needs(environment)
+            if not pool.fits_ever(needs):
+                # class needs more hosts than environment has: let it run alone on all hosts
+                if running:
+                    continue
+                needs = {kind: len(pool.hosts[kind]) for kind in HOST_KINDS}
+            allocated = pool.acquire(needs)
+            if allocated is None:
+                continue
+            pending.remove(test_class)
+            run = ParallelRun(suite, test_class, allocated, environment, work_dir, tiden_args).start()
+            hosts = ', '.join(f'{kind}: {hosts}' for kind, hosts in allocated.items() if hosts) or 'shared hosts'
+            print(f'[{_now()}] started {test_class} ({hosts}), log: {run.log_file}', flush=True)
+            running.append(run)
+
+        sleep(poll_interval)
+        for run in list(running):
+            exit_code = run.poll()
+            if exit_code is None:
+                continue
+            running.remove(run)
+            pool.release(run.allocated)
+            results[run.test_class.name] = exit_code
+            status = 'passed' if exit_code == 0 else f'failed with exit code {exit_code}'
+            print(f'[{_now()}] {run.test_class} {status} in {run.elapsed:.0f} seconds', flush=True)
+    return results
+
+
+def _now():
+    return datetime.now().strftime('%H:%M:%S')
+
+
+def main():
+    parser = ArgumentParser(description='Run test classes of a suite in parallel on disjoint host subsets')
+    parser.add_argument('--ts', required=True, help='test suite, e.g. examples')
+    parser.add_argument('--tc', action='append', default=[], help='config file, can be repeated')
+    parser.add_argument('--max-parallel', type=int, default=None, help='max number of concurrent test classes')
+    parser.add_argument('--suites-dir', default='suites')
+    parser.add_argument('--work-dir', default='work/parallel')
+    args, tiden_args = parser.parse_known_args()
+
+    environment = merge_configs(args.tc).get('environment', {})
+    if not environment.get('home'):
+        exit('environment.home is not set')
+    test_classes = discover_test_classes(path.join(args.suites_dir, args.ts))
+    if not test_classes:
+        exit(f'No test classes found in suite {args.ts}')
+
+    work_dir = path.join(args.work_dir, f'{args.ts}-{datetime.now().strftime("%Y%m%d-%H%M%S")}')
+    makedirs(work_dir, exist_ok=True)
+    started = time()
+    results = schedule(args.ts, test_classes, environment, work_dir,
+                       [f'--tc={config_file}' for config_file in args.tc] + tiden_args,
+                       max_parallel=args.max_parallel)
+    failed = sorted(name for name, exit_code in results.items() if exit_code != 0)
+    print(f'[{_now()}] {len(results)} test classes run in {time() - started:.0f} seconds, '
+          f'{len(failed)} failed{": " + ", ".join(failed) if failed else ""}')
+    exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
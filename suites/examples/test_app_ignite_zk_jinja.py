@@ -14,11 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from time import sleep
+from os import path
 from tiden.apps.ignite import Ignite
 from tiden.case.apptestcase import AppTestCase
 from tiden.util import log_print, require, attr
 
+from apps.configcache import CachedConfigBuilder
+from apps.ignitemetrics import wait_for_cluster_ready
+
 
 class TestAppIgniteZkJinja(AppTestCase):
 
@@ -43,7 +46,7 @@ class TestAppIgniteZkJinja(AppTestCase):
         ))
         ignite_app.start_nodes()
         ignite_app.cu.activate()
-        sleep(10)
+        wait_for_cluster_ready(ignite_app)
         ignite_app.cu.deactivate()
         ignite_app.stop_nodes()
 
@@ -234,18 +237,52 @@ class TestAppIgniteZkJinja(AppTestCase):
         ))
         ignite_app.start_nodes()
         ignite_app.cu.activate()
-        sleep(10)
+        wait_for_cluster_ready(ignite_app, caches=[])
 
         # Verify that there is no caches in cluster
         assert len(ignite_app.get_cache_names()) == 0, "There is some caches on cluster"
 
-        sleep(10)
-
         ignite_app.cu.deactivate()
         ignite_app.stop_nodes()
 
         self.remove_app_config_set(Ignite, 'tcp-disabled-caches')
 
+    @require(min_server_nodes=2)
+    def test_start_grid_cached_configs(self):
+        # Render configs with exclusive consistent id of every node through the render cache,
+        # only new or changed config files are sent to hosts
+        ignite_app = self.get_app_by_type('ignite')[0]
+        builder = CachedConfigBuilder(
+            self.ssh.clients,
+            path.join(path.dirname(path.abspath(__file__)), 'res', 'app_ignite_zk_jinja'),
+            self.config['rt']['remote']['test_module_dir'],
+            base_variables={'environment': self.tiden.config.get('environment', {})},
+            cache_dir=self.tiden.config.get('config_cache_dir'),
+        )
+        builder.register_config('server', 'server.tmpl.xml')
+        builder.add_config_set('tcp', zookeeper_enabled=False)
+        for node_idx, node in ignite_app.nodes.items():
+            builder.add_template_variables(
+                'tcp',
+                node_id=node_idx,
+                consistent_id=node['template_variables']['consistent_id']
+            )
+
+        server_nodes = {node_idx: ignite_app.nodes[node_idx] for node_idx in ignite_app.get_all_default_nodes()}
+        for attempt in range(2):
+            configs = builder.build_and_deploy('tcp', 'server', server_nodes)
+            log_print(f"Configs built: {builder.render_cache.hits} cached, {builder.render_cache.misses} rendered; "
+                      f"files deployed: {builder.deployer.sent_files} sent ({builder.deployer.sent_bytes} bytes), "
+                      f"{builder.deployer.skipped_files} unchanged")
+
+        # second build must neither render nor send anything
+        assert builder.render_cache.hits >= len(server_nodes), "Configs were rendered again"
+        assert builder.deployer.skipped_files >= len(server_nodes), "Unchanged configs were sent again"
+
+        for node_idx, config in configs.items():
+            ignite_app.set_node_option(node_idx, 'config', config)
+        self.run_ignite_grid()
+
     def teardown(self):
         super().teardown()
 
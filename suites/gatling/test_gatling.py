@@ -14,16 +14,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from apps.gatling import Gatling
+from apps.gatling import Gatling, SLO
+from apps.gatling.injection import ramp_then_hold
+from apps.gatling.result_store import ResultStore
+from apps.gatling.simulation_builder import SimulationSpec, HttpRequest, Feeder
+from apps.ignitemetrics import RestMetricsSampler, WarmCluster
+from apps.jvmlog import JvmPauseReport, parse_jvm_logs
+from apps.stackprofile import StackProfile, read_flamegraph_svg, render_flamegraph
 from tiden.apps.ignite import Ignite
 from tiden.apps.profiler import Profiler
 from tiden.case.apptestcase import AppTestCase
 from tiden.util import log_print, with_setup
+from json import dump
 from os import path, makedirs
 
 
 class TestGatling (AppTestCase):
 
+    # benchmark results are kept outside of test directory, which is wiped by --clean=tests
+    default_benchmark_store = './work/benchmarks.sqlite'
+    default_profile_baselines_dir = './work/profiles'
+
     ignite_app: Ignite = property(lambda self: self.get_app('ignite'), None)
     gatling_app: Gatling = property(lambda self: self.get_app('gatling'), None)
     profiler_app: Profiler = property(lambda self: self.get_app('profiler'), None)
@@ -34,6 +45,7 @@ class TestGatling (AppTestCase):
         self.add_app('ignite')
         if self.has_profiler():
             self.add_app('profiler', profiler='async_flamegraph')
+        self.warm_cluster = None
 
     def setup(self):
         self.create_app_config_set(
@@ -47,12 +59,24 @@ class TestGatling (AppTestCase):
         self.ignite_app.set_node_option(
             '*', 'config', Ignite.config_builder.get_config('server')
         )
-        self.ignite_app.start_nodes()
-        self.ignite_app.cu.activate()
+        if self.reuse_cluster():
+            # keep grid running between tests while its configuration is the same
+            if self.warm_cluster is None:
+                self.warm_cluster = WarmCluster(self.ignite_app, self.config['rt']['remote']['test_module_dir'])
+            self.warm_cluster.acquire()
+        else:
+            self.ignite_app.start_nodes()
+            self.ignite_app.cu.activate()
 
     def teardown_test(self):
         self.gatling_app.stop(wait=False)
-        self.ignite_app.stop_nodes(force=True)
+        if not self.reuse_cluster():
+            self.ignite_app.stop_nodes(force=True)
+
+    def teardown(self):
+        if self.warm_cluster is not None:
+            self.warm_cluster.stop()
+        super().teardown()
 
     @with_setup(setup_test, teardown_test)
     def test_run_gatling_test(self):
@@ -63,47 +87,329 @@ class TestGatling (AppTestCase):
         warmup = 60
         cooldown = 10
 
-        rest_port = self.ignite_app.nodes[1]['rest_port']
-        rest_host = self.ignite_app.nodes[1]['host']
-        load_url = f"http://{rest_host}:{rest_port}/ignite?cmd=top"
+        load_url = self.get_load_url()
 
         if self.has_profiler():
             log_print(f"Start profiling Ignite nodes")
             self.profiler_app.update_options(nodes=self.ignite_app.nodes, warmup=warmup, duration=duration-cooldown)
             self.profiler_app.start()
 
+        metrics_sampler = self.start_metrics_sampler()
+
         log_print(f"Starting HTTP Load -> {load_url}")
+        try:
+            self.gatling_app.start(
+                scenario="perftest.HttpLoadScenario",
+                scenario_args={
+                    "base_url": load_url,
+                    "duration": duration + warmup,
+                    "load_factor": 100,             # virtual users per node, total of all nodes when distributed
+                    "load_throttle": 2,             # delay between requests
+                    "page_name": "Cluster topology"
+                },
+                slo=self.get_slo(grace_period=warmup),
+                distributed=self.distributed_load(),
+                host_sizing=self.tiden.config.get('gatling_host_sizing', False),
+                aggregate=self.tiden.config.get('gatling_aggregate', False),
+            )
+            self.gatling_app.wait_scenario_completed(
+                timeout=duration + warmup + cooldown + Gatling.default_barrier_delay
+            )
+        finally:
+            metrics_sampler.stop()
+        log_print(f'Ignite metrics: file:///{metrics_sampler.file_path}, sampler overhead: '
+                  f'{metrics_sampler.overhead_line()}')
+        assert self.gatling_app.slo_violation is None, f'SLO violated: {self.gatling_app.slo_violation}'
+        if self.gatling_app.generator_monitor is not None:
+            for line in self.gatling_app.generator_monitor.to_lines():
+                log_print(f'Gatling {line}')
+        generator_saturation = self.gatling_app.generator_saturation or {}
+        for node_idx, reason in generator_saturation.items():
+            log_print(f'Gatling node {node_idx} saturated, results are not valid: {reason}', color='red')
+
+        simulation_results = self.gatling_app.fetch_simulation_results(stream=True)
+        self.gatling_app.merge_simulation_results(simulation_results)
+        simulation_report = self.gatling_app.generate_report(simulation_results, html=True, per_second=True)
+        jvm_pauses = self.collect_jvm_pauses()
+        for simulation_name, simulation_stats in simulation_report.items():
+            log_print(f'Simulation \'{simulation_name}\' statistics', color='green')
+            for line in simulation_stats.to_lines():
+                log_print(line, color='green')
+            log_print(f'Detailed report: file:///{self.gatling_app.test_dir}/results/{simulation_name}/index.html')
+            self.save_benchmark_results('test_run_gatling_test', simulation_stats, valid=not generator_saturation)
+            self.report_jvm_pauses(jvm_pauses, simulation_name, simulation_stats)
+
+        if self.has_profiler():
+            local_dir = path.join(self.profiler_app.test_dir, 'profile')
+            makedirs(local_dir, exist_ok=True)
+            local_profiling_files = []
+            # profiler output is written next to node logs, in the directory of the test which started the grid
+            ignite_test_dir = self.get_ignite_test_dir()
+            for mask in ('*.svg', '*.collapsed'):
+                profiling_files = self.tiden.ssh.ls(
+                    hosts=self.ignite_app.get_hosts('server'),
+                    dir_path=ignite_test_dir + '/' + mask,
+                    params='-1'
+                )
+                local_profiling_files.extend(self.tiden.ssh.download(profiling_files, local_dir))
+            if ignite_test_dir != self.ignite_app.remote_test_dir:
+                # reused grid: profiles of this test must not be merged again by the next one
+                for host in self.ignite_app.get_hosts('server'):
+                    self.tiden.ssh.exec_on_host(host, [f'rm -f {ignite_test_dir}/*.svg {ignite_test_dir}/*.collapsed'])
+            for file in local_profiling_files:
+                log_print(f'Flamegraph: file:///{file}')
+            self.merge_profiles(local_profiling_files, local_dir)
+
+    @with_setup(setup_test, teardown_test)
+    def test_find_capacity(self):
+        """
+        Start Ignite, find max sustainable throughput of REST endpoint: each step ramps open model arrival rate
+        up to the step load and holds it, only the hold part is measured
+        """
+        result = self.gatling_app.find_capacity(
+            scenario="perftest.HttpLoadScenario",
+            scenario_args={
+                "base_url": self.get_load_url(),
+                "page_name": "Cluster topology"
+            },
+            start=100,                              # total requests per second
+            ramp_seconds=10,
+            hold_seconds=60,
+            max_steps=8,
+            max_p99=500,
+            distributed=True,
+        )
+        assert result.best is not None, 'Cluster is saturated even with the initial load'
+
+    @with_setup(setup_test, teardown_test)
+    def test_constant_rate(self):
+        """
+        Start Ignite, put open model load with fixed request rate onto REST endpoint
+        """
+        rate = 200
+        ramp = 10
+        hold = 60
         self.gatling_app.start(
             scenario="perftest.HttpLoadScenario",
             scenario_args={
-                "base_url": load_url,
-                "duration": duration + warmup,
-                "load_factor": 100,                 # number of virtual users
-                "load_throttle": 2,                 # delay between requests
+                "base_url": self.get_load_url(),
+                "injection": ramp_then_hold(rate, ramp_seconds=ramp, hold_seconds=hold),  # total requests per second
                 "page_name": "Cluster topology"
             },
+            distributed=True,
         )
-        self.gatling_app.wait_scenario_completed(timeout=duration + warmup + cooldown)
+        self.gatling_app.wait_scenario_completed(timeout=ramp + hold + 30 + Gatling.default_barrier_delay)
 
-        simulation_results = self.gatling_app.fetch_simulation_results()
-        simulation_report = self.gatling_app.generate_report(simulation_results)
+        simulation_results = self.gatling_app.fetch_simulation_results(stream=True)
+        self.gatling_app.merge_simulation_results(simulation_results)
+        simulation_report = self.gatling_app.generate_report(simulation_results, skip_seconds=ramp)
         for simulation_name, simulation_stats in simulation_report.items():
-            log_print(f'Simulation \'{simulation_name}\' statistics', color='green')
-            for line in simulation_stats:
+            for line in simulation_stats.to_lines():
                 log_print(line, color='green')
-            log_print(f'Detailed report: file:///{self.gatling_app.test_dir}/results/{simulation_name}/index.html')
+            _, ok_rps, _ = simulation_stats.total.throughput(simulation_stats.duration_ms)
+            assert ok_rps >= 0.9 * rate, f'Request rate {ok_rps:.1f} req/s is below target {rate} req/s'
+            self.save_benchmark_results('test_constant_rate', simulation_stats)
 
-        if self.has_profiler():
-            profiling_files = self.tiden.ssh.ls(
+    @with_setup(setup_test, teardown_test)
+    def test_generated_simulation(self):
+        """
+        Start Ignite, put load declared in Python onto REST endpoints
+        """
+        duration = 60
+        simulation = SimulationSpec(
+            'IgniteRestMix',
+            requests=[
+                HttpRequest('Cluster topology', '?cmd=top', checks=['jsonPath("$.successStatus").is("0")']),
+                HttpRequest('Node metrics', '?cmd=node&mtr=true&id=${node_id}'),
+            ],
+            feeder=Feeder(records=[{'node_id': ''}]),
+        )
+        self.gatling_app.start(
+            scenario=simulation,
+            scenario_args={
+                "base_url": self.get_load_url().split('?')[0],
+                "injection": ramp_then_hold(100, ramp_seconds=10, hold_seconds=duration),
+            },
+            distributed=True,
+        )
+        self.gatling_app.wait_scenario_completed(timeout=duration + 40 + Gatling.default_barrier_delay)
+
+        simulation_results = self.gatling_app.fetch_simulation_results(stream=True)
+        self.gatling_app.merge_simulation_results(simulation_results)
+        for simulation_name, simulation_stats in self.gatling_app.generate_report(simulation_results).items():
+            for line in simulation_stats.to_lines():
+                log_print(line, color='green')
+            assert simulation_stats.total.error_rate < 0.01, 'Too many failed requests'
+
+    def save_benchmark_results(self, benchmark_name, simulation_stats, valid=True):
+        """
+        Save simulation statistics to persistent benchmark store and compare them with baseline,
+        when 'benchmark_baseline' is configured, 'save_benchmark_baseline' makes the run new baseline.
+        Baselines are kept per benchmark name. Invalid runs (saturated load generator) are saved
+        with valid=False tag, not compared and never become baselines.
+        """
+        store = ResultStore(self.tiden.config.get('benchmark_store', self.default_benchmark_store))
+        try:
+            artifact_cfg = self.tiden.config['artifacts'][self.ignite_app.name]
+            environment = self.tiden.config['environment']
+            run_id = store.save_run(benchmark_name, simulation_stats, {
+                'ignite_version': artifact_cfg.get('ignite_version'),
+                'ignite_revision': artifact_cfg.get('ignite_revision'),
+                'server_jvm_options': environment.get('server_jvm_options'),
+                'server_hosts': environment.get('server_hosts'),
+                'servers_per_host': environment.get('servers_per_host'),
+                'client_hosts': environment.get('client_hosts'),
+                'clients_per_host': environment.get('clients_per_host'),
+                'gatling_jvm_options': {
+                    str(node_idx): self.gatling_app.get_node_jvm_options(node_idx)
+                    for node_idx in sorted(self.gatling_app.nodes)
+                },
+                'valid': valid,
+            })
+            log_print(f'Benchmark results saved as run {run_id} to {store.db_path}')
+            baseline = self.tiden.config.get('benchmark_baseline')
+            if valid and baseline and store.get_baseline_run_id(f'{benchmark_name}:{baseline}') is not None:
+                regressions = store.compare(run_id, f'{benchmark_name}:{baseline}')
+                for regression in regressions:
+                    log_print(f'Regression against baseline \'{baseline}\': {regression}', color='red')
+                if not regressions:
+                    log_print(f'No regressions against baseline \'{baseline}\'', color='green')
+            save_baseline = self.tiden.config.get('save_benchmark_baseline')
+            if save_baseline:
+                if valid:
+                    store.set_baseline(f'{benchmark_name}:{save_baseline}', run_id)
+                    log_print(f'Run {run_id} saved as baseline \'{save_baseline}\' of {benchmark_name}')
+                else:
+                    log_print(f'Run {run_id} is not valid, baseline \'{save_baseline}\' is not saved', color='red')
+        finally:
+            store.close()
+
+    def start_metrics_sampler(self):
+        """
+        Start sampling metrics of Ignite server nodes over REST,
+        caches to sample sizes of are set by 'metrics_caches' config option
+        """
+        endpoints = [
+            (node['host'], node['rest_port'])
+            for node_idx, node in self.ignite_app.nodes.items()
+            if node_idx in self.ignite_app.get_all_default_nodes() and node.get('rest_port')
+        ]
+        makedirs(self.gatling_app.test_dir, exist_ok=True)
+        return RestMetricsSampler(
+            endpoints,
+            path.join(self.gatling_app.test_dir, 'ignite_metrics.bin'),
+            interval=self.tiden.config.get('metrics_interval', 1.0),
+            caches=self.tiden.config.get('metrics_caches'),
+        ).start()
+
+    def collect_jvm_pauses(self):
+        """
+        Download GC and safepoint logs of Ignite server nodes and parse them
+        :return: dict node name -> NodePauses
+        """
+        local_dir = path.join(self.gatling_app.test_dir, 'jvm_logs')
+        makedirs(local_dir, exist_ok=True)
+        local_files = []
+        for mask in ('grid.*.gc.*.log', 'grid.*.safepoint.*.log'):
+            remote_files = self.tiden.ssh.ls(
                 hosts=self.ignite_app.get_hosts('server'),
-                dir_path=self.ignite_app.remote_test_dir + '/*.svg',
+                dir_path=self.get_ignite_test_dir() + '/' + mask,
                 params='-1'
             )
-            local_dir = path.join(self.profiler_app.test_dir, 'profile')
-            makedirs(local_dir, exist_ok=True)
-            local_profiling_files = self.tiden.ssh.download(profiling_files, local_dir)
-            for file in local_profiling_files:
-                log_print(f'Flamegraph: file:///{file}')
+            local_files.extend(self.tiden.ssh.download(remote_files, local_dir))
+        return parse_jvm_logs(local_files)
+
+    def report_jvm_pauses(self, jvm_pauses, simulation_name, simulation_stats):
+        """
+        Print GC and safepoint pause statistics of Ignite nodes and latency spikes overlapping the pauses,
+        report is also saved next to the simulation results
+        """
+        if not jvm_pauses:
+            return
+        # logs of a reused grid hold pauses of earlier tests too, only the simulation time window is reported
+        run_start = simulation_stats.run_start
+        if run_start is None:
+            run_start = simulation_stats.total.first_start
+        run_end = simulation_stats.run_end + 1 if simulation_stats.run_end is not None else None
+        report = JvmPauseReport(jvm_pauses, simulation_stats.per_second, start_ms=run_start, end_ms=run_end)
+        report_dir = path.join(self.gatling_app.test_dir, 'results', simulation_name)
+        with open(path.join(report_dir, 'jvm_pauses.json'), 'w') as file:
+            dump(report.as_dict(), file, indent=2)
+        lines = report.to_lines()
+        with open(path.join(report_dir, 'jvm_pauses.txt'), 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        log_print(f'JVM pauses during simulation \'{simulation_name}\'', color='green')
+        for line in lines:
+            log_print(line, color='green')
+
+    def merge_profiles(self, profiling_files, local_dir):
+        """
+        Merge profiles of all Ignite nodes into single stack profile, print hot frames and
+        render differential flamegraph against 'profile_baseline' when configured.
+        Collapsed stacks of a node are preferred, its SVG flamegraph is only read when there are none.
+        """
+        collapsed = set(path.splitext(file)[0] for file in profiling_files if file.endswith('.collapsed'))
+        profile = StackProfile()
+        for file in profiling_files:
+            if file.endswith('.collapsed'):
+                profile.read_collapsed(file)
+            elif file.endswith('.svg') and path.splitext(file)[0] not in collapsed:
+                profile.merge(read_flamegraph_svg(file))
+        if not profile.total:
+            return
+        profile.write_collapsed(path.join(local_dir, 'merged.collapsed'))
+        render_flamegraph(profile, path.join(local_dir, 'merged.svg'), title='Ignite nodes (merged)')
+        log_print(f'Merged flamegraph: file:///{path.join(local_dir, "merged.svg")}')
+        for by in ('self', 'total'):
+            log_print(f'Hot frames by {by} samples:', color='green')
+            for line in profile.top_frames_lines(limit=20, by=by):
+                log_print(line, color='green')
+
+        baselines_dir = self.tiden.config.get('profile_baselines_dir', self.default_profile_baselines_dir)
+        baseline_name = self.tiden.config.get('profile_baseline')
+        if baseline_name and path.isfile(path.join(baselines_dir, f'{baseline_name}.collapsed')):
+            baseline = StackProfile().read_collapsed(path.join(baselines_dir, f'{baseline_name}.collapsed'))
+            diff_file = path.join(local_dir, f'diff-{baseline_name}.svg')
+            render_flamegraph(profile, diff_file, title=f'Ignite nodes vs {baseline_name}', baseline=baseline)
+            log_print(f'Differential flamegraph: file:///{diff_file}')
+        save_baseline_name = self.tiden.config.get('save_profile_baseline')
+        if save_baseline_name:
+            makedirs(baselines_dir, exist_ok=True)
+            profile.write_collapsed(path.join(baselines_dir, f'{save_baseline_name}.collapsed'))
+
+    def get_load_url(self):
+        rest_port = self.ignite_app.nodes[1]['rest_port']
+        rest_host = self.ignite_app.nodes[1]['host']
+        return f"http://{rest_host}:{rest_port}/ignite?cmd=top"
+
+    def reuse_cluster(self):
+        return self.tiden.config.get('reuse_cluster', False)
+
+    def distributed_load(self):
+        """
+        :return: True when scenario load of the baseline test is split between Gatling nodes which start
+                 injection together, otherwise every node applies the whole load on its own
+        """
+        return self.tiden.config.get('gatling_distributed', False)
+
+    def get_slo(self, grace_period=0):
+        """
+        :return: SLO which stops the load as soon as error rate exceeds 'gatling_slo_max_error_rate',
+                 None (run to completion) when it is not configured
+        """
+        max_error_rate = self.tiden.config.get('gatling_slo_max_error_rate')
+        if max_error_rate is None:
+            return None
+        return SLO(max_error_rate=float(max_error_rate), grace_period=grace_period)
+
+    def get_ignite_test_dir(self):
+        """
+        :return: remote test directory of running Ignite nodes, reused grid keeps logs in the directory
+                 of the test which started it
+        """
+        if self.warm_cluster is not None and self.warm_cluster.running:
+            return self.warm_cluster.test_dir
+        return self.ignite_app.remote_test_dir
 
     def has_profiler(self):
         return 'flamegraph' in self.tiden.config['artifacts']
@@ -1,6 +1,7 @@
 package perftest
 
 import io.gatling.core.Predef._
+import io.gatling.core.controller.inject.open.OpenInjectionStep
 import io.gatling.http.Predef._
 import io.gatling.http.protocol.HttpProtocolBuilder
 
@@ -13,6 +14,12 @@ class HttpLoadScenario extends Simulation {
   var load_factor = Integer.getInteger("load_factor", 1)
   var load_throttle = Integer.getInteger("load_throttle", 10)
   var page_name = System.getProperty("page_name", "Root page")
+  // common injection start time (epoch millis) of all distributed load generators
+  val start_at = java.lang.Long.getLong("start_at", 0L)
+  val start_delay = math.max(0L, start_at - System.currentTimeMillis())
+  // open model injection profile, comma separated phases (see apps/gatling/injection.py),
+  // closed model (load_factor users with load_throttle pace) is used when empty
+  val injection = System.getProperty("injection", "")
 
   val httpProtocol: HttpProtocolBuilder = http
     .baseUrl(base_url)
@@ -40,14 +47,37 @@ class HttpLoadScenario extends Simulation {
          .exec(BasicLoad.start)
     )
 
+  // every user sends single request, so arrival rate is request rate
+  val openLoad = scenario("Http open load scenario")
+    .exec(BasicLoad.start)
+
+  def phaseDuration(value: String): FiniteDuration = (value.toDouble * 1000).toLong milliseconds
+
+  def injectionSteps(profile: String): Seq[OpenInjectionStep] =
+    profile.split(",").toSeq.filter(_.nonEmpty).map(_.split(":") match {
+      case Array("constant", rate, during) => constantUsersPerSec(rate.toDouble).during(phaseDuration(during))
+      case Array("ramp", from, to, during) => rampUsersPerSec(from.toDouble).to(to.toDouble).during(phaseDuration(during))
+      case Array("nothing", during) => nothingFor(phaseDuration(during))
+      case Array("once", users) => atOnceUsers(users.toInt)
+      case phase => throw new IllegalArgumentException("Unknown injection phase: " + phase.mkString(":"))
+    })
+
+  val population =
+    if (injection.isEmpty)
+      basicLoad
+        .inject(
+          nothingFor(start_delay milliseconds),
+          rampUsers(load_factor)
+            .during(duration seconds)
+        )
+    else
+      openLoad
+        .inject(nothingFor(start_delay milliseconds) +: injectionSteps(injection))
+
   setUp(
-    basicLoad
-      .inject(
-        rampUsers(load_factor)
-          .during(duration seconds)
-      )
+    population
       .protocols(httpProtocol)
   )
-    .maxDuration((duration + 5) seconds)
+    .maxDuration(((duration + 5) seconds) + (start_delay milliseconds))
 }
 